@@ -1,74 +1,218 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
-from sklearn.ensemble import IsolationForest
-from sklearn.linear_model import LogisticRegression
-from sklearn.model_selection import train_test_split
-import plotly.express as px
-from statsmodels.tsa.arima.model import ARIMA
-import os
 import warnings
 warnings.filterwarnings("ignore")
 
 # Optional: For NLG summaries (template-based)
 import random
 
-sns.set_theme(style="whitegrid")
+from data_loader import list_venues, load_venue_sample, venue_data_signature, venue_row_count
+from model_registry import get_registry
+from segmentation import SAMPLE_PER_CLUSTER, STREAMING_MIN_ROWS, segment_venue
+from chart_data import downsample_scatter, paged_dataframe
+from features import add_features, load_venue_features
+from metrics import timed, track
+from visitor_index import index_for_frame
 
-def load_business_data(business_type):
-    current_dir = os.path.dirname(__file__)
-    data_dir = os.path.join(current_dir, "connection_logs")
-    file_name = f"{business_type}.csv"
-    file_path = os.path.join(data_dir, file_name)
+# Columns used by the AI pipeline below; other log columns are never read
+AI_COLUMNS = [
+    "device_id", "timestamp", "device_type", "zone", "session_duration_minutes", "duration",
+    "frequent_visitor", "signal_strength_dBm", "data_used_MB",
+]
+
+# Venues at or above STREAMING_MIN_ROWS are never loaded whole: clustering
+# streams them, and the other models get a uniform sample of this many rows
+SAMPLE_ROWS = 200_000
+
+def load_model_frame(business_type, columns=AI_COLUMNS):
+    """(featured frame, sessions in the venue); a uniform sample at or above STREAMING_MIN_ROWS.
+
+    The path is picked from the row count in storage metadata, before anything is loaded.
+    """
+    total = venue_row_count(business_type)
+    if total >= STREAMING_MIN_ROWS:
+        return add_features(load_venue_sample(business_type, SAMPLE_ROWS, columns), business_type), total
+    return load_venue_features(business_type, columns=columns), total
+
+def streaming_segmentation(business_type, features, n_clusters):
+    # Mini-batch KMeans over the venue files, cached in the model registry
+    return segment_venue(
+        business_type, features, n_clusters, lambda chunk: preprocess_data(chunk, business_type), columns=AI_COLUMNS,
+        data_fingerprint=str(venue_data_signature(business_type)),
+    )
+
+def load_business_data(business_type, columns=AI_COLUMNS):
+    # Returns (df, sessions in the venue); see load_model_frame
     try:
-        df = pd.read_csv(file_path)
+        with track("load", venue=business_type) as t:
+            df, total = load_model_frame(business_type, columns)
+            t.rows = len(df)
         st.success(f"Loaded {len(df)} records from {business_type} dataset.")
+        return df, total
+    except Exception as e:
+        st.error(f"Error loading data: {e}")
+        return pd.DataFrame(), 0
+
+def load_database_data(location, start=None, end=None):
+    # Sessions from wifi_logs, streamed in chunks and mapped onto the connection_logs columns
+    from query_layer import get_query_layer
+
+    try:
+        with track("load", venue=location, source="database") as t:
+            df = add_features(get_query_layer().load_sessions(location, start, end))
+            t.rows = len(df)
+        st.success(f"Loaded {len(df)} records for {location} from wifi_logs.")
         return df
     except Exception as e:
         st.error(f"Error loading data: {e}")
         return pd.DataFrame()
 
-def preprocess_data(df):
-    # Rename for consistency
-    if 'session_duration_minutes' in df.columns and 'duration' not in df.columns:
-        df.rename(columns={'session_duration_minutes': 'duration'}, inplace=True)
-    if 'timestamp' in df.columns:
-        df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-        df['hour_of_day'] = df['timestamp'].dt.hour
-        df['day_of_week'] = df['timestamp'].dt.dayofweek
-        df['is_weekend'] = df['day_of_week'].apply(lambda x: 1 if x >= 5 else 0)
-    if 'frequent_visitor' in df.columns:
-        df['frequent_visitor'] = (
-            df['frequent_visitor'].astype(str).str.lower().map({'yes': 1, 'true': 1, 'no': 0, 'false': 0}).fillna(0).astype(int)
-        )
-    else:
-        df['frequent_visitor'] = np.random.choice([0, 1], size=len(df), p=[0.7, 0.3])
-    return df
+def preprocess_data(df, venue=None):
+    # Derived columns (duration, hour_of_day, is_weekend, frequent_visitor, ...); df is not modified
+    return add_features(df, venue)
 
-def ai_customer_segmentation(df, business_type):
-    # KMeans clustering
-    clustering_features = ['duration', 'hour_of_day', 'frequent_visitor']
-    features = [f for f in clustering_features if f in df.columns and pd.api.types.is_numeric_dtype(df[f])]
+CLUSTERING_FEATURES = ['duration', 'hour_of_day', 'frequent_visitor']
+
+# --- Model steps (no Streamlit calls, so portfolio workers can run them) ---
+# sklearn, statsmodels and plotly are imported inside the functions that use
+# them, so importing this module (or the app) stays fast.
+
+def _fit_segmentation(X, n_clusters):
+    from sklearn.cluster import KMeans
+    from sklearn.preprocessing import StandardScaler
+
+    scaler = StandardScaler().fit(X)
+    kmeans = KMeans(n_clusters=n_clusters, n_init=10, random_state=42).fit(scaler.transform(X))
+    return scaler, kmeans
+
+def segment_customers(df, n_clusters=3, venue=None):
+    """KMeans over the clustering features; returns (df with 'Cluster', features) or None."""
+    features = [f for f in CLUSTERING_FEATURES if f in df.columns and pd.api.types.is_numeric_dtype(df[f])]
     df = df.dropna(subset=features)
     if len(df) < 3 or len(features) < 2:
-        st.warning("Insufficient data/features for clustering.")
+        return None
+    X = df[features]
+    scaler, kmeans = get_registry().get_or_fit(
+        "kmeans", venue, X, features, {"n_clusters": n_clusters, "n_init": 10, "random_state": 42},
+        lambda: _fit_segmentation(X, n_clusters),
+    )
+    df['Cluster'] = kmeans.predict(scaler.transform(X))
+    return df, features
+
+def detect_anomalies(df, venue=None):
+    from sklearn.ensemble import IsolationForest
+
+    X = df[['duration']].fillna(0)
+    params = {"contamination": 0.05, "random_state": 42}
+    model = get_registry().get_or_fit(
+        "isolation_forest", venue, X, ['duration'], params, lambda: IsolationForest(**params).fit(X)
+    )
+    df['anomaly'] = model.predict(X)
+    return df[df['anomaly'] == -1]
+
+def churn_risk(df, venue=None):
+    # Device-level risk from the visitor index: recency against the device's own visit rhythm
+    if 'device_id' not in df.columns:
+        df['churn_risk'] = ((df['frequent_visitor'] == 0) & (df['duration'] < 20)).astype(int)
         return df
-    scaler = StandardScaler()
-    X = scaler.fit_transform(df[features])
+    features = index_for_frame(df, venue).churn_features()
+    df['churn_risk'] = df['device_id'].astype(str).map(features['churn_risk']).fillna(0).astype(int)
+    return df
+
+def cluster_recommendations(profiles):
+    # Example: simple rule-based for demonstration, from per-cluster means
+    recommendations = []
+    for c, profile in profiles.iterrows():
+        avg_duration = profile.get('duration', np.nan)
+        freq_visitor_ratio = profile.get('frequent_visitor', np.nan) * 100
+        if avg_duration > 60 and freq_visitor_ratio > 50:
+            recommendations.append(f"- **Cluster {c}: VIP/Loyal Customers**: Send loyalty rewards, exclusive offers.")
+        elif avg_duration < 30:
+            recommendations.append(f"- **Cluster {c}: Quick Visitors**: Offer fast deals, express services, or grab-and-go promotions.")
+        else:
+            recommendations.append(f"- **Cluster {c}: Diverse**: Use general promotions and survey for more info.")
+    return recommendations
+
+def daily_connections(df):
+    return df.set_index('timestamp').resample('D').size()
+
+def forecast_daily_connections(ts, steps=7, venue=None):
+    from statsmodels.tsa.arima.model import ARIMA
+
+    order = (1,1,1)
+    model_fit = get_registry().get_or_fit(
+        "arima", venue, ts, ["daily_connections"], {"order": order}, lambda: ARIMA(ts, order=order).fit()
+    )
+    return model_fit.forecast(steps=steps)
+
+def nlg_summary_text(df, business_type, sessions=None):
+    # sessions: the venue's total when df is a sample
+    total = len(df) if sessions is None else sessions
+    avg_duration = df['duration'].mean() if 'duration' in df.columns else None
+    peak_hour = df['hour_of_day'].mode()[0] if 'hour_of_day' in df.columns else None
+    freq_pct = df['frequent_visitor'].mean() * 100 if 'frequent_visitor' in df.columns else None
+    msg = f"For your {business_type.replace('_', ' ').title()}, you had {total} WiFi sessions. "
+    if avg_duration:
+        msg += f"Average session lasted {avg_duration:.1f} minutes. "
+    if peak_hour:
+        msg += f"Peak usage was at {peak_hour}:00. "
+    if freq_pct:
+        msg += f"Returning visitors made up {freq_pct:.0f}% of all sessions."
+    return msg
+
+# --- Streamlit views ---
+
+@timed()
+def ai_streaming_segmentation(df, business_type, n_clusters, total_rows=None):
+    # Large venue: stream the logs through MiniBatchKMeans instead of clustering df in memory
+    import plotly.express as px
+
+    features = [f for f in CLUSTERING_FEATURES if f in df.columns and pd.api.types.is_numeric_dtype(df[f])]
+    if len(features) < 2:
+        st.warning("Insufficient data/features for clustering.")
+        return df, None
+    with st.spinner(f"Streaming {total_rows or len(df):,} sessions through mini-batch KMeans..."):
+        model = streaming_segmentation(business_type, features, n_clusters)
+    st.subheader("Customer Clusters")
+    st.caption(f"Mini-batch segmentation over {int(model.profiles['sessions'].sum()):,} sessions; "
+               f"chart shows a sample of up to {SAMPLE_PER_CLUSTER:,} per cluster.")
+    st.dataframe(model.profiles.round(2))
+    fig = px.scatter(model.sample, x=features[0], y=features[1], color='Cluster', title='Customer Clusters', hover_data=features)
+    st.plotly_chart(fig)
+    return df, model.profiles
+
+@timed()
+def ai_customer_segmentation(df, business_type, total_rows=None):
+    # KMeans clustering; returns the frame and per-cluster feature means.
+    # total_rows is the venue's size in storage: at or above
+    # STREAMING_MIN_ROWS the venue files are streamed (df is then a sample)
+    import plotly.express as px
+
     n_clusters = st.slider("Select number of clusters (K)", 2, 5, 3)
-    kmeans = KMeans(n_clusters=n_clusters, n_init=10, random_state=42)
-    df['Cluster'] = kmeans.fit_predict(X)
+    if total_rows is not None and total_rows >= STREAMING_MIN_ROWS:
+        return ai_streaming_segmentation(df, business_type, n_clusters, total_rows)
+    result = segment_customers(df, n_clusters, venue=business_type)
+    if result is None:
+        st.warning("Insufficient data/features for clustering.")
+        return df, None
+    df, features = result
+    profiles = df.groupby('Cluster')[features].mean()
     st.subheader("Customer Clusters")
-    st.dataframe(df.groupby('Cluster')[features].mean().round(2))
-    fig = px.scatter(df, x=features[0], y=features[1], color='Cluster', title='Customer Clusters', hover_data=features)
+    st.dataframe(profiles.round(2))
+    # Plot a per-cluster, density-aware sample; profiles above cover every session
+    points = downsample_scatter(df[features + ['Cluster']], features[0], features[1], by='Cluster', method='density')
+    if len(points) < len(df):
+        st.caption(f"Chart shows {len(points):,} of {len(df):,} sessions, sampled per cluster "
+                   f"with dense regions thinned first.")
+    fig = px.scatter(points, x=features[0], y=features[1], color='Cluster', title='Customer Clusters', hover_data=features)
     st.plotly_chart(fig)
-    return df
+    return df, profiles
 
+@timed()
 def ai_peak_time_prediction(df):
+    import plotly.express as px
+
     st.subheader("Predicting Peak Hours/Days")
     if 'hour_of_day' in df.columns and 'timestamp' in df.columns:
         peak_hour = df['hour_of_day'].mode()[0]
@@ -81,88 +225,151 @@ def ai_peak_time_prediction(df):
     else:
         st.warning("Insufficient time data for peak prediction.")
 
+@timed()
 def ai_anomaly_detection(df):
     st.subheader("Anomaly Detection")
     if 'duration' in df.columns:
-        model = IsolationForest(contamination=0.05)
-        df['anomaly'] = model.fit_predict(df[['duration']].fillna(0))
-        anomalies = df[df['anomaly'] == -1]
+        anomalies = detect_anomalies(df)
         st.write(f"Detected {len(anomalies)} anomalous sessions.")
-        st.dataframe(anomalies[['duration', 'hour_of_day', 'frequent_visitor']])
+        paged_dataframe(anomalies[['duration', 'hour_of_day', 'frequent_visitor']], key="anomaly_page")
     else:
         st.warning("No 'duration' feature for anomaly detection.")
 
-def ai_churn_prediction(df):
+@timed()
+def ai_live_alerts(business_type):
+    st.subheader("Live Anomaly Alerts")
+    from anomaly_service import recent_alerts
+
+    try:
+        alerts = recent_alerts(business_type)
+    except Exception as e:
+        st.error(f"Could not read anomaly alerts: {e}")
+        return
+    if alerts.empty:
+        st.info("No live sessions flagged yet.")
+        return
+    st.write(f"Latest {len(alerts)} sessions flagged by the live scorer (newest first).")
+    paged_dataframe(alerts, key="live_alert_page")
+
+@timed()
+def ai_churn_prediction(df, business_type=None):
     st.subheader("Churn Prediction (Likelihood User Won't Return)")
     if 'frequent_visitor' in df.columns and 'duration' in df.columns:
-        # For demo: Predict "churn" as not frequent visitor with short duration
-        df['churn_risk'] = ((df['frequent_visitor'] == 0) & (df['duration'] < 20)).astype(int)
+        df = churn_risk(df, business_type)
         st.write("Sample churn risk (1 = high risk):")
-        st.dataframe(df[['duration', 'frequent_visitor', 'churn_risk']].head())
+        st.dataframe(df[[c for c in ['device_id', 'duration', 'frequent_visitor', 'churn_risk'] if c in df.columns]].head())
         churn_rate = df['churn_risk'].mean() * 100
         st.info(f"Estimated churn risk in sample: {churn_rate:.1f}%")
+        if 'device_id' in df.columns:
+            features = index_for_frame(df, business_type).churn_features()
+            at_risk = features[features['churn_risk'] == 1].sort_values('days_since_last_visit', ascending=False)
+            st.write(f"{len(at_risk)} of {len(features)} devices at risk (from their visit history):")
+            paged_dataframe(at_risk.round(2), key="churn_page")
     else:
         st.warning("Insufficient features for churn prediction.")
 
-def ai_marketing_recommendations(df, business_type):
+@timed()
+def ai_marketing_recommendations(profiles, business_type):
     st.subheader("Personalized Marketing Recommendations")
-    # Example: simple rule-based for demonstration
-    if 'Cluster' in df.columns:
-        for c in sorted(df['Cluster'].unique()):
-            group = df[df['Cluster'] == c]
-            avg_duration = group['duration'].mean()
-            freq_visitor_ratio = group['frequent_visitor'].mean() * 100
-            if avg_duration > 60 and freq_visitor_ratio > 50:
-                st.markdown(f"- **Cluster {c}: VIP/Loyal Customers**: Send loyalty rewards, exclusive offers.")
-            elif avg_duration < 30:
-                st.markdown(f"- **Cluster {c}: Quick Visitors**: Offer fast deals, express services, or grab-and-go promotions.")
-            else:
-                st.markdown(f"- **Cluster {c}: Diverse**: Use general promotions and survey for more info.")
+    if profiles is not None:
+        for line in cluster_recommendations(profiles):
+            st.markdown(line)
     else:
         st.info("Cluster data unavailable for tailored marketing.")
 
-def ai_time_series_forecasting(df):
+@timed()
+def ai_time_series_forecasting(business_type):
+    # Reads forecasts precomputed by forecasting.py; nothing is fitted during the render
+    from forecasting import get_forecast_scheduler, load_forecasts, run_forecasts
+
     st.subheader("Time Series Forecasting")
-    if 'timestamp' in df.columns:
-        ts = df.set_index('timestamp').resample('D').size()
-        if len(ts) > 7:
-            try:
-                model = ARIMA(ts, order=(1,1,1))
-                model_fit = model.fit()
-                forecast = model_fit.forecast(steps=7)
-                st.line_chart(pd.concat([ts, forecast.rename('Forecast')]))
-                st.write("Forecast for next 7 days:")
-                st.dataframe(forecast.reset_index())
-            except Exception as e:
-                st.warning(f"Forecasting failed: {e}")
-        else:
-            st.warning("Not enough data for reliable time series forecasting.")
-    else:
-        st.warning("No timestamp data for time series analysis.")
+    get_forecast_scheduler()
+    granularity = st.radio("Forecast granularity", ["Daily", "Hourly"], horizontal=True).lower()
+    record = load_forecasts(business_type).get(granularity) or {}
+    if record.get("forecast") is None:
+        st.warning(record.get("error") or "No forecast has been computed for this venue yet.")
+        if st.button("Compute forecast now"):
+            with st.spinner("Fitting forecasts..."):
+                run_forecasts([business_type], max_workers=1)
+            st.rerun()
+        return
+    forecast = record["forecast"]
+    chart = pd.concat([record["history"].rename("Connections"), forecast], axis=1)
+    st.line_chart(chart)
+    st.caption(f"Fitted {record['fitted_at']:%Y-%m-%d %H:%M} in {record['fit_seconds']:.1f}s"
+               f"{' (warm start)' if record['warm_started'] else ''}; "
+               f"lower/upper bound the 95% prediction interval.")
+    if record.get("error"):
+        st.warning(f"The latest refit failed, showing the previous forecast: {record['error']}")
+    hourly = granularity == "hourly"
+    start = forecast.index[0].strftime("%Y-%m-%d %H:00" if hourly else "%Y-%m-%d")
+    st.write(f"Forecast for the {len(forecast)} {'hours' if hourly else 'days'} from {start}:")
+    st.dataframe(forecast.round(1).reset_index())
 
-def ai_nlg_summary(df, business_type):
+@timed()
+def ai_nlg_summary(df, business_type, sessions=None):
     st.subheader("Automated Insight Summary")
     # Example: Template-based NLG (can be replaced with GPT/OpenAI API)
     if df.empty:
         st.info("No data to summarize.")
         return
-    total = len(df)
-    avg_duration = df['duration'].mean() if 'duration' in df.columns else None
-    peak_hour = df['hour_of_day'].mode()[0] if 'hour_of_day' in df.columns else None
-    freq_pct = df['frequent_visitor'].mean() * 100 if 'frequent_visitor' in df.columns else None
-    msg = f"For your {business_type.replace('_', ' ').title()}, you had {total} WiFi sessions. "
-    if avg_duration:
-        msg += f"Average session lasted {avg_duration:.1f} minutes. "
-    if peak_hour:
-        msg += f"Peak usage was at {peak_hour}:00. "
-    if freq_pct:
-        msg += f"Returning visitors made up {freq_pct:.0f}% of all sessions."
-    st.success(msg)
+    st.success(nlg_summary_text(df, business_type, sessions))
+
+def show_portfolio_insights():
+    import plotly.express as px
+    from portfolio import run_portfolio
+
+    st.write("Run the full AI pipeline across every venue in parallel and compare the results.")
+    n_clusters = st.slider("Number of clusters (K) for every venue", 2, 5, 3, key="portfolio_k")
+    if st.button("Run portfolio analysis"):
+        venues = list_venues()
+        progress = st.progress(0.0, text="Analysing venues...")
+        done = []
+        def on_result(result):
+            done.append(result["venue"])
+            progress.progress(len(done) / len(venues), text=f"Finished {result['venue']}")
+        st.session_state["portfolio_results"] = run_portfolio(venues, n_clusters, on_result=on_result)
+        progress.empty()
+
+    results = st.session_state.get("portfolio_results")
+    if not results:
+        return
+
+    st.subheader("Venue Comparison")
+    comparison = pd.DataFrame([{"venue": r["venue"], **r["metrics"]} for r in results]).set_index("venue")
+    st.dataframe(comparison.round(2))
+    for metric, title in [("sessions", "Sessions per Venue"), ("anomaly_rate_pct", "Anomalous Sessions (%)"),
+                          ("avg_duration_min", "Average Session Duration (min)")]:
+        if metric in comparison.columns:
+            st.plotly_chart(px.bar(comparison.reset_index(), x="venue", y=metric, title=title))
+
+    st.subheader("Step Timings (seconds)")
+    st.dataframe(pd.DataFrame({r["venue"]: r["timings"] for r in results}).T.round(3))
+
+    for r in results:
+        if r["errors"]:
+            with st.expander(f"⚠️ {r['venue']}: {len(r['errors'])} step(s) failed"):
+                for step, error in r["errors"].items():
+                    st.write(f"**{step}**: {error}")
+        if r["summary"]:
+            st.success(r["summary"])
 
 def show_ai_insights():
     st.header("🤖 AI-Powered Customer Insights: Advanced Analytics Suite")
+    mode = st.radio("Mode", ["Single venue", "Portfolio (all venues)"], horizontal=True)
+    if mode != "Single venue":
+        show_portfolio_insights()
+        return
+
     st.write("Select a business type and explore advanced, AI-driven insights for your WiFi analytics.")
 
+    from query_layer import db_configured
+
+    if db_configured() and st.radio("Source", ["Log files", "Database (wifi_logs)"], horizontal=True,
+                                    key="ai_source") != "Log files":
+        show_database_insights()
+        return
+
     business_options = [
         "restaurant",
         "hospital",
@@ -172,20 +379,58 @@ def show_ai_insights():
     ]
     business_type = st.selectbox("Business Type", business_options)
 
-    df = load_business_data(business_type)
+    df, total = load_business_data(business_type)
     if df.empty:
         return
-    df = preprocess_data(df)
     st.dataframe(df.head())
+    if len(df) < total:
+        st.info(f"{total:,} sessions: clustering streams all of them; peak hours, anomalies and churn "
+                f"below use a uniform sample of {len(df):,}, so daily counts are scaled down.")
 
     # AI Features
-    df = ai_customer_segmentation(df, business_type)
+    df, profiles = ai_customer_segmentation(df, business_type, total)
+    ai_peak_time_prediction(df)
+    ai_anomaly_detection(df)
+    ai_live_alerts(business_type)
+    ai_churn_prediction(df, business_type)
+    ai_marketing_recommendations(profiles, business_type)
+    ai_time_series_forecasting(business_type)
+    ai_nlg_summary(df, business_type, total)
+
+def show_database_insights():
+    from query_layer import get_query_layer
+
+    try:
+        layer = get_query_layer()
+        locations = layer.locations()
+    except Exception as e:
+        st.error(f"Could not query wifi_logs: {e}")
+        return
+    if not locations:
+        st.warning("No sessions in wifi_logs yet.")
+        return
+    location = st.selectbox("Location", locations, key="ai_location")
+    first, last = layer.time_bounds(location)
+    # Default to the latest 30 days, so a busy location doesn't pull its whole history
+    default_start = max(first.date(), (last - pd.Timedelta(days=29)).date())
+    picked = st.date_input("Date range", value=(default_start, last.date()), min_value=first.date(),
+                           max_value=last.date(), key="ai_dates")
+    if len(picked) != 2:
+        return
+    df = load_database_data(location, pd.Timestamp(picked[0]), pd.Timestamp(picked[1]) + pd.Timedelta(days=1))
+    if df.empty:
+        return
+    st.dataframe(df.head())
+
+    df, profiles = ai_customer_segmentation(df, location)
     ai_peak_time_prediction(df)
     ai_anomaly_detection(df)
+    ai_live_alerts(location)
     ai_churn_prediction(df)
-    ai_marketing_recommendations(df, business_type)
-    ai_time_series_forecasting(df)
-    ai_nlg_summary(df, business_type)
+    ai_marketing_recommendations(profiles, location)
+    st.subheader("Time Series Forecasting")
+    st.info("Forecasts are fitted from the venue log files; switch the source to Log files to see them.")
+    ai_nlg_summary(df, location)
 
 # Streamlit entry point
 #if __name__ == "__main__" or st._is_running_with_streamlit:
@@ -0,0 +1,467 @@
+# --- anomaly_service.py ---
+# Online anomaly scoring for live sessions.
+# Sessions are queued as they end and scored in micro-batches by one thread.
+# A batch closes after max_batch sessions or max_wait seconds, whichever
+# comes first, so a session waits at most max_wait plus one batch's scoring
+# time. Each venue has its own IsolationForest on duration, data used, signal
+# and hour of day. It is bootstrapped from connection_logs, then retrained in
+# a background thread every retrain_interval seconds on a rolling window of
+# recent sessions. Flagged sessions are written to the anomaly_alerts table
+# (see schema.sql) through an IngestWriter when WIFI_DB_DSN is set, and kept
+# in memory for the AI Insights tab either way.
+#
+# Live sessions reach the process-wide scorer from the default ingest writer
+# (every wifi_logs event) and from the splash page (when a guest
+# disconnects). The app warms it on a background thread at startup.
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+import warnings
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest
+
+from data_loader import load_venue_frame
+from ingest import IngestWriter, create_pool
+from model_registry import get_registry
+
+logger = logging.getLogger(__name__)
+
+ANOMALY_FEATURES = ["duration", "data_used_MB", "signal_strength_dBm", "hour_of_day"]
+
+ALERT_COLUMNS = (
+    "detected_at", "session_timestamp", "device_id", "location", "duration_minutes",
+    "data_used_mb", "signal_dbm", "hour_of_day", "score", "model_trained_at",
+)
+
+RETRAIN_INTERVAL = float(os.environ.get("WIFI_ANOMALY_RETRAIN_SECONDS", "600"))
+HISTORY_ROWS = 50_000
+MIN_TRAIN_ROWS = 200
+MODEL_PARAMS = {"n_estimators": 100, "contamination": 0.01, "random_state": 42}
+
+
+def _num(value):
+    return np.nan if value is None or value == "" else float(value)
+
+
+def _hour(ts):
+    if ts is None or ts == "":
+        return np.nan
+    return ts.hour if hasattr(ts, "hour") else pd.Timestamp(ts).hour
+
+
+def session_venue(session):
+    return session.get("business_type") or session.get("location")
+
+
+def session_features(sessions):
+    """Feature matrix (rows x ANOMALY_FEATURES) for session dicts with connection_logs keys."""
+    X = np.empty((len(sessions), len(ANOMALY_FEATURES)))
+    for i, s in enumerate(sessions):
+        # wifi_logs events call the duration dwell_time
+        X[i, 0] = _num(s.get("session_duration_minutes", s.get("duration", s.get("dwell_time"))))
+        X[i, 1] = _num(s.get("data_used_MB"))
+        X[i, 2] = _num(s.get("signal_strength_dBm"))
+        X[i, 3] = _hour(s.get("timestamp"))
+    return X
+
+
+def frame_features(df):
+    """Same features for a frame of connection_logs rows."""
+    duration = df["session_duration_minutes"] if "session_duration_minutes" in df.columns else df["duration"]
+    return np.column_stack([
+        duration.to_numpy(dtype="float64", na_value=np.nan),
+        df["data_used_MB"].to_numpy(dtype="float64", na_value=np.nan),
+        df["signal_strength_dBm"].to_numpy(dtype="float64", na_value=np.nan),
+        (df["hour_of_day"] if "hour_of_day" in df.columns else df["timestamp"].dt.hour)
+        .to_numpy(dtype="float64", na_value=np.nan),
+    ])
+
+
+class _History:
+    """Ring buffer of the last ``capacity`` feature rows seen for a venue."""
+
+    def __init__(self, capacity=HISTORY_ROWS):
+        self._rows = np.empty((capacity, len(ANOMALY_FEATURES)))
+        self._pos = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def add(self, X):
+        X = X[-len(self._rows):]
+        with self._lock:
+            end = self._pos + len(X)
+            head = min(end, len(self._rows)) - self._pos
+            self._rows[self._pos:self._pos + head] = X[:head]
+            self._rows[:len(X) - head] = X[head:]
+            self._pos = end % len(self._rows)
+            self._size = min(self._size + len(X), len(self._rows))
+
+    def __len__(self):
+        return self._size
+
+    def data(self):
+        with self._lock:
+            return self._rows[:self._size].copy()
+
+
+class VenueModel:
+    """A fitted IsolationForest plus the medians used to impute missing features.
+
+    ``columns`` are the ANOMALY_FEATURES positions the forest was fitted on
+    (None for all of them).
+    """
+
+    columns = None  # models cached before per-column fits used every feature
+
+    def __init__(self, model, medians, rows, columns=None):
+        self.model = model
+        self.medians = medians
+        self.rows = rows
+        self.columns = columns
+        self.trained_at = datetime.now()
+        self.trained_monotonic = time.monotonic()
+
+    def impute(self, X):
+        """``X`` with missing features set to the training medians (left NaN if never seen)."""
+        return np.where(np.isnan(X), self.medians, X)
+
+    def score(self, X):
+        X = self.impute(X)
+        if self.columns is not None:
+            X = X[:, self.columns]
+        return self.model.decision_function(X)  # < 0 means anomalous
+
+
+def training_rows(X, min_rows=MIN_TRAIN_ROWS):
+    """(complete rows, feature positions) to fit on, or None if fewer than ``min_rows``.
+
+    Every feature when enough rows carry all of them; otherwise only the
+    features that enough rows do carry (live sessions have no data used or
+    signal), so a venue fed only by live traffic still gets a model.
+    """
+    columns = np.arange(X.shape[1])
+    complete = ~np.isnan(X).any(axis=1)
+    if complete.sum() < min_rows:
+        columns = np.flatnonzero((~np.isnan(X)).sum(axis=0) >= min_rows)
+        complete = ~np.isnan(X[:, columns]).any(axis=1)
+    if not len(columns) or complete.sum() < min_rows:
+        return None
+    return X[complete][:, columns], columns
+
+
+def fit_venue_model(X, params=MODEL_PARAMS, min_rows=MIN_TRAIN_ROWS):
+    """VenueModel for the rows of ``X``, or None if too few are usable (see training_rows)."""
+    usable = training_rows(X, min_rows)
+    if usable is None:
+        return None
+    rows, columns = usable
+    model = IsolationForest(**params).fit(rows)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN feature: its median stays NaN
+        medians = np.nanmedian(X, axis=0)
+    return VenueModel(model, medians, len(rows), None if len(columns) == X.shape[1] else columns)
+
+
+class _Control:
+    __slots__ = ("stop", "done")
+
+    def __init__(self, stop=False):
+        self.stop = stop
+        self.done = threading.Event()
+
+
+class AnomalyScorer:
+    """Scores queued sessions per venue in bounded-latency micro-batches.
+
+    ``submit`` returns False if ``max_pending`` sessions are already queued
+    and ``timeout`` expires. Sessions of a venue without a model yet wait
+    (up to ``max_waiting`` per venue) until its first fit finishes.
+    ``on_alert`` is called on the scoring thread with each alert dict.
+    """
+
+    LATENCY_SAMPLES = 100_000
+    RATE_WINDOW = 60.0
+
+    def __init__(self, pool=None, max_batch=512, max_wait=0.05, retrain_interval=RETRAIN_INTERVAL,
+                 history_rows=HISTORY_ROWS, max_pending=100_000, max_waiting=10_000, on_alert=None):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.retrain_interval = retrain_interval
+        self.history_rows = history_rows
+        self.max_waiting = max_waiting
+        self.on_alert = on_alert
+        self.alert_writer = (
+            IngestWriter(pool, batch_size=500, flush_interval=0.5, table="anomaly_alerts",
+                         columns=ALERT_COLUMNS)
+            if pool is not None else None
+        )
+        self.recent_alerts = deque(maxlen=1000)
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._train_queue = queue.Queue()
+        self._models = {}  # venue -> VenueModel, swapped whole by the trainer
+        self._histories = {}
+        self._waiting = {}  # venue -> deque of (enqueued, session) until its first model
+        self._training = set()
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=self.LATENCY_SAMPLES)
+        self._recent = deque()  # (scored at, sessions) over the last RATE_WINDOW seconds
+        self._counters = {"scored": 0, "flagged": 0, "rejected": 0, "dropped_waiting": 0,
+                          "fits": 0, "batches": 0}
+        self._threads = []
+        self._started_at = None
+
+    def start(self):
+        if not self._threads:
+            self._started_at = time.monotonic()
+            if self.alert_writer is not None:
+                self.alert_writer.start()
+            for target, name in [(self._run, "anomaly-score"), (self._train_loop, "anomaly-train")]:
+                thread = threading.Thread(target=target, name=name, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def warm(self, venues):
+        """Fit the first model for each venue now instead of on its first session."""
+        for venue in venues:
+            if venue not in self._models:
+                self._fit(venue)
+
+    def submit(self, session, timeout=None):
+        try:
+            self._queue.put((time.monotonic(), session), timeout=timeout)
+            return True
+        except queue.Full:
+            with self._lock:
+                self._counters["rejected"] += 1
+            return False
+
+    def submit_many(self, sessions, timeout=None):
+        return sum(self.submit(s, timeout) for s in sessions)
+
+    def flush(self, timeout=None):
+        """Block until every session submitted before this call has been scored or parked."""
+        control = _Control()
+        self._queue.put(control)
+        if not control.done.wait(timeout):
+            return False
+        return self.alert_writer.flush(timeout) if self.alert_writer is not None else True
+
+    def close(self, timeout=None):
+        if self._threads:
+            self._queue.put(_Control(stop=True))
+            self._train_queue.put(None)
+            for thread in self._threads:
+                thread.join(timeout)
+            self._threads = []
+        if self.alert_writer is not None:
+            self.alert_writer.close(timeout)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            counters = dict(self._counters)
+            latencies = np.array(self._latencies)
+            while self._recent and now - self._recent[0][0] > self.RATE_WINDOW:
+                self._recent.popleft()
+            recent = sum(n for _, n in self._recent)
+            waiting = sum(len(w) for w in self._waiting.values())
+        window = min(self.RATE_WINDOW, now - self._started_at) if self._started_at else 0
+        counters["sessions_per_sec"] = recent / window if window > 0 else 0.0
+        counters["pending"] = self._queue.qsize()
+        counters["waiting_for_model"] = waiting
+        if len(latencies):
+            counters["latency_ms"] = {f"p{q}": float(np.percentile(latencies, q)) * 1000 for q in (50, 95, 99)}
+            counters["latency_ms"]["max"] = float(latencies.max()) * 1000
+        counters["models"] = {venue: {"trained_at": m.trained_at.isoformat(timespec="seconds"), "rows": m.rows}
+                              for venue, m in list(self._models.items())}
+        return counters
+
+    # -- training -------------------------------------------------------
+
+    def _history(self, venue):
+        with self._lock:
+            history = self._histories.get(venue)
+            if history is None:
+                history = self._histories[venue] = _History(self.history_rows)
+                bootstrap = True
+            else:
+                bootstrap = False
+        if bootstrap:
+            try:
+                df = load_venue_frame(venue, columns=["timestamp", "session_duration_minutes",
+                                                      "data_used_MB", "signal_strength_dBm"])
+                history.add(frame_features(df.tail(self.history_rows)))
+            except (FileNotFoundError, KeyError, ValueError):
+                pass  # new venue: learn from live sessions only
+        return history
+
+    def _fit(self, venue):
+        history = self._history(venue)
+        X = history.data()
+        if training_rows(X) is None:
+            return None
+        if venue not in self._models:
+            # First model comes from stored logs; reuse the cached fit across restarts
+            frame = pd.DataFrame(X, columns=ANOMALY_FEATURES)
+            model = get_registry().get_or_fit(
+                "isolation_forest_online", venue, frame, ANOMALY_FEATURES, MODEL_PARAMS,
+                lambda: fit_venue_model(X),
+            )
+            model.trained_monotonic = time.monotonic()
+        else:
+            model = fit_venue_model(X)
+        if model is None:
+            return None
+        self._models[venue] = model
+        with self._lock:
+            self._counters["fits"] += 1
+        return model
+
+    def _request_fit(self, venue):
+        with self._lock:
+            if venue in self._training:
+                return
+            self._training.add(venue)
+        self._train_queue.put(venue)
+
+    def _train_loop(self):
+        while True:
+            venue = self._train_queue.get()
+            if venue is None:
+                return
+            try:
+                self._fit(venue)
+            except Exception:
+                logger.exception("Anomaly model fit failed for %s", venue)
+            finally:
+                with self._lock:
+                    self._training.discard(venue)
+
+    # -- scoring --------------------------------------------------------
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch and not isinstance(batch[-1], _Control):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            control = batch.pop() if isinstance(batch[-1], _Control) else None
+            try:
+                self._score_batch(batch)
+            except Exception:
+                logger.exception("Failed to score %d sessions", len(batch))
+            if control is not None:
+                control.done.set()
+                if control.stop:
+                    return
+
+    def _score_batch(self, batch):
+        by_venue = {}
+        for item in batch:
+            by_venue.setdefault(session_venue(item[1]), []).append(item)
+        # Sessions parked while a venue had no model are scored once it has one
+        with self._lock:
+            ready = {v: self._waiting.pop(v) for v in list(self._waiting) if v in self._models}
+        for venue, parked in ready.items():
+            by_venue.setdefault(venue, [])[:0] = parked
+        for venue, items in by_venue.items():
+            X = session_features([session for _, session in items])
+            model = self._models.get(venue)
+            # Parked sessions went into the history when they arrived. New ones go in
+            # imputed, so sessions missing a feature still count when the model is refit.
+            fresh = X[len(ready.get(venue, ())):]
+            self._history(venue).add(model.impute(fresh) if model is not None else fresh)
+            if model is None:
+                with self._lock:
+                    waiting = self._waiting.setdefault(venue, deque(maxlen=self.max_waiting))
+                    self._counters["dropped_waiting"] += max(0, len(waiting) + len(items) - self.max_waiting)
+                    waiting.extend(items)
+                self._request_fit(venue)
+                continue
+            if time.monotonic() - model.trained_monotonic >= self.retrain_interval:
+                self._request_fit(venue)
+            scores = model.score(X)
+            done = time.monotonic()
+            flagged = np.flatnonzero(scores < 0)
+            for i in flagged:
+                self._alert(venue, items[i][1], X[i], scores[i], model)
+            with self._lock:
+                self._latencies.extend(done - enqueued for enqueued, _ in items)
+                self._recent.append((done, len(items)))
+                self._counters["scored"] += len(items)
+                self._counters["flagged"] += len(flagged)
+        with self._lock:
+            self._counters["batches"] += 1
+
+    def _alert(self, venue, session, x, score, model):
+        ts = session.get("timestamp")
+        alert = {
+            "detected_at": datetime.now(),
+            "session_timestamp": ts.to_pydatetime() if isinstance(ts, pd.Timestamp) else ts,
+            "device_id": session.get("device_id"),
+            "location": venue,
+            "duration_minutes": None if np.isnan(x[0]) else float(x[0]),
+            "data_used_mb": None if np.isnan(x[1]) else float(x[1]),
+            "signal_dbm": None if np.isnan(x[2]) else float(x[2]),
+            "hour_of_day": None if np.isnan(x[3]) else int(x[3]),
+            "score": float(score),
+            "model_trained_at": model.trained_at,
+        }
+        self.recent_alerts.append(alert)
+        if self.alert_writer is not None:
+            self.alert_writer.write(alert, timeout=0)
+        if self.on_alert is not None:
+            try:
+                self.on_alert(alert)
+            except Exception:
+                logger.exception("on_alert callback failed")
+
+
+_scorer = None
+_scorer_lock = threading.Lock()
+
+
+def get_anomaly_scorer():
+    """Process-wide scorer, drained at exit; None if WIFI_ANOMALY_SCORING=0.
+
+    Alerts go to the anomaly_alerts table when WIFI_DB_DSN is set.
+    """
+    global _scorer
+    with _scorer_lock:
+        if _scorer is None and os.environ.get("WIFI_ANOMALY_SCORING", "1") != "0":
+            _scorer = AnomalyScorer(create_pool() if os.environ.get("WIFI_DB_DSN") else None).start()
+            atexit.register(_scorer.close)
+        return _scorer
+
+
+def score_live_session(session):
+    """Queue a finished session for the process-wide scorer without blocking; False if dropped."""
+    scorer = get_anomaly_scorer()
+    return scorer.submit(session, timeout=0) if scorer is not None else False
+
+
+def recent_alerts(venue=None, limit=200):
+    """Newest alerts first, as a frame: from anomaly_alerts when a database is set, else this process's scorer."""
+    from data_loader import venue_slug
+    from query_layer import db_configured, get_query_layer
+
+    if db_configured():
+        return get_query_layer().recent_alerts(venue, limit)
+    alerts = list(_scorer.recent_alerts) if _scorer is not None else []
+    if venue is not None:
+        alerts = [a for a in alerts if venue_slug(str(a["location"])) == venue_slug(venue)]
+    return pd.DataFrame(alerts[::-1][:limit], columns=list(ALERT_COLUMNS))
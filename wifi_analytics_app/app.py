@@ -3,11 +3,12 @@ import streamlit as st
 import os
 
 from auth import login_user
-from splash import splash_page
-from ai_models import show_ai_insights
-from automation import automation_controls
+from splash import splash_page, start_live_scoring
 from config import init_config
-from insights import load_business_data, analytics_dashboard
+from metrics import start_exporter
+# The admin tabs (insights, ai_models, automation) pull in pandas, plotly,
+# sklearn and statsmodels, so they are imported when a tab is opened, not
+# on every guest sign-in. See import_budget.py.
 
 # Set a modern background color (gradient or solid)
 page_bg_css = """
@@ -35,6 +36,9 @@ st.markdown(page_bg_css, unsafe_allow_html=True)
 
 # ⚙️ Initialize config
 init_config()
+start_exporter()  # Prometheus /metrics, only if WIFI_METRICS_PORT is set
+if os.environ.get("WIFI_ANOMALY_WARM") == "1":
+    start_live_scoring()  # fit the live anomaly models at startup instead of on first use
 
 # --- Animated Login Page with Help Links ---
 def animated_login():
@@ -61,13 +65,20 @@ if user_type == "guest":
     splash_page()
 elif user_type == "admin":
     st.sidebar.title("Admin Dashboard")
-    tab = st.sidebar.radio("Navigate", ["Analytics", "AI Insights", "Automation"])
+    tab = st.sidebar.radio("Navigate", ["Analytics", "AI Insights", "Automation", "Performance"])
     if tab == "Analytics":
+        from insights import analytics_dashboard
         analytics_dashboard()
     elif tab == "AI Insights":
+        from ai_models import show_ai_insights
+        start_live_scoring()  # the tab lists live alerts
         show_ai_insights()
     elif tab == "Automation":
+        from automation import automation_controls
         automation_controls()
+    elif tab == "Performance":
+        from metrics import performance_dashboard
+        performance_dashboard()
 elif user_type == "unauthorized":
     unauthorized_access()
 else:
@@ -76,6 +87,8 @@ else:
 
 # 🎯 Optional: Standalone dashboard access
 def main_dashboard():
+    from insights import load_business_data
+
     st.title("📡 Free WiFi Analytics Dashboard")
     business_type = st.selectbox("Select Business Type", ["Boutique", "Business Cafe", "Hospital", "Restaurant", "Supermarket"])
     df = load_business_data(business_type)
@@ -3,68 +3,95 @@ import streamlit as st
 import pandas as pd
 import os # Keep os import, though its usage will change slightly
 
+from rule_engine import ACTIONS, ALL_VENUES, TRIGGERS, get_rule_engine, get_rule_store
+from splash import LOCATIONS
+from upload_pipeline import import_upload
+
 # No need to import load_business_data from insights here if this section is ONLY for uploading and validating new files.
 # If you also want to DISPLAY existing data from connection_logs in this dashboard, then you would import it.
 
 def automation_controls():
     st.header("⚙️ Automation Settings")
 
-    # Rule configuration (this section is fine)
-    trigger = st.selectbox("When to trigger?", ["On Connect", "After X Minutes", "On Disconnect"])
-    action = st.selectbox("Action", ["Send SMS", "Send Email", "Webhook Call"])
+    # Rule configuration, persisted and fired by rule_engine
+    trigger = st.selectbox("When to trigger?", TRIGGERS)
+    minutes = st.number_input("Minutes after connecting", 1, 1440, 30) if trigger == "After X Minutes" else None
+    action = st.selectbox("Action", ACTIONS)
+    target = st.text_input("Webhook URL (blank = WIFI_WEBHOOK_URL)") if action == "Webhook Call" else None
+    venue = st.selectbox("Venue", ["All venues"] + LOCATIONS)
     content = st.text_area("Message Content", "Thanks for connecting to Free WiFi!")
 
     if st.button("Save Rule"):
-        st.success(f"Rule saved: {trigger} → {action}")
-        # In a real application, you would save this rule to a database or persistent storage
-        # (e.g., Streamlit's connection to a database, or a more robust config management system).
+        try:
+            rule = get_rule_store().add(trigger, action, content, venue=ALL_VENUES if venue == "All venues" else venue,
+                                        minutes=minutes, target=target)
+            get_rule_engine().reload()
+            st.success(f"Rule saved: {trigger} → {action} ({rule['id']})")
+        except ValueError as e:
+            st.error(str(e))
+
+    rules = get_rule_store().load()
+    if rules:
+        st.subheader("Active Rules")
+        st.dataframe(pd.DataFrame(rules)[["id", "trigger", "minutes", "venue", "action", "content", "target"]])
+        to_delete = st.selectbox("Delete rule", [r["id"] for r in rules])
+        if st.button("Delete Rule"):
+            get_rule_store().delete(to_delete)
+            get_rule_engine().reload()
+            st.rerun()
+        engine = get_rule_engine()
+        stats = engine.stats()
+        st.caption(f"Events: {stats['events']} · sent: {stats['sent']} · failed: {stats['failed']} · "
+                   f"retries: {stats['retries']} · deduped: {stats['deduped']} · pending timers: {stats['timers']}")
+        if engine.recent:
+            with st.expander("Recent deliveries"):
+                st.dataframe(pd.DataFrame(list(engine.recent)[::-1]))
 
     st.markdown("---")
 
-    st.subheader("📤 Upload New Business Dataset for Validation")
+    st.subheader("📤 Upload New Business Dataset")
 
     business_type = st.selectbox("Business Type", ["Boutique", "Business Cafe", "Hospital", "Restaurant", "Supermarket"])
     uploaded_file = st.file_uploader(f"Upload {business_type} CSV", type="csv")
+    st.caption("Multi-GB exports: use `python upload_pipeline.py <venue> <file>` on the server instead.")
+    validate_only = st.checkbox("Validate only (don't import)")
 
-    if uploaded_file:
-        try:
-            # --- FIX 1: Read directly from the uploaded file's buffer ---
-            df = pd.read_csv(uploaded_file)
-
-            # --- FIX 2: Apply the same column renaming logic for uploaded files ---
-            if 'session_duration_minutes' in df.columns and 'duration' not in df.columns:
-                df.rename(columns={'session_duration_minutes': 'duration'}, inplace=True)
-                st.info("Renamed 'session_duration_minutes' to 'duration' for uploaded file validation.")
+    if uploaded_file and st.button("Validate and import" if not validate_only else "Validate"):
+        # Streamed in chunks: validated, deduplicated and appended to the venue as it goes
+        progress = st.progress(0.0, text="Validating...")
 
-            # --- FIX 3: Define ALL expected columns including new metrics ---
-            # These are the columns you expect in the uploaded CSV for full functionality
-            expected_columns = {
-                "timestamp",
-                "device_type",
-                "duration", # Now 'duration' is the target name after renaming
-                "signal_strength_dBm",
-                "data_used_MB",
-                "peak_usage_hour"
-            }
-
-            if not expected_columns.issubset(df.columns):
-                missing_cols = expected_columns - set(df.columns)
-                st.error(f"Uploaded file is missing one or more required columns: {', '.join(missing_cols)}")
-            else:
-                st.success(f"✅ Uploaded file for {business_type} validated successfully!")
-                st.info(f"{len(df)} records in the uploaded dataset.")
-                st.dataframe(df.head())
-
-                # Simulate further automation logic with the validated data
-                st.info(f"🛠️ Automation Triggered for uploaded data: {trigger} → {action}\n\nMessage: {content}")
-
-                # Example of processing the uploaded data (you can replace with your actual automation logic)
-                st.subheader("Uploaded Data Summary (Example)")
-                st.write(f"Average Duration: {df['duration'].mean():.2f} minutes")
-                st.write(f"Average Data Used: {df['data_used_MB'].mean():.2f} MB")
+        def on_progress(fraction, report):
+            progress.progress(fraction, text=f"{report['rows_read']:,} rows checked, "
+                                             f"{report['rows_appended']:,} imported")
 
+        try:
+            report = import_upload(business_type, uploaded_file, validate_only=validate_only,
+                                   on_progress=on_progress)
         except Exception as e:
             st.error(f"Error processing uploaded file: {e}")
+        else:
+            progress.progress(1.0, text="Done")
+            if report["missing_columns"]:
+                st.error(f"Uploaded file is missing one or more required columns: {', '.join(report['missing_columns'])}")
+            else:
+                new_rows = report["rows_valid"] - report["duplicates_existing"] - report["duplicates_in_file"]
+                cols = st.columns(4)
+                cols[0].metric("Rows read", f"{report['rows_read']:,}")
+                cols[1].metric("Invalid rows", f"{report['rows_invalid'] + report['malformed_lines']:,}")
+                cols[2].metric("Duplicates skipped", f"{report['duplicates_existing'] + report['duplicates_in_file']:,}")
+                cols[3].metric("Would import" if validate_only else "Imported",
+                               f"{new_rows if validate_only else report['rows_appended']:,}")
+                if report["ignored_columns"]:
+                    st.info(f"Ignored unknown columns: {', '.join(report['ignored_columns'])}")
+                if report["errors"]:
+                    st.warning(f"Row errors (first {len(report['errors'])} shown, by line number in the file):")
+                    st.dataframe(pd.DataFrame(report["errors"]))
+                else:
+                    st.success(f"✅ Uploaded file for {business_type} validated successfully!")
+                if new_rows:
+                    st.subheader("Uploaded Data Summary")
+                    st.write(f"Average Duration: {report['duration_sum'] / new_rows:.2f} minutes")
+                    st.write(f"Average Data Used: {report['data_sum'] / new_rows:.2f} MB")
 
     # You might want to display existing data from connection_logs here as well,
     # if so, you would call load_business_data from insights.py.
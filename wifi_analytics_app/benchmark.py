@@ -0,0 +1,292 @@
+# --- benchmark.py ---
+# Headless benchmark of the app's data paths on generated venues of growing
+# size. For every size and stage it reports wall time, peak RSS and
+# throughput. Each (size, stage) pair runs in its own Python process, so
+# caches start cold and one stage's memory never counts against the next.
+# Inputs a stage needs (e.g. the loaded frame for "anomaly") are prepared in
+# that process before the clock starts.
+#
+#   python benchmark.py --sizes 1k,100k,1M --out bench.json
+#   python benchmark.py --sizes 10M --stages load,preprocess --compare bench.json
+#
+# Generated datasets are kept under --data-dir (default: a temp dir) and
+# reused by later runs with the same size and seed.
+import argparse
+import importlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+VENUE = "Restaurant"
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1M": 1_000_000, "10M": 10_000_000}
+DATASET_DAYS = 60  # enough history for the hourly and daily forecasts
+
+# stage -> what the timed section does
+STAGES = {
+    "load": "load_venue_frame (cold cache)",
+    "preprocess": "preprocess_data, including the visitor index build",
+    "segmentation": "KMeans (or streaming MiniBatchKMeans above the streaming threshold)",
+    "anomaly": "IsolationForest fit + predict",
+    "forecast": "hourly and daily ARIMA fits (run_forecasts, one worker)",
+    "rollup": "dashboard rollup build from the raw logs",
+    "dashboard": "Analytics chart construction from the rollup",
+}
+
+
+def parse_size(text):
+    """'100k' -> 100000; plain integers are accepted too."""
+    if text in SIZES:
+        return SIZES[text]
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(text[-1:].lower(), 1)
+    return int(float(text[:-1] if multiplier > 1 else text) * multiplier)
+
+
+def _rss_mb(field):
+    # Linux only; falls back to getrusage (peak only) elsewhere
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def _reset_peak_rss():
+    # Lets peak RSS cover the timed stage only, not its setup
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+# -- datasets -----------------------------------------------------------
+
+def dataset_dir(root, rows, seed):
+    return os.path.join(root, f"rows-{rows}-seed-{seed}")
+
+
+def generate_dataset(rows, root, seed=0):
+    """Write (or reuse) a generated venue log of ``rows`` sessions over DATASET_DAYS days."""
+    import data_generator
+    import storage
+    from data_loader import venue_csv_path
+
+    data_dir = dataset_dir(root, rows, seed)
+    marker = os.path.join(data_dir, "benchmark.json")
+    if os.path.exists(marker):
+        return data_dir
+    os.makedirs(data_dir, exist_ok=True)
+    start = datetime.now() - timedelta(days=DATASET_DAYS)
+    gen = data_generator.TrafficGenerator(VENUE, seed=seed)
+    per_day = -(-rows // DATASET_DAYS)
+    data_generator.write_sessions_csv(gen.stream(rows, batch_size=per_day, start=start, days=1),
+                                      venue_csv_path(VENUE, data_dir))
+    if storage.parquet_available():
+        storage.convert_venue(VENUE, data_dir)
+    with open(marker, "w") as f:
+        json.dump({"venue": VENUE, "rows": rows, "seed": seed, "days": DATASET_DAYS}, f)
+    return data_dir
+
+
+# -- stages (run in the child process) ----------------------------------
+
+def _importing(modules, setup):
+    # The model libraries are imported lazily by the code under test; import
+    # them in setup so the stage times the work, not the first import
+    def run():
+        for name in modules:
+            importlib.import_module(name)
+        return setup()
+    return run
+
+
+def _stage(stage, data_dir):
+    """Returns (setup, timed): setup prepares inputs, timed is the measured call."""
+    import ai_models
+    from data_loader import load_venue_frame
+    from features import load_venue_features
+
+    def features():
+        return load_venue_features(VENUE, columns=ai_models.AI_COLUMNS)
+
+    if stage == "load":
+        return lambda: None, lambda _: load_venue_frame(VENUE, columns=ai_models.AI_COLUMNS)
+    if stage == "preprocess":
+        def setup():
+            shutil.rmtree(os.path.join(data_dir, "visitors"), ignore_errors=True)
+            return load_venue_frame(VENUE, columns=ai_models.AI_COLUMNS)
+        return setup, lambda df: ai_models.preprocess_data(df, VENUE)
+    if stage == "segmentation":
+        def segment(df):
+            if len(df) < ai_models.STREAMING_MIN_ROWS:
+                return ai_models.segment_customers(df, 3, venue=VENUE)
+            features_ = [f for f in ai_models.CLUSTERING_FEATURES if f in df.columns]
+            return ai_models.segment_venue(VENUE, features_, 3, lambda c: ai_models.preprocess_data(c, VENUE),
+                                           columns=ai_models.AI_COLUMNS)
+        return _importing(["sklearn.cluster", "sklearn.preprocessing"], features), segment
+    if stage == "anomaly":
+        return _importing(["sklearn.ensemble"], features), lambda df: ai_models.detect_anomalies(df, venue=VENUE)
+    if stage == "forecast":
+        from forecasting import run_forecasts
+        from rollups import get_rollup
+
+        return (_importing(["statsmodels.tsa.arima.model"], lambda: get_rollup(VENUE)),
+                lambda _: run_forecasts([VENUE], max_workers=1, force=True))
+    if stage == "rollup":
+        from rollups import get_rollup
+
+        def setup():
+            shutil.rmtree(os.path.join(data_dir, "rollups"), ignore_errors=True)
+        return setup, lambda _: get_rollup(VENUE)
+    if stage == "dashboard":
+        from insights import dashboard_figures
+        from rollups import get_rollup
+
+        return lambda: get_rollup(VENUE), dashboard_figures
+    raise ValueError(f"unknown stage {stage!r}")
+
+
+def run_child(stage, data_dir, rows):
+    setup, timed = _stage(stage, data_dir)
+    inputs = setup()
+    rss_before = _rss_mb("VmRSS")
+    reset = _reset_peak_rss()
+    started = time.perf_counter()
+    timed(inputs)
+    wall = time.perf_counter() - started
+    peak = _rss_mb("VmHWM")
+    return {
+        "wall_s": wall,
+        "rows_per_sec": rows / wall if wall > 0 else None,
+        "rss_before_mb": rss_before,
+        "peak_rss_mb": peak,
+        "peak_includes_setup": not reset,
+    }
+
+
+# -- parent -------------------------------------------------------------
+
+def measure(stage, data_dir, rows, timeout=None):
+    """Run one stage in a fresh interpreter; returns its result dict (with ``error`` on failure)."""
+    model_dir = tempfile.mkdtemp(prefix="wifi-bench-models-")
+    env = dict(os.environ, WIFI_DATA_DIR=data_dir, WIFI_MODEL_DIR=model_dir, WIFI_FORECAST_SCHEDULER="0",
+               PYTHONPATH=os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(__file__)),
+                                                        os.environ.get("PYTHONPATH")])))
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", stage, "--child-dir", data_dir,
+           "--child-rows", str(rows)]
+    try:
+        proc = subprocess.run(cmd, env=env, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {"error": f"timed out after {timeout}s"}
+    finally:
+        shutil.rmtree(model_dir, ignore_errors=True)
+    if proc.returncode != 0:
+        tail = (proc.stderr.strip().splitlines() or [f"exit status {proc.returncode}"])[-1]
+        return {"error": f"exit status {proc.returncode}: {tail}"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def run(sizes, stages, root, seed=0, repeat=1, timeout=None, log=print):
+    results = []
+    for rows in sizes:
+        started = time.perf_counter()
+        data_dir = generate_dataset(rows, root, seed)
+        log(f"{rows:>12,} rows  dataset ready in {time.perf_counter() - started:.1f}s ({data_dir})")
+        for stage in stages:
+            runs = [measure(stage, data_dir, rows, timeout) for _ in range(repeat)]
+            ok = [r for r in runs if "error" not in r]
+            if ok:
+                # Median run by wall time
+                result = sorted(ok, key=lambda r: r["wall_s"])[len(ok) // 2]
+                result["wall_s_runs"] = [r["wall_s"] for r in ok]
+            else:
+                result = runs[-1]
+            result = {"rows": rows, "stage": stage, **result}
+            results.append(result)
+            log(_format_row(result))
+    return results
+
+
+def _format_row(result, previous=None):
+    if "error" in result:
+        return f"{result['rows']:>12,}  {result['stage']:<13} ERROR {result['error']}"
+    line = (f"{result['rows']:>12,}  {result['stage']:<13} {result['wall_s']:>9.3f}s "
+            f"{result['peak_rss_mb']:>9.1f} MB  {result['rows_per_sec'] or 0:>14,.0f} rows/s")
+    if previous is not None:
+        if "error" not in previous and previous["wall_s"] > 0:
+            line += f"  ({result['wall_s'] / previous['wall_s']:.2f}x time vs baseline)"
+        else:
+            line += "  (baseline failed)"
+    return line
+
+
+def compare(results, baseline_path, log=print):
+    with open(baseline_path) as f:
+        baseline = {(r["rows"], r["stage"]): r for r in json.load(f)["results"]}
+    log(f"\nCompared with {baseline_path}:")
+    for result in results:
+        previous = baseline.get((result["rows"], result["stage"]))
+        log(_format_row(result, previous) + ("" if previous is not None else "  (not in baseline)"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark load, preprocessing, models and dashboard rendering.")
+    parser.add_argument("--sizes", default=",".join(SIZES),
+                        help=f"Comma-separated row counts, e.g. 1k,250k,1M (default {','.join(SIZES)}).")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Subset of: {', '.join(STAGES)}.")
+    parser.add_argument("--data-dir", default=None, help="Where generated datasets are kept (default: a temp dir).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per stage; the median is reported.")
+    parser.add_argument("--timeout", type=float, default=None, help="Seconds before a stage is abandoned.")
+    parser.add_argument("--out", default=None, help="Write the JSON results to this file.")
+    parser.add_argument("--compare", default=None, help="Earlier --out file to compare against.")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--child-dir", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--child-rows", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_child(args.child, args.child_dir, args.child_rows)))
+        return 0
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(unknown)}")
+    sizes = [parse_size(s.strip()) for s in args.sizes.split(",") if s.strip()]
+    root = args.data_dir or tempfile.mkdtemp(prefix="wifi-bench-")
+
+    results = run(sizes, stages, root, seed=args.seed, repeat=args.repeat, timeout=args.timeout)
+    report = {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "venue": VENUE,
+        "stages": {s: STAGES[s] for s in stages},
+        "data_dir": root,
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+    return 0 if all("error" not in r for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
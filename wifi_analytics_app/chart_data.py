@@ -0,0 +1,132 @@
+# --- chart_data.py ---
+# Reduces data server-side before it reaches plotly or st.dataframe, so a
+# page never ships every row of a large venue to the browser. Pie slices
+# are capped, scatters are downsampled and big tables are paged. (The
+# Analytics histograms are already binned server-side by rollups.py.)
+#
+# Scatter downsampling is either stratified (every group, e.g. a cluster,
+# keeps a share of the points proportional to its size, with a floor so
+# small groups stay visible) or density-aware (a grid over the x/y plane
+# caps the points per cell, so dense regions are thinned while sparse
+# regions and outliers are kept).
+import numpy as np
+import pandas as pd
+
+MAX_SCATTER_POINTS = 5000
+MIN_POINTS_PER_GROUP = 200
+DENSITY_GRID = 64  # cells per axis
+MAX_PIE_SLICES = 8
+PAGE_SIZE = 50
+
+
+def top_slices(counts, max_slices=MAX_PIE_SLICES, other="Other"):
+    """Counts (a Series by label) with everything past the largest ``max_slices - 1`` folded into ``other``."""
+    counts = counts.sort_values(ascending=False)
+    if len(counts) > max_slices:
+        rest = pd.Series([counts.iloc[max_slices - 1:].sum()], index=pd.Index([other], name=counts.index.name))
+        counts = pd.concat([counts.iloc[:max_slices - 1], rest]).rename(counts.name)
+    return counts
+
+
+def _take_ranked(keys, quotas, rng):
+    # Indices of a uniform random subset of each key's rows, quotas[key] rows per key
+    ranks = np.empty(len(keys), dtype="int64")
+    order = np.lexsort((rng.random(len(keys)), keys))
+    sorted_keys = keys[order]
+    starts = np.r_[0, np.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]) + 1]
+    group_start = np.repeat(starts, np.diff(np.r_[starts, len(keys)]))
+    ranks[order] = np.arange(len(keys)) - group_start
+    return np.flatnonzero(ranks < quotas[keys])
+
+
+def _water_fill(counts, budget):
+    """Largest per-cell cap with sum(min(counts, cap)) <= budget."""
+    low, high = 0, int(counts.max()) if len(counts) else 0
+    while low < high:
+        cap = (low + high + 1) // 2
+        if np.minimum(counts, cap).sum() <= budget:
+            low = cap
+        else:
+            high = cap - 1
+    return low
+
+
+def _allocate(sizes, budget, floor=MIN_POINTS_PER_GROUP):
+    # Proportional shares, but never below min(size, floor)
+    sizes = np.asarray(sizes, dtype="int64")
+    share = np.floor(sizes / max(sizes.sum(), 1) * budget).astype("int64")
+    return np.minimum(sizes, np.maximum(share, np.minimum(sizes, floor)))
+
+
+def density_sample(df, x, y, max_points=MAX_SCATTER_POINTS, grid=DENSITY_GRID, seed=0):
+    """Up to ``max_points`` rows, thinning the densest cells of a grid over (x, y) first."""
+    if len(df) <= max_points:
+        return df
+    rng = np.random.default_rng(seed)
+    # No more cells than points, so every occupied cell keeps at least one
+    grid = max(1, min(grid, int(np.sqrt(max_points))))
+    xs = df[x].to_numpy(dtype="float64", na_value=np.nan)
+    ys = df[y].to_numpy(dtype="float64", na_value=np.nan)
+    valid = np.flatnonzero(np.isfinite(xs) & np.isfinite(ys))
+
+    def cell_of(v):
+        low, high = v.min(), v.max()
+        return np.zeros(len(v), dtype="int64") if high == low else \
+            np.minimum(((v - low) / (high - low) * grid).astype("int64"), grid - 1)
+
+    cells = cell_of(xs[valid]) * grid + cell_of(ys[valid])
+    counts = np.bincount(cells, minlength=grid * grid)
+    cap = _water_fill(counts, max_points)
+    quotas = np.full(grid * grid, cap)
+    # Spend what the cap leaves over on random cells that still have points
+    spare = max_points - int(np.minimum(counts, cap).sum())
+    fuller = np.flatnonzero(counts > cap)
+    quotas[rng.choice(fuller, min(spare, len(fuller)), replace=False)] += 1
+    keep = _take_ranked(cells, quotas, rng)
+    return df.iloc[np.sort(valid[keep])]
+
+
+def stratified_sample(df, by, max_points=MAX_SCATTER_POINTS, min_per_group=MIN_POINTS_PER_GROUP, seed=0):
+    """Up to about ``max_points`` rows, each ``by`` group sampled in proportion to its size."""
+    if len(df) <= max_points:
+        return df
+    rng = np.random.default_rng(seed)
+    codes, groups = pd.factorize(df[by], use_na_sentinel=False)
+    quotas = _allocate(np.bincount(codes, minlength=len(groups)), max_points, min_per_group)
+    return df.iloc[np.sort(_take_ranked(codes, quotas, rng))]
+
+
+def downsample_scatter(df, x, y, by=None, max_points=MAX_SCATTER_POINTS, method="stratified", seed=0):
+    """The rows to plot for an x/y scatter of ``df``.
+
+    ``method`` is "stratified" (needs ``by``) or "density". With both a
+    ``by`` column and method "density", each group's proportional share is
+    filled density-aware within that group.
+    """
+    if len(df) <= max_points:
+        return df
+    if method == "stratified" and by is not None:
+        return stratified_sample(df, by, max_points, seed=seed)
+    if method != "density":
+        raise ValueError(f"unknown method {method!r} (stratified needs a 'by' column)")
+    if by is None:
+        return density_sample(df, x, y, max_points, seed=seed)
+    codes, _ = pd.factorize(df[by], use_na_sentinel=False)
+    quotas = _allocate(np.bincount(codes), max_points)
+    parts = [density_sample(df.iloc[np.flatnonzero(codes == i)], x, y, int(q), seed=seed)
+             for i, q in enumerate(quotas)]
+    return pd.concat(parts)
+
+
+def paged_dataframe(df, key, page_size=PAGE_SIZE):
+    """Show one page of ``df`` with a page picker; only that page is sent to the browser."""
+    import streamlit as st
+
+    total = len(df)
+    pages = max(-(-total // page_size), 1)
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, step=1, key=key) \
+        if pages > 1 else 1
+    start = (int(page) - 1) * page_size
+    st.dataframe(df.iloc[start:start + page_size])
+    if pages > 1:
+        st.caption(f"Rows {start + 1:,}–{min(start + page_size, total):,} of {total:,}")
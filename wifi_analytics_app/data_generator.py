@@ -1,6 +1,59 @@
 import random
 from datetime import datetime
-import psycopg2
+
+import numpy as np
+import pandas as pd
+
+from data_loader import CONNECTION_LOG_COLUMNS
+from ingest import get_default_writer
+
+ZONES = ["Entrance", "Checkout", "Display Area", "Seating", "Waiting Area"]
+DEVICE_TYPES = ["Phone", "Tablet", "Laptop", "Smartwatch"]
+OPEN_HOURS = range(8, 21)
+
+# Per-venue traffic shape. hourly/weekday are relative arrival weights,
+# zones/devices are mixes over ZONES/DEVICE_TYPES, dwell is the median
+# session length in minutes and returning the share of repeat devices.
+VENUE_PROFILES = {
+    "Boutique": {
+        "hourly": [3, 6, 5, 5, 6, 7, 8, 6, 5, 6, 5, 3, 2],
+        "weekday": [0.8, 0.8, 0.9, 1.0, 1.3, 1.6, 1.1],
+        "zones": [0.25, 0.20, 0.35, 0.05, 0.15],
+        "devices": [0.65, 0.15, 0.05, 0.15],
+        "dwell": 30, "returning": 0.30,
+    },
+    "Business Cafe": {
+        "hourly": [6, 8, 7, 6, 9, 8, 6, 5, 5, 4, 3, 2, 1],
+        "weekday": [1.2, 1.2, 1.2, 1.2, 1.1, 0.6, 0.4],
+        "zones": [0.10, 0.15, 0.05, 0.60, 0.10],
+        "devices": [0.35, 0.10, 0.50, 0.05],
+        "dwell": 55, "returning": 0.55,
+    },
+    "Hospital": {
+        "hourly": [5, 6, 7, 7, 8, 7, 7, 6, 6, 5, 5, 4, 3],
+        "weekday": [1.1, 1.1, 1.0, 1.0, 1.0, 0.9, 0.8],
+        "zones": [0.15, 0.05, 0.05, 0.20, 0.55],
+        "devices": [0.60, 0.20, 0.10, 0.10],
+        "dwell": 60, "returning": 0.25,
+    },
+    "Restaurant": {
+        "hourly": [2, 2, 3, 5, 9, 9, 5, 3, 3, 6, 8, 8, 5],
+        "weekday": [0.8, 0.8, 0.9, 1.0, 1.3, 1.5, 1.2],
+        "zones": [0.10, 0.15, 0.05, 0.60, 0.10],
+        "devices": [0.70, 0.10, 0.10, 0.10],
+        "dwell": 45, "returning": 0.40,
+    },
+    "Supermarket": {
+        "hourly": [2, 4, 5, 6, 7, 6, 5, 6, 7, 8, 9, 6, 3],
+        "weekday": [0.9, 0.9, 0.9, 1.0, 1.2, 1.5, 1.1],
+        "zones": [0.25, 0.35, 0.25, 0.05, 0.10],
+        "devices": [0.80, 0.05, 0.02, 0.13],
+        "dwell": 20, "returning": 0.45,
+    },
+}
+
+ZONE_SIGNAL_DBM = {"Entrance": -72, "Checkout": -60, "Display Area": -62, "Seating": -55, "Waiting Area": -58}
+DEVICE_DATA_FACTOR = {"Phone": 1.0, "Tablet": 1.4, "Laptop": 2.2, "Smartwatch": 0.3}
 
 def generate_fake_data():
     device_types = ['Android', 'iOS', 'Windows', 'Mac']
@@ -15,18 +68,159 @@ def generate_fake_data():
     return data
 
 def insert_into_postgres(data):
-    conn = psycopg2.connect(
-        host="localhost", database="wifi_analytics", user="your_user", password="your_password"
-    )
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO wifi_logs (timestamp, device_type, location, device_id)
-        VALUES (%s, %s, %s, %s)
-    """, (data['timestamp'], data['device_type'], data['location'], data['device_id']))
-    conn.commit()
-    cur.close()
-    conn.close()
+    # Buffered: the shared ingest writer batches rows into wifi_logs over a
+    # pooled connection (DSN from WIFI_DB_DSN) instead of one connect per row.
+    return get_default_writer().write(data)
+
+class TrafficGenerator:
+    """Vectorised session generator for one venue.
+
+    Each ``batch`` call returns ``n`` sessions in the connection_logs schema
+    (plus a boolean ``returning`` column) spread over ``days`` days from
+    ``start``. Device ids persist across batches: a repeat visit picks an
+    earlier device, skewed toward the oldest ids so a core of regulars
+    emerges, and a device keeps the same device type on every visit.
+    """
+
+    def __init__(self, business_type="Restaurant", seed=None, profile=None):
+        self.business_type = business_type
+        self.profile = profile or VENUE_PROFILES[business_type]
+        self.rng = np.random.default_rng(seed)
+        self.devices_seen = 0
+        hourly = np.asarray(self.profile["hourly"], dtype=float)
+        self._hour_p = hourly / hourly.sum()
+        self._weekday = np.asarray(self.profile["weekday"], dtype=float)
+        self._device_cdf = np.cumsum(self.profile["devices"]) / np.sum(self.profile["devices"])
+        self._zone_p = np.asarray(self.profile["zones"]) / np.sum(self.profile["zones"])
+
+    def _device_ids(self, n):
+        # Rows arrive in time order, so a repeat visit may only pick a device
+        # first seen in an earlier batch or earlier in this one.
+        rng = self.rng
+        returning = rng.random(n) < self.profile["returning"]
+        if self.devices_seen == 0 and n:
+            returning[0] = False
+        is_new = ~returning
+        known = self.devices_seen + np.cumsum(is_new) - is_new
+        ids = known.copy()
+        # u**2 concentrates repeat visits on the earliest (most loyal) devices
+        ids[returning] = (known[returning] * rng.random(int(returning.sum())) ** 2).astype(np.int64)
+        self.devices_seen += int(is_new.sum())
+        return ids, returning
+
+    def _device_types(self, ids):
+        # Stable per device: hash the id onto the venue's device-mix CDF
+        u = ((ids * 2654435761) % 2**32) / 2**32
+        return np.searchsorted(self._device_cdf, u, side="right").clip(0, len(DEVICE_TYPES) - 1)
+
+    def _timestamps(self, n, start, days):
+        rng = self.rng
+        first_day = pd.Timestamp(start).normalize()
+        day_weights = self._weekday[(first_day.dayofweek + np.arange(days)) % 7]
+        day = rng.choice(days, size=n, p=day_weights / day_weights.sum())
+        hour = rng.choice(np.asarray(OPEN_HOURS), size=n, p=self._hour_p)
+        minute = rng.integers(0, 60, size=n)
+        offsets = (day * 1440 + hour * 60 + minute).astype("timedelta64[m]")
+        return np.sort(first_day.to_datetime64() + offsets)
+
+    def batch(self, n, start=None, days=1):
+        rng = self.rng
+        start = start if start is not None else datetime.now()
+        timestamps = self._timestamps(n, start, days)
+        ids, returning = self._device_ids(n)
+        device_idx = self._device_types(ids)
+        zone_idx = rng.choice(len(ZONES), size=n, p=self._zone_p)
+
+        session = np.clip(rng.lognormal(np.log(self.profile["dwell"]), 0.5, n), 1, 120).round()
+        duration = np.clip((session * rng.beta(2, 2, n)).round(), 1, 60)
+        signal_mean = np.asarray([ZONE_SIGNAL_DBM[z] for z in ZONES])[zone_idx]
+        signal = np.clip(rng.normal(signal_mean, 9.0), -90, -30).astype(np.float32)
+        data_factor = np.asarray([DEVICE_DATA_FACTOR[d] for d in DEVICE_TYPES])[device_idx]
+        data_used = np.clip(
+            rng.lognormal(np.log(3.0), 0.7, n) * session * data_factor, 10, 1000
+        ).astype(np.float32)
+        hours = pd.DatetimeIndex(timestamps).hour.to_numpy()
+        peak_hour = (hours + (rng.random(n) * session / 60).astype(int)) % 24
+
+        return pd.DataFrame({
+            "device_id": np.char.add("D", (1000 + ids).astype(str)),
+            "timestamp": timestamps,
+            "duration_minutes": duration.astype(np.int64),
+            "business_type": pd.Categorical.from_codes(np.zeros(n, dtype=np.int8), [self.business_type]),
+            "zone": pd.Categorical.from_codes(zone_idx, ZONES),
+            "device_type": pd.Categorical.from_codes(device_idx, DEVICE_TYPES),
+            "signal_strength_dBm": signal,
+            "data_used_MB": data_used,
+            "session_duration_minutes": session.astype(np.int64),
+            "peak_usage_hour": peak_hour.astype(np.int64),
+            "returning": returning,
+        })
+
+    def stream(self, total, batch_size=100_000, start=None, days=1):
+        """Yield batches totalling ``total`` rows, each covering its own ``days`` window."""
+        start = pd.Timestamp(start if start is not None else datetime.now()).normalize()
+        emitted = 0
+        while emitted < total:
+            n = min(batch_size, total - emitted)
+            yield self.batch(n, start=start, days=days)
+            emitted += n
+            start += pd.Timedelta(days=days)
+
+
+def write_sessions_csv(batches, path):
+    """Append batches to a connection_logs-style CSV, writing the header once."""
+    rows = 0
+    for i, df in enumerate(batches):
+        df[CONNECTION_LOG_COLUMNS].to_csv(
+            path, mode="w" if i == 0 else "a", header=i == 0, index=False,
+            date_format="%Y-%m-%d %H:%M:%S",
+        )
+        rows += len(df)
+    return rows
+
+
+def write_sessions_parquet(batches, path):
+    """Write batches to a parquet file (requires pyarrow)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    rows = 0
+    try:
+        for df in batches:
+            table = pa.Table.from_pandas(df[CONNECTION_LOG_COLUMNS], preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+            rows += len(df)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def sessions_to_events(df):
+    """Map generated sessions onto wifi_logs rows for the ingest path."""
+    return [
+        {"timestamp": ts, "device_id": dev, "device_type": dtype, "location": venue,
+         "returning": bool(ret), "dwell_time": int(dwell)}
+        for ts, dev, dtype, venue, ret, dwell in zip(
+            df["timestamp"].dt.to_pydatetime(), df["device_id"], df["device_type"].astype(str),
+            df["business_type"].astype(str), df["returning"], df["session_duration_minutes"],
+        )
+    ]
+
+
+def write_sessions_ingest(batches, writer=None):
+    writer = writer or get_default_writer()
+    rows = 0
+    for df in batches:
+        rows += writer.write_many(sessions_to_events(df))
+    writer.flush()
+    return rows
 
 # Example usage
-data = generate_fake_data()
-insert_into_postgres(data)
+if __name__ == "__main__":
+    data = generate_fake_data()
+    insert_into_postgres(data)
+    get_default_writer().flush()
@@ -0,0 +1,361 @@
+# --- data_loader.py ---
+# Shared, cached loader for the venue CSVs in connection_logs/.
+# Each file is parsed once with explicit dtypes and kept in a process-wide
+# LRU cache that is invalidated when the file's mtime or size changes.
+# Splash sign-ins logged under connection_logs/sessions/<venue>/ (see
+# session_log.py) are read together with the venue's own log.
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+DATA_DIR = os.environ.get(
+    "WIFI_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "connection_logs")
+)
+
+# Upper bound on the memory held by cached frames (MB, overridable per deployment)
+CACHE_MAX_BYTES = int(os.environ.get("WIFI_DATA_CACHE_MB", "512")) * 1024 * 1024
+
+# Column order of the files in connection_logs/
+CONNECTION_LOG_COLUMNS = [
+    "device_id", "timestamp", "duration_minutes", "business_type", "zone", "device_type",
+    "signal_strength_dBm", "data_used_MB", "session_duration_minutes", "peak_usage_hour",
+]
+
+CSV_DTYPES = {
+    "device_id": "object",
+    "business_type": "category",
+    "zone": "category",
+    "device_type": "category",
+    "signal_strength_dBm": "float32",
+    "data_used_MB": "float32",
+}
+
+
+def venue_slug(business_type):
+    # "Business Cafe" and "business_cafe" both map to the same file
+    return business_type.strip().lower().replace(" ", "_")
+
+
+def venue_csv_path(business_type, data_dir=None):
+    return os.path.join(data_dir or DATA_DIR, f"{venue_slug(business_type)}.csv")
+
+
+def list_venues(data_dir=None):
+    data_dir = data_dir or DATA_DIR
+    if not os.path.isdir(data_dir):
+        return []
+    return sorted(name[:-4] for name in os.listdir(data_dir) if name.endswith(".csv"))
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+# Guest contact details stay in the session log; analytics frames never carry them
+SIGNIN_PRIVATE_COLUMNS = ("email", "phone")
+
+
+def session_segment_paths(business_type, data_dir=None):
+    """Sign-in log segments written by session_log for a venue, oldest first."""
+    folder = os.path.join(data_dir or DATA_DIR, "sessions", venue_slug(business_type))
+    try:
+        names = sorted(os.listdir(folder))
+    except FileNotFoundError:
+        return []
+    return [os.path.join(folder, name) for name in names if name.endswith(".csv")]
+
+
+def _segments_signature(business_type, data_dir=None):
+    return tuple((os.path.basename(path), *file_signature(path))
+                 for path in session_segment_paths(business_type, data_dir))
+
+
+def read_session_segments(business_type, columns=None, start=None, end=None, data_dir=None):
+    """Typed frame of a venue's sign-ins (same filters as load_venue_frame), or None if there are none."""
+    frames = []
+    for path in session_segment_paths(business_type, data_dir):
+        with open(path, "rb") as f:
+            data = f.read()
+        # Stop at the last complete line; the writer may be mid-append
+        data = data[:data.rfind(b"\n") + 1]
+        if data.count(b"\n") > 1:
+            frames.append(_read_csv_subset(io.BytesIO(data), columns, start, end))
+    if not frames:
+        return None
+    df = pd.concat(frames, ignore_index=True)
+    return df.drop(columns=[c for c in SIGNIN_PRIVATE_COLUMNS if c in df.columns])
+
+
+def concat_venue_frames(frames):
+    """Concatenate venue frames, keeping the categorical columns categorical."""
+    frames = [f for f in frames if f is not None]
+    if not frames:
+        return pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0]
+    df = pd.concat(frames, ignore_index=True)
+    for col, dtype in CSV_DTYPES.items():
+        if dtype == "category" and col in df.columns and df[col].dtype != "category":
+            df[col] = df[col].astype("category")
+    return df
+
+
+def venue_data_signature(business_type, data_dir=None):
+    """Changes whenever the venue's log or its sign-in segments change.
+
+    Raises FileNotFoundError if the venue has neither.
+    """
+    import storage
+
+    segments = _segments_signature(business_type, data_dir)
+    try:
+        return storage.venue_signature(business_type, data_dir), segments
+    except FileNotFoundError:
+        if not segments:
+            raise
+        return None, segments
+
+
+def _parse_timestamps(df):
+    if "timestamp" in df.columns:
+        df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
+    return df
+
+
+def read_venue_csv(path, **kwargs):
+    return _parse_timestamps(pd.read_csv(path, dtype=CSV_DTYPES, **kwargs))
+
+
+def iter_venue_csv(path, chunksize, **kwargs):
+    """Yield typed chunks of a venue CSV, for files too big to parse at once."""
+    with pd.read_csv(path, dtype=CSV_DTYPES, chunksize=chunksize, **kwargs) as reader:
+        for chunk in reader:
+            yield _parse_timestamps(chunk)
+
+
+def _holds_python_objects(series):
+    return pd.api.types.is_object_dtype(series.dtype) or getattr(series.dtype, "storage", None) == "python"
+
+
+def frame_nbytes(df, sample=1000):
+    """Memory held by ``df``, with the strings in object columns (e.g. device_id) included.
+
+    memory_usage(deep=True) visits every Python object; the string payload
+    is instead estimated from ``sample`` evenly spaced rows per column.
+    """
+    nbytes = int(df.memory_usage(index=True, deep=False).sum())
+    for name in df.columns:
+        series = df[name]
+        if not len(series) or not _holds_python_objects(series):
+            continue
+        part = series.iloc[::max(len(series) // sample, 1)]
+        per_row = (part.memory_usage(index=False, deep=True) - part.memory_usage(index=False, deep=False)) / len(part)
+        nbytes += int(per_row * len(series))
+    return nbytes
+
+
+class FrameCache:
+    """Thread-safe LRU of DataFrames bounded by total memory."""
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (signature, frame, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, signature):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != signature:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, signature, frame):
+        nbytes = frame_nbytes(frame)
+        with self._lock:
+            self._discard(key)
+            if nbytes > self.max_bytes:
+                # Too big to cache at all; the caller still gets its frame
+                return frame
+            self._entries[key] = (signature, frame, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+        return frame
+
+    def get_or_load(self, key, signature, loader):
+        frame = self.get(key, signature)
+        if frame is None:
+            frame = self.put(key, signature, loader())
+        return frame
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._bytes = 0
+            else:
+                self._discard(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+
+_cache = FrameCache()
+
+
+def get_cache():
+    return _cache
+
+
+def peek_venue(business_type, n=5, data_dir=None):
+    """First ``n`` rows of a venue, for previews and column checks, without a full read."""
+    path = venue_csv_path(business_type, data_dir)
+    if os.path.exists(path):
+        return read_venue_csv(path, nrows=n)
+    import storage
+
+    return storage.head_venue(business_type, n, data_dir)
+
+
+def iter_venue_frames(business_type, columns=None, chunk_rows=500_000, data_dir=None):
+    """Stream a venue in chunks (bypassing the cache) for out-of-core processing."""
+    import storage
+
+    if storage.venue_exists(business_type, data_dir):
+        if storage.parquet_available():
+            yield from storage.iter_venue(business_type, columns, chunk_rows, data_dir)
+        else:
+            wanted = set(columns) if columns is not None else None
+            yield from iter_venue_csv(
+                venue_csv_path(business_type, data_dir), chunk_rows,
+                usecols=(lambda name: name in wanted) if wanted is not None else None,
+            )
+    elif not session_segment_paths(business_type, data_dir):
+        raise FileNotFoundError(venue_csv_path(business_type, data_dir))
+    signins = read_session_segments(business_type, columns, data_dir=data_dir)
+    if signins is not None and len(signins):
+        yield signins
+
+
+def _read_csv_subset(path, columns=None, start=None, end=None):
+    # CSV fallback for when pyarrow is unavailable: same projection and
+    # time-range semantics as storage.read_venue, just without pushdown.
+    wanted = None
+    if columns is not None:
+        wanted = set(columns)
+        if start is not None or end is not None:
+            wanted.add("timestamp")
+    df = read_venue_csv(path, usecols=(lambda name: name in wanted) if wanted is not None else None)
+    if start is not None:
+        df = df[df["timestamp"] >= pd.Timestamp(start)]
+    if end is not None:
+        df = df[df["timestamp"] < pd.Timestamp(end)]
+    if columns is not None:
+        df = df[[name for name in df.columns if name in set(columns)]]
+    return df.reset_index(drop=True)
+
+
+def venue_source(business_type, columns=None, start=None, end=None, data_dir=None):
+    """(cache key, signature, loader) for a venue read; see load_venue_frame."""
+    import storage
+
+    signature = venue_data_signature(business_type, data_dir)
+    columns = tuple(sorted(columns)) if columns is not None else None
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+    path = venue_csv_path(business_type, data_dir)
+
+    if signature[0] is None:
+        key = ("signins", path, columns, start, end)
+        read_log = lambda: None
+    elif storage.parquet_available():
+        key = ("parquet", path, columns, start, end)
+        read_log = lambda: storage.read_venue(business_type, columns, start, end, data_dir)
+    else:
+        key = ("csv", path, columns, start, end)
+        read_log = lambda: _read_csv_subset(path, columns, start, end)
+
+    def loader():
+        signins = read_session_segments(business_type, columns, start, end, data_dir) if signature[1] else None
+        return concat_venue_frames([read_log(), signins])
+    return key, signature, loader
+
+
+def venue_row_count(business_type, data_dir=None):
+    """Sessions in a venue (log plus sign-ins) without loading them.
+
+    Parquet venues are counted from file metadata; CSV-only venues from
+    their rollup, which is maintained incrementally anyway.
+    """
+    import storage
+
+    if storage.parquet_available() and storage.venue_exists(business_type, data_dir):
+        signins = sum(max(_count_lines(path) - 1, 0) for path in session_segment_paths(business_type, data_dir))
+        return storage.count_rows(business_type, data_dir) + signins
+    from rollups import get_rollup
+
+    return get_rollup(business_type, data_dir).rows
+
+
+def _count_lines(path):
+    with open(path, "rb") as f:
+        return sum(block.count(b"\n") for block in iter(lambda: f.read(1 << 20), b""))
+
+
+def load_venue_sample(business_type, rows, columns=None, data_dir=None, seed=0):
+    """A uniform random sample of about ``rows`` sessions, streamed so the venue is never held whole.
+
+    Cached like load_venue_frame until the venue's data changes.
+    """
+    signature = venue_data_signature(business_type, data_dir)
+    key = ("sample", venue_csv_path(business_type, data_dir),
+           tuple(sorted(columns)) if columns is not None else None, rows, seed)
+
+    def sample():
+        import numpy as np
+
+        fraction = min(1.0, rows / max(venue_row_count(business_type, data_dir), 1))
+        rng = np.random.default_rng(seed)
+        parts = [chunk[rng.random(len(chunk)) < fraction]
+                 for chunk in iter_venue_frames(business_type, columns, data_dir=data_dir)]
+        return concat_venue_frames(parts).reset_index(drop=True)
+
+    return _cache.get_or_load(key, signature, sample).copy(deep=False)
+
+
+def load_venue_frame(business_type, columns=None, start=None, end=None, data_dir=None):
+    """Return the typed frame for a venue, reading storage only when it changed.
+
+    ``columns`` lists the columns a view needs (missing ones are skipped) and
+    ``start``/``end`` bound ``timestamp``, end exclusive. Reads go through the
+    parquet dataset when pyarrow is installed and straight to the CSV otherwise.
+
+    Raises FileNotFoundError if the venue has no logs. The returned frame is a
+    shallow copy, so callers may add or rename columns freely without touching
+    the cached original.
+    """
+    key, signature, loader = venue_source(business_type, columns, start, end, data_dir)
+    return _cache.get_or_load(key, signature, loader).copy(deep=False)
@@ -0,0 +1,83 @@
+# --- features.py ---
+# Derived columns shared by the AI pipeline and the dashboards: duration
+# (renamed from session_duration_minutes), hour_of_day, day_of_week,
+# is_weekend, frequent_visitor and returning. Everything is computed once per
+# frame with vectorised pandas/numpy operations, and load_venue_features
+# keeps the result in the data_loader cache next to the raw venue frames,
+# so a rerun of a Streamlit view reuses it instead of deriving it again.
+import numpy as np
+import pandas as pd
+
+from data_loader import get_cache, venue_source
+from metrics import timed
+from visitor_index import index_for_frame
+
+DERIVED_COLUMNS = ["duration", "hour_of_day", "day_of_week", "is_weekend", "frequent_visitor", "returning"]
+
+# Accepted spellings of a frequent_visitor flag in partner exports; anything else is 0
+_FLAG_VALUES = {"yes": 1, "true": 1, "1": 1, "1.0": 1, "y": 1}
+
+
+def normalize_columns(df):
+    """Rename session_duration_minutes to duration (without touching ``df``)."""
+    if "session_duration_minutes" in df.columns and "duration" not in df.columns:
+        return df.rename(columns={"session_duration_minutes": "duration"})
+    return df
+
+
+def flag_values(values):
+    """0/1 int8 array for a column of yes/no, true/false or 0/1 values."""
+    # Map each distinct value once instead of lower-casing every row
+    codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=True)
+    lookup = [_FLAG_VALUES.get(str(u).strip().lower(), 0) for u in uniques]
+    return np.array(lookup + [0], dtype="int8")[codes]  # code -1 (missing) -> 0
+
+
+@timed("preprocess")
+def add_features(df, venue=None, data_dir=None):
+    """Return a shallow copy of ``df`` with the DERIVED_COLUMNS it can derive.
+
+    ``df`` is never modified and columns it already has are kept as they
+    are, so calling this on an already-featured frame costs nothing. The
+    time columns need ``timestamp`` and ``frequent_visitor`` is always
+    present. ``returning`` is only added when the visitor flags are derived,
+    i.e. when ``df`` has device_id and timestamp but no frequent_visitor
+    column; they come from ``venue``'s visitor index (under ``data_dir``)
+    when given, otherwise from an index built over ``df`` alone.
+    """
+    out = normalize_columns(df).copy(deep=False)
+    if "timestamp" in out.columns and "hour_of_day" not in out.columns:
+        ts = out["timestamp"]
+        if not pd.api.types.is_datetime64_any_dtype(ts):
+            ts = out["timestamp"] = pd.to_datetime(ts, errors="coerce")
+        out["hour_of_day"] = ts.dt.hour
+        out["day_of_week"] = ts.dt.dayofweek
+        out["is_weekend"] = (out["day_of_week"] >= 5).astype("int8")
+    if "frequent_visitor" in out.columns:
+        if not pd.api.types.is_integer_dtype(out["frequent_visitor"]):
+            out["frequent_visitor"] = flag_values(out["frequent_visitor"])
+    elif "device_id" in out.columns and "timestamp" in out.columns:
+        # From each device's visit history, not from this frame alone
+        out["returning"], out["frequent_visitor"] = index_for_frame(out, venue, data_dir).session_flags(
+            out["device_id"].to_numpy(dtype=object), out["timestamp"])
+    else:
+        out["frequent_visitor"] = np.zeros(len(out), dtype="int8")
+    return out
+
+
+def load_venue_features(business_type, columns=None, start=None, end=None, data_dir=None):
+    """load_venue_frame plus the derived columns, cached until the venue's data changes.
+
+    Takes the same arguments as load_venue_frame and returns a shallow copy,
+    so callers may add columns without touching the cached frame. Raises
+    FileNotFoundError if the venue has no logs.
+    """
+    key, signature, loader = venue_source(business_type, columns, start, end, data_dir)
+    cache = get_cache()
+
+    def derive():
+        # Build on the raw frame if it is cached, so both entries share its columns
+        raw = cache.get(key, signature)
+        return add_features(raw if raw is not None else loader(), business_type, data_dir)
+
+    return cache.get_or_load(("features",) + key, signature, derive).copy(deep=False)
@@ -0,0 +1,283 @@
+# --- forecasting.py ---
+# Precomputed session forecasts for every venue, at hourly and daily
+# granularity. Connection counts come from the dashboard rollups (see
+# rollups.py), so building a series never rescans the raw logs. Each
+# (venue, granularity) model is fitted in a process pool, warm-started from
+# the previous fit's parameters, and the forecast is stored with its
+# prediction interval under connection_logs/forecasts/<venue>.pkl. The
+# dashboard only reads those files.
+#
+#   python forecasting.py run                 # refit everything once (cron)
+#   python forecasting.py serve --interval 3600
+import argparse
+import multiprocessing
+import os
+import pickle
+import sys
+import threading
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import pandas as pd
+
+from data_loader import DATA_DIR, file_signature, list_venues, venue_slug
+from model_registry import fingerprint
+from rollups import get_rollup
+
+GRANULARITIES = {
+    # Hourly: AR(1)/MA(1) with a daily seasonal AR term on the last 8 weeks
+    "hourly": {"freq": "h", "order": (1, 0, 1), "seasonal_order": (1, 0, 0, 24),
+               "horizon": 48, "history": 24 * 56, "min_history": 24 * 3},
+    "daily": {"freq": "D", "order": (1, 1, 1), "seasonal_order": (0, 0, 0, 0),
+              "horizon": 7, "history": 365, "min_history": 8},
+}
+INTERVAL_ALPHA = 0.05  # 95% prediction interval
+CHART_HISTORY = 3  # horizons of history kept next to each forecast for charts
+
+FORECAST_INTERVAL = float(os.environ.get("WIFI_FORECAST_INTERVAL", "3600"))
+MAX_WORKERS = int(os.environ.get("WIFI_FORECAST_WORKERS", "0")) or None
+
+
+def forecast_dir(data_dir=None):
+    return os.path.join(data_dir or DATA_DIR, "forecasts")
+
+
+def _forecast_path(business_type, data_dir=None):
+    return os.path.join(forecast_dir(data_dir), f"{venue_slug(business_type)}.pkl")
+
+
+def venue_series(business_type, granularity, data_dir=None):
+    """Completed-period session counts for a venue up to now, with empty periods as 0.
+
+    The series always ends at the last completed period, even when the logs
+    stop earlier, so the forecast starts at the current period rather than
+    where the venue's data happens to end.
+    """
+    spec = GRANULARITIES[granularity]
+    rollup = get_rollup(business_type, data_dir)
+    if rollup.hourly is None or rollup.hourly.empty:
+        return pd.Series(dtype="float64", name="sessions")
+    series = rollup.hourly["sessions"].resample(spec["freq"]).sum().astype("float64")
+    now = pd.Timestamp.now().floor(spec["freq"])
+    # The last `history` completed periods (the running one is left out), from the first log line on
+    index = pd.date_range(end=now, periods=spec["history"] + 1, freq=spec["freq"])[:-1]
+    index = index[index >= series.index[0]]
+    return series.reindex(index, fill_value=0.0).rename("sessions")
+
+
+def fit_forecast(series, granularity, start_params=None):
+    """Fit one model and forecast its horizon; runs in a pool worker."""
+    from statsmodels.tsa.arima.model import ARIMA
+
+    spec = GRANULARITIES[granularity]
+    started = time.perf_counter()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        model = ARIMA(series, order=spec["order"], seasonal_order=spec["seasonal_order"])
+        # param_names, not start_params: computing start values is itself a fit that can warn
+        warm = start_params is not None and len(start_params) == len(model.param_names)
+        result = model.fit(start_params=start_params) if warm else model.fit()
+        prediction = result.get_forecast(spec["horizon"])
+        interval = prediction.conf_int(alpha=INTERVAL_ALPHA)
+    forecast = pd.DataFrame({
+        "forecast": prediction.predicted_mean.to_numpy(),
+        "lower": interval.iloc[:, 0].to_numpy(),
+        "upper": interval.iloc[:, 1].to_numpy(),
+    }, index=prediction.predicted_mean.index.rename("timestamp")).clip(lower=0)
+    return {
+        "forecast": forecast,
+        "params": result.params.to_numpy(),
+        "aic": float(result.aic),
+        "warm_started": warm,
+        "fit_seconds": time.perf_counter() - started,
+    }
+
+
+_read_cache = {}
+_read_lock = threading.Lock()
+
+
+def load_forecasts(business_type, data_dir=None):
+    """Stored forecasts for a venue: {granularity: record}, or {} if none yet."""
+    path = _forecast_path(business_type, data_dir)
+    try:
+        signature = file_signature(path)
+    except FileNotFoundError:
+        return {}
+    with _read_lock:
+        cached = _read_cache.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+    try:
+        with open(path, "rb") as f:
+            records = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return {}
+    with _read_lock:
+        _read_cache[path] = (signature, records)
+    return records
+
+
+def _save_forecasts(business_type, records, data_dir=None):
+    path = _forecast_path(business_type, data_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "wb") as f:
+        pickle.dump(records, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def _plan(venues, granularities, data_dir, force):
+    # Which (venue, granularity) pairs need a fit, with their series and warm-start params
+    jobs, skipped = [], []
+    for venue in venues:
+        previous = load_forecasts(venue, data_dir)
+        for granularity in granularities:
+            spec = GRANULARITIES[granularity]
+            series = venue_series(venue, granularity, data_dir)
+            record = previous.get(granularity) or {}
+            if len(series) < spec["min_history"]:
+                skipped.append((venue, granularity, f"Not enough history for a {granularity} forecast "
+                                                    f"({len(series)} of {spec['min_history']} periods)."))
+                continue
+            if not series.any():
+                skipped.append((venue, granularity, f"No sessions in the last {len(series)} "
+                                                    f"{'hours' if granularity == 'hourly' else 'days'}; "
+                                                    f"nothing to forecast from."))
+                continue
+            data_fp = fingerprint(series)
+            if not force and record.get("fingerprint") == data_fp and record.get("forecast") is not None:
+                continue  # nothing new since the last fit
+            jobs.append((venue, granularity, series, data_fp, record.get("params")))
+    return jobs, skipped
+
+
+def run_forecasts(venues=None, granularities=tuple(GRANULARITIES), data_dir=None,
+                  max_workers=MAX_WORKERS, force=False):
+    """Refit every venue/granularity whose counts changed; returns one status dict per job.
+
+    A failed fit keeps the previous forecast and records the error next to it.
+    """
+    venues = list(venues) if venues is not None else list_venues(data_dir)
+    jobs, skipped = _plan(venues, granularities, data_dir, force)
+    outcomes = {}
+    if jobs:
+        workers = min(max_workers or os.cpu_count() or 1, len(jobs))
+        if workers == 1:
+            for venue, granularity, series, _, params in jobs:
+                try:
+                    outcomes[(venue, granularity)] = fit_forecast(series, granularity, params)
+                except Exception as e:
+                    outcomes[(venue, granularity)] = e
+        else:
+            # spawn, not fork: the Streamlit server is multi-threaded
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                futures = {pool.submit(fit_forecast, series, granularity, params): (venue, granularity)
+                           for venue, granularity, series, _, params in jobs}
+                for future in as_completed(futures):
+                    try:
+                        outcomes[futures[future]] = future.result()
+                    except Exception as e:
+                        outcomes[futures[future]] = e
+
+    status = []
+    now = datetime.now()
+    by_venue = {}
+    for venue, granularity, series, data_fp, _ in jobs:
+        by_venue.setdefault(venue, []).append((granularity, series, data_fp, outcomes[(venue, granularity)]))
+    for venue, granularity, message in skipped:
+        by_venue.setdefault(venue, []).append((granularity, None, None, message))
+    for venue, updates in by_venue.items():
+        records = dict(load_forecasts(venue, data_dir))
+        for granularity, series, data_fp, outcome in updates:
+            record = dict(records.get(granularity) or {})
+            if isinstance(outcome, dict):
+                horizon = GRANULARITIES[granularity]["horizon"]
+                record.update(outcome, fingerprint=data_fp, fitted_at=now, error=None,
+                              history=series.iloc[-CHART_HISTORY * horizon:])
+                status.append({"venue": venue, "granularity": granularity, "status": "fitted",
+                               "fit_seconds": outcome["fit_seconds"], "warm_started": outcome["warm_started"]})
+            else:
+                error = outcome if isinstance(outcome, str) else f"{type(outcome).__name__}: {outcome}"
+                record["error"] = error
+                status.append({"venue": venue, "granularity": granularity, "status": "error", "error": error})
+            records[granularity] = record
+        _save_forecasts(venue, records, data_dir)
+    return status
+
+
+class ForecastScheduler:
+    """Background thread that calls run_forecasts every ``interval`` seconds."""
+
+    def __init__(self, interval=FORECAST_INTERVAL, **run_kwargs):
+        self.interval = interval
+        self.run_kwargs = run_kwargs
+        self.last_run = None
+        self.last_status = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="forecast-scheduler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.last_status = run_forecasts(**self.run_kwargs)
+            except Exception as e:
+                self.last_status = [{"status": "error", "error": f"{type(e).__name__}: {e}"}]
+            self.last_run = datetime.now()
+            self._stop.wait(self.interval)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_forecast_scheduler():
+    """Process-wide scheduler, unless WIFI_FORECAST_SCHEDULER=0 (forecasts refreshed by cron)."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None and os.environ.get("WIFI_FORECAST_SCHEDULER", "1") != "0":
+            _scheduler = ForecastScheduler().start()
+        return _scheduler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit and store session forecasts for every venue.")
+    parser.add_argument("command", choices=["run", "serve"])
+    parser.add_argument("venues", nargs="*", help="Venue names (default: all in the data directory).")
+    parser.add_argument("--granularity", choices=list(GRANULARITIES), action="append",
+                        help="Repeatable; default hourly and daily.")
+    parser.add_argument("--interval", type=float, default=FORECAST_INTERVAL, help="Seconds between runs for serve.")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--force", action="store_true", help="Refit even if the counts did not change.")
+    parser.add_argument("--data-dir", default=None)
+    args = parser.parse_args(argv)
+
+    kwargs = {"venues": args.venues or None, "granularities": tuple(args.granularity or GRANULARITIES),
+              "data_dir": args.data_dir, "max_workers": args.workers}
+    while True:
+        for row in run_forecasts(force=args.force, **kwargs):
+            detail = (f"{row['fit_seconds']:.2f}s{' warm' if row['warm_started'] else ''}"
+                      if row["status"] == "fitted" else row["error"])
+            print(f"{row['venue']:<15} {row['granularity']:<7} {row['status']:<7} {detail}")
+        if args.command == "run":
+            return 0
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
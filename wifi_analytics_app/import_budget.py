@@ -0,0 +1,126 @@
+# --- import_budget.py ---
+# Import-time budgets for the app's entry paths. Every guest sign-in and
+# every new server process pays the imports of app.py, so the heavy
+# analytics stacks must only load when an admin opens the matching tab.
+# Each path is imported in a fresh interpreter after streamlit itself (which
+# every path pays anyway). The script paths also run app.py's top level
+# through Streamlit's AppTest, as a page load does, and must not start the
+# background threads that load models. The check fails if a path takes
+# longer than its budget, loads a module it must not or starts such a thread.
+#
+#   python import_budget.py              # exit status 1 if a budget is exceeded
+#   python import_budget.py --json
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+
+HEAVY = ["numpy", "pandas", "pyarrow", "sklearn", "statsmodels", "plotly.express", "requests"]
+MODELS = ["sklearn", "statsmodels"]
+PAGE = [m for m in HEAVY if m != "numpy"]  # st.image on the login page loads numpy itself
+BACKGROUND = ["anomaly-"]  # thread name prefixes no page load may start
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+
+def app_imports(path=APP):
+    """Modules app.py imports at module level, i.e. on every script run."""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            modules.append(node.module)
+    return [m for m in dict.fromkeys(modules) if m != "streamlit"]
+
+
+# path -> (modules imported, or the session state app.py runs with; seconds on top of
+# `import streamlit`; modules that must stay unloaded)
+BUDGETS = {
+    "guest sign-in (app.py top level)": (app_imports(), 0.3, HEAVY),
+    "login page (app.py script run)": ({}, 1.0, PAGE),
+    "guest splash page (app.py script run)": ({"role": "guest"}, 1.0, PAGE),
+    "Analytics tab": (["insights"], 1.5, MODELS),
+    "AI Insights tab": (["ai_models"], 1.5, MODELS),
+    "Automation tab": (["automation"], 1.5, MODELS + ["plotly.express"]),
+}
+REPEAT = 3  # best of, to keep scheduler noise out
+
+_CHILD = """
+import json, sys, time
+import streamlit
+started = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+seconds = time.perf_counter() - started
+print(json.dumps({{"seconds": seconds, "loaded": [m for m in {forbidden!r} if m in sys.modules]}}))
+"""
+
+_CHILD_SCRIPT = """
+import json, sys, threading, time
+import streamlit
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file({app!r}, default_timeout=60)
+for key, value in {state!r}.items():
+    app.session_state[key] = value
+started = time.perf_counter()
+app.run()
+seconds = time.perf_counter() - started
+if app.exception:
+    sys.exit(str(app.exception[0].value))
+loaded = [m for m in {forbidden!r} if m in sys.modules]
+loaded += [t.name for t in threading.enumerate() if t.name.startswith(tuple({background!r}))]
+print(json.dumps({{"seconds": seconds, "loaded": loaded}}))
+"""
+
+
+def measure(modules, forbidden, repeat=REPEAT):
+    """Best-of-``repeat`` import time of ``modules`` (after streamlit) and any forbidden modules loaded.
+
+    A dict instead of a module list runs app.py with that session state and
+    also reports the background threads it started.
+    """
+    if isinstance(modules, dict):
+        child = _CHILD_SCRIPT.format(app=APP, state=modules, forbidden=forbidden, background=BACKGROUND)
+    else:
+        child = _CHILD.format(modules=modules, forbidden=forbidden)
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [here, os.environ.get("PYTHONPATH")])))
+    runs = []
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, "-c", child],
+                              env=env, cwd=here, capture_output=True, text=True, check=True)
+        runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    return min(r["seconds"] for r in runs), sorted(set().union(*(r["loaded"] for r in runs)))
+
+
+def check(budgets=BUDGETS, repeat=REPEAT):
+    results = []
+    for path, (modules, budget, forbidden) in budgets.items():
+        seconds, loaded = measure(modules, forbidden, repeat)
+        results.append({"path": path, "seconds": seconds, "budget": budget, "forbidden_loaded": loaded,
+                        "ok": seconds <= budget and not loaded})
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check import-time budgets of the app's entry paths.")
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    args = parser.parse_args(argv)
+
+    results = check(repeat=args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            extra = f"  loads {', '.join(r['forbidden_loaded'])}" if r["forbidden_loaded"] else ""
+            print(f"{'ok  ' if r['ok'] else 'FAIL'} {r['path']:<40} {r['seconds']:6.2f}s / {r['budget']:.2f}s{extra}")
+    return 0 if all(r["ok"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
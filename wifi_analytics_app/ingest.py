@@ -0,0 +1,417 @@
+# --- ingest.py ---
+# Batched, pooled ingestion into the wifi_logs table (see schema.sql), and
+# the same writer for other append-only tables such as anomaly_alerts.
+# Events are buffered in a bounded queue and flushed by a background thread
+# when either batch_size rows are waiting or flush_interval seconds pass.
+# Postgres batches go through COPY FROM STDIN (or execute_values); a SQLite
+# or DuckDB database can stand in for local runs with a "sqlite:///path.db"
+# or "duckdb:///path.duckdb" DSN.
+import atexit
+import csv
+import io
+import logging
+import os
+import queue
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+WIFI_LOG_COLUMNS = (
+    "timestamp", "device_id", "device_type", "location", "first_visit",
+    "returning", "dwell_time", "email", "phone",
+)
+
+DEFAULT_DSN = os.environ.get(
+    "WIFI_DB_DSN", "host=localhost dbname=wifi_analytics user=your_user password=your_password"
+)
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.sql")
+
+
+def local_schema(dialect, path=SCHEMA_PATH):
+    """schema.sql rewritten for the SQLite or DuckDB stand-in, so the three can't drift apart.
+
+    SQLite has no SERIAL; DuckDB has no SERIAL/AUTOINCREMENT and relies on
+    min/max zone maps rather than indexes for range scans, so it skips both.
+    """
+    with open(path, encoding="utf-8") as f:
+        sql = re.sub(r"--[^\n]*", "", f.read())
+    sql = sql.replace("CREATE TABLE ", "CREATE TABLE IF NOT EXISTS ")
+    sql = sql.replace("CREATE INDEX ", "CREATE INDEX IF NOT EXISTS ")
+    if dialect == "sqlite":
+        return sql.replace("SERIAL PRIMARY KEY", "INTEGER PRIMARY KEY AUTOINCREMENT")
+    if dialect == "duckdb":
+        sql = re.sub(r"\s*\w+ SERIAL PRIMARY KEY,", "", sql)
+        return re.sub(r"CREATE INDEX [^;]*;", "", sql)
+    raise ValueError(f"No local schema for {dialect!r}")
+
+
+class PostgresPool:
+    dialect = "postgres"
+
+    def __init__(self, dsn, minconn=1, maxconn=4):
+        from psycopg2.pool import ThreadedConnectionPool
+
+        self._pool = ThreadedConnectionPool(minconn, maxconn, dsn)
+
+    def getconn(self):
+        return self._pool.getconn()
+
+    def putconn(self, conn, close=False):
+        self._pool.putconn(conn, close=close)
+
+    def closeall(self):
+        self._pool.closeall()
+
+
+class SQLitePool:
+    """One shared connection per database file, serialised by a lock.
+
+    SQLite allows a single writer at a time anyway, so a real pool buys
+    nothing; this keeps the PostgresPool interface for local runs and tests.
+    """
+
+    dialect = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES)
+        self._conn.executescript(local_schema("sqlite"))
+        self._lock = threading.Lock()
+
+    def getconn(self):
+        self._lock.acquire()
+        return self._conn
+
+    def putconn(self, conn, close=False):
+        self._lock.release()
+
+    def closeall(self):
+        self._conn.close()
+
+
+class DuckDBPool(SQLitePool):
+    """Local DuckDB file with the same interface, for analytics-heavy local runs and tests."""
+
+    dialect = "duckdb"
+
+    def __init__(self, path):
+        import duckdb
+
+        self.path = path
+        self._conn = duckdb.connect(path)
+        self._conn.execute(local_schema("duckdb"))
+        self._lock = threading.Lock()
+
+
+def create_pool(dsn=None, minconn=1, maxconn=4):
+    dsn = dsn or DEFAULT_DSN
+    if dsn.startswith("sqlite:///"):
+        return SQLitePool(dsn[len("sqlite:///"):])
+    if dsn.startswith("duckdb:///"):
+        return DuckDBPool(dsn[len("duckdb:///"):])
+    return PostgresPool(dsn, minconn, maxconn)
+
+
+def _column_list(columns):
+    # "returning" is a reserved word in both Postgres and SQLite, so quote every name
+    return ", ".join(f'"{col}"' for col in columns)
+
+
+COLUMN_LIST = _column_list(WIFI_LOG_COLUMNS)
+
+
+def normalize_event(event, columns=WIFI_LOG_COLUMNS):
+    row = tuple(event.get(col) for col in columns)
+    if row[0] is None:
+        # The first column is the event time (timestamp / detected_at)
+        row = (datetime.now(),) + row[1:]
+    return row
+
+
+def _copy_rows(conn, rows, table="wifi_logs", columns=WIFI_LOG_COLUMNS):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        # In COPY's csv format an unquoted empty field is NULL
+        writer.writerow("" if v is None else v for v in row)
+    buf.seek(0)
+    with conn.cursor() as cur:
+        cur.copy_expert(f"COPY {table} ({_column_list(columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+
+
+def _execute_values(conn, rows, table="wifi_logs", columns=WIFI_LOG_COLUMNS):
+    from psycopg2.extras import execute_values
+
+    with conn.cursor() as cur:
+        execute_values(
+            cur, f"INSERT INTO {table} ({_column_list(columns)}) VALUES %s", rows, page_size=1000
+        )
+
+
+def _sqlite_insert(conn, rows, table="wifi_logs", columns=WIFI_LOG_COLUMNS):
+    placeholders = ", ".join("?" for _ in columns)
+    conn.executemany(f"INSERT INTO {table} ({_column_list(columns)}) VALUES ({placeholders})", rows)
+
+
+def _duckdb_insert(conn, rows, table="wifi_logs", columns=WIFI_LOG_COLUMNS):
+    # DuckDB's executemany runs one statement per row; a registered frame goes in as one scan
+    import pandas as pd
+
+    conn.register("_ingest_batch", pd.DataFrame.from_records(rows, columns=list(columns)))
+    try:
+        conn.execute(f"INSERT INTO {table} ({_column_list(columns)}) SELECT {_column_list(columns)} FROM _ingest_batch")
+    finally:
+        conn.unregister("_ingest_batch")
+
+
+class _Control:
+    # Queued alongside rows to ask the writer thread to flush or stop
+    __slots__ = ("stop", "done")
+
+    def __init__(self, stop=False):
+        self.stop = stop
+        self.done = threading.Event()
+
+
+class IngestWriter:
+    """Buffers wifi_logs events and writes them in batches from one thread.
+
+    ``write`` blocks once ``max_pending`` events are queued (backpressure)
+    and returns False if ``timeout`` expires first. Failed batches are
+    retried with exponential backoff; after ``max_retries`` they are dropped
+    and counted in ``stats()["rows_failed"]``. ``table`` and ``columns``
+    select another append-only table; events are dicts keyed by column.
+    ``enrich(event)``, if given, fills derived fields on the writer thread
+    just before the batch is written, so ``write`` never waits on it.
+    """
+
+    def __init__(self, pool, batch_size=5000, flush_interval=1.0, max_pending=100_000,
+                 max_retries=5, retry_backoff=0.2, method="copy", table="wifi_logs",
+                 columns=WIFI_LOG_COLUMNS, enrich=None):
+        self.pool = pool
+        self.enrich = enrich
+        self.table = table
+        self.columns = tuple(columns)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        if pool.dialect == "duckdb":
+            self._insert = _duckdb_insert
+        elif pool.dialect == "sqlite":
+            self._insert = _sqlite_insert
+        else:
+            self._insert = _copy_rows if method == "copy" else _execute_values
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._drain_lock = threading.Lock()
+        self._recent = deque()  # (flush end time, rows) over the last RATE_WINDOW seconds
+        self._counters = {
+            "rows_written": 0, "rows_failed": 0, "rows_rejected": 0,
+            "flushes": 0, "retries": 0, "enrich_failed": 0, "flush_ms_total": 0.0,
+            "last_flush_ms": 0.0, "max_flush_ms": 0.0,
+        }
+        self._started_at = None
+
+    RATE_WINDOW = 60.0
+
+    def start(self):
+        if self._thread is None:
+            self._started_at = time.monotonic()
+            self._thread = threading.Thread(target=self._run, name=f"ingest-{self.table}", daemon=True)
+            self._thread.start()
+        return self
+
+    def write(self, event, timeout=None):
+        try:
+            # A copy, so the caller may reuse its dict; rows are built on the writer thread
+            self._queue.put(dict(event), timeout=timeout)
+            return True
+        except queue.Full:
+            with self._lock:
+                self._counters["rows_rejected"] += 1
+            return False
+
+    def write_many(self, events, timeout=None):
+        return sum(self.write(event, timeout) for event in events)
+
+    def flush(self, timeout=None):
+        """Block until everything queued before this call has been written.
+
+        Without a running writer thread (never started, or closed) the queue
+        is written from the calling thread instead. Returns False if
+        ``timeout`` expires first.
+        """
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            self._drain()
+            return True
+        control = _Control()
+        self._queue.put(control)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # Poll, so a writer stopped by a concurrent close() can't leave us waiting forever
+        while not control.done.wait(0.5 if deadline is None else max(0.0, min(0.5, deadline - time.monotonic()))):
+            if not thread.is_alive():
+                self._drain()
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+        return True
+
+    def close(self, timeout=None):
+        if self._thread is not None:
+            self._queue.put(_Control(stop=True))
+            self._thread.join(timeout)
+            if not self._thread.is_alive():
+                # Rows queued behind the stop request
+                self._drain()
+            self._thread = None
+
+    def _drain(self):
+        # Write whatever is queued from the calling thread; pending flush requests are answered
+        with self._drain_lock:
+            batch = []
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if isinstance(item, _Control):
+                    item.done.set()
+                    continue
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    self._flush(batch)
+                    batch = []
+            self._flush(batch)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            counters = dict(self._counters)
+            while self._recent and now - self._recent[0][0] > self.RATE_WINDOW:
+                self._recent.popleft()
+            recent_rows = sum(n for _, n in self._recent)
+        window = min(self.RATE_WINDOW, now - self._started_at) if self._started_at else 0
+        counters["rows_per_sec"] = recent_rows / window if window > 0 else 0.0
+        counters["avg_flush_ms"] = counters["flush_ms_total"] / counters["flushes"] if counters["flushes"] else 0.0
+        counters["pending"] = self._queue.qsize()
+        return counters
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+            if isinstance(item, _Control):
+                self._flush(batch)
+                batch = []
+                item.done.set()
+                if item.stop:
+                    return
+            elif item is not None:
+                batch.append(item)
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._flush(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _rows(self, events):
+        failed = 0
+        rows = []
+        for event in events:
+            if self.enrich is not None:
+                try:
+                    event = self.enrich(event)
+                except Exception:
+                    if not failed:
+                        logger.exception("Enriching a %s event failed; writing it as is", self.table)
+                    failed += 1
+            rows.append(normalize_event(event, self.columns))
+        if failed:
+            with self._lock:
+                self._counters["enrich_failed"] += failed
+        return rows
+
+    def _flush(self, events):
+        if not events:
+            return
+        started = time.perf_counter()
+        rows = self._rows(events)
+        for attempt in range(self.max_retries + 1):
+            conn = self.pool.getconn()
+            broken = False
+            try:
+                self._insert(conn, rows, self.table, self.columns)
+                conn.commit()
+                break
+            except Exception as e:
+                broken = True
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+                if attempt == self.max_retries:
+                    logger.error("Dropping %d %s rows after %d retries: %s", len(rows), self.table, attempt, e)
+                    with self._lock:
+                        self._counters["rows_failed"] += len(rows)
+                    get_metrics().record("db_write", time.perf_counter() - started, len(rows), True,
+                                         table=self.table)
+                    return
+                with self._lock:
+                    self._counters["retries"] += 1
+                logger.warning("%s flush failed (attempt %d): %s", self.table, attempt + 1, e)
+            finally:
+                self.pool.putconn(conn, close=broken and self.pool.dialect == "postgres")
+            time.sleep(self.retry_backoff * (2 ** attempt) * (0.5 + random.random()))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        get_metrics().record("db_write", elapsed_ms / 1000, len(rows), table=self.table)
+        with self._lock:
+            c = self._counters
+            c["rows_written"] += len(rows)
+            c["flushes"] += 1
+            c["flush_ms_total"] += elapsed_ms
+            c["last_flush_ms"] = elapsed_ms
+            c["max_flush_ms"] = max(c["max_flush_ms"], elapsed_ms)
+            self._recent.append((time.monotonic(), len(rows)))
+
+
+_default_writer = None
+_default_lock = threading.Lock()
+
+
+def _live_event(event):
+    # Default writer's enrich step, on its writer thread: visitor flags, then
+    # a non-blocking hand-off to the live anomaly scorer
+    from anomaly_service import score_live_session
+    from visitor_index import annotate_event
+
+    event = annotate_event(event)
+    score_live_session(event)
+    return event
+
+
+def get_default_writer():
+    """Process-wide writer on WIFI_DB_DSN, started on first use and flushed at exit.
+
+    Every event is also queued for the live anomaly scorer.
+    """
+    global _default_writer
+    with _default_lock:
+        if _default_writer is None:
+            _default_writer = IngestWriter(create_pool(), enrich=_live_event).start()
+            atexit.register(_default_writer.close)
+        return _default_writer
@@ -1,22 +1,26 @@
 # --- insights.py ---
-import os
 import pandas as pd
 import streamlit as st
 import plotly.express as px
 
-def load_business_data(business_type):
-    current_dir = os.path.dirname(__file__)
-    data_dir = os.path.join(current_dir, "connection_logs")
+import storage
+import rollups
+from data_loader import load_venue_frame, peek_venue, venue_csv_path
+from chart_data import top_slices
+from features import normalize_columns
+from metrics import timed, track
 
-    formatted_business_type = business_type.lower().replace(" ", "_")
-    file_name = f"{formatted_business_type}.csv"
-    file_path = os.path.join(data_dir, file_name)
+def load_business_data(business_type, columns=None, start=None, end=None):
+    file_path = venue_csv_path(business_type)
 
     #st.write(f"Attempting to load: {file_path}")
 
-    if os.path.exists(file_path):
+    if storage.venue_exists(business_type):
         try:
-            return pd.read_csv(file_path)
+            with track("load", venue=business_type) as t:
+                df = load_venue_frame(business_type, columns=columns, start=start, end=end)
+                t.rows = len(df)
+            return df
         except Exception as e:
             st.error(f"🚫 Error reading CSV file {file_path}: {e}")
             return None
@@ -24,19 +28,111 @@ def load_business_data(business_type):
         st.error(f"🚫 File not found: {file_path}. Please ensure it exists in your 'connection_logs' directory and the naming convention is correct.")
         return None
 
+def peek_business_data(business_type):
+    # Preview rows only; the charts come from rollups
+    if not storage.venue_exists(business_type):
+        st.error(f"🚫 File not found: {venue_csv_path(business_type)}. Please ensure it exists in your 'connection_logs' directory and the naming convention is correct.")
+        return None
+    try:
+        return peek_venue(business_type)
+    except Exception as e:
+        st.error(f"🚫 Error reading data for {business_type}: {e}")
+        return None
+
+def select_date_range(rollup):
+    # Day bounds come from the rollup's hourly index, so no rows are read here
+    days = rollup.days()
+    if len(days) < 2:
+        return None, None
+    picked = st.date_input("Date range", value=(days[0], days[-1]), min_value=days[0], max_value=days[-1])
+    if len(picked) != 2:
+        return None, None
+    return pd.Timestamp(picked[0]), pd.Timestamp(picked[1]) + pd.Timedelta(days=1)
+
+def bar_from_bins(bins, title, x_label):
+    # Contiguous bars over the fixed rollup bins, labelled by their lower edge
+    fig = px.bar(bins, x="bin_start", y="count", title=title, labels={"bin_start": x_label, "count": "Sessions"})
+    fig.update_traces(width=float(bins["bin_end"].iloc[0] - bins["bin_start"].iloc[0]), offset=0)
+    fig.update_layout(bargap=0)
+    return fig
+
+@timed("charts")
+def dashboard_figures(rollup, start=None, end=None):
+    # Every chart below is drawn from the hourly rollup, not the raw rows
+    figures = []
+
+    # Time-based histogram
+    by_hour = rollup.sessions_by_hour_of_day(start, end).reset_index()
+    figures.append(px.bar(by_hour, x="hour", y="sessions", title="Connections by Hour"))
+
+    # Device type distribution pie chart
+    devices = top_slices(rollup.device_counts(start, end)).reset_index()
+    figures.append(px.pie(devices, names="device_type", values="sessions", title="Device Type Distribution"))
+
+    # Session duration (session_duration_minutes) and the other metrics
+    for metric, title in [("duration", "Session Duration Distribution (minutes)"),
+                          ("signal_strength_dBm", "Signal Strength Distribution (dBm)"),
+                          ("data_used_MB", "Data Used Distribution (MB)"),
+                          ("peak_usage_hour", "Peak Usage Hour Distribution")]:
+        figures.append(bar_from_bins(rollup.histogram(metric, start, end), title, metric))
+    return figures
+
+def database_dashboard():
+    # Live sessions from wifi_logs; every number below is aggregated in the database
+    from query_layer import GRANULARITIES, get_query_layer
+
+    try:
+        layer = get_query_layer()
+        locations = layer.locations()
+    except Exception as e:
+        st.error(f"🚫 Could not query wifi_logs: {e}")
+        return
+    if not locations:
+        st.warning("No sessions in wifi_logs yet.")
+        return
+    location = st.selectbox("Select Location", locations)
+    first, last = layer.time_bounds(location)
+    picked = st.date_input("Date range", value=(first.date(), last.date()), min_value=first.date(), max_value=last.date())
+    start, end = (pd.Timestamp(picked[0]), pd.Timestamp(picked[1]) + pd.Timedelta(days=1)) if len(picked) == 2 else (None, None)
+
+    summary = layer.summary(location, start, end)
+    st.success(f"{summary['sessions']} sessions for {location} in wifi_logs")
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Sessions", f"{summary['sessions']:,}")
+    col2.metric("Unique Devices", f"{summary['devices']:,}")
+    col3.metric("Avg. Dwell (min)", f"{summary['avg_dwell_minutes'] or 0:.1f}")
+    col4.metric("Returning (%)", f"{(summary['returning_share'] or 0) * 100:.0f}")
+
+    granularity = st.radio("Sessions per", GRANULARITIES, index=1, horizontal=True)
+    over_time = layer.sessions_over_time(location, start, end, granularity).reset_index()
+    st.plotly_chart(px.line(over_time, x="bucket", y=["sessions", "devices"], title=f"Sessions per {granularity.title()}"))
+
+    by_hour = layer.sessions_by_hour_of_day(location, start, end).reset_index()
+    st.plotly_chart(px.bar(by_hour, x="hour", y="sessions", title="Connections by Hour"))
+
+    devices = top_slices(layer.device_counts(location, start, end)).reset_index()
+    st.plotly_chart(px.pie(devices, names="device_type", values="sessions", title="Device Type Distribution"))
+
+    dwell = layer.dwell_histogram(location, start, end)
+    if len(dwell):
+        st.plotly_chart(bar_from_bins(dwell, "Dwell Time Distribution (minutes)", "dwell_time"))
+
 def analytics_dashboard():
     st.title("📊 WiFi Usage Analytics")
+    from query_layer import db_configured
+
+    if db_configured() and st.radio("Source", ["Log files", "Database (wifi_logs)"], horizontal=True) != "Log files":
+        database_dashboard()
+        return
     business_type = st.selectbox(
         "Select Business Type",
         ["Boutique", "Business Cafe", "Hospital", "Restaurant", "Supermarket"]
     )
-    df = load_business_data(business_type)
+    df = peek_business_data(business_type)
 
     if df is not None:
-        # Check for expected duration column and rename if necessary
-        if 'session_duration_minutes' in df.columns and 'duration' not in df.columns:
-            df.rename(columns={'session_duration_minutes': 'duration'}, inplace=True)
-            #st.info("Renamed 'session_duration_minutes' to 'duration' for compatibility.")
+        # Same duration naming as the AI pipeline (session_duration_minutes -> duration)
+        df = normalize_columns(df)
 
         # Define all required columns, including the 'duration' column (now potentially renamed)
         required_columns_for_dashboard = {"timestamp", "device_type", "duration"}
@@ -48,35 +144,21 @@ def analytics_dashboard():
             st.error(f"Uploaded file is missing one or more required columns: {', '.join(missing_cols)}")
             return
 
-        st.success(f"Loaded {len(df)} records for {business_type}")
+        with track("rollup", venue=business_type):
+            rollup = rollups.get_rollup(business_type)
+        start, end = select_date_range(rollup)
+        st.success(f"Loaded {rollup.total_sessions(start, end)} records for {business_type}")
         st.dataframe(df.head())
 
-        # Time-based histogram
-        df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-        if 'hour' not in df:
-            df['hour'] = df['timestamp'].dt.hour
-        fig = px.histogram(df, x="hour", nbins=24, title="Connections by Hour")
-        st.plotly_chart(fig)
-
-        # Device type distribution pie chart
-        fig = px.pie(df, names="device_type", title="Device Type Distribution")
-        st.plotly_chart(fig)
-
-        # Add a histogram for the 'duration' (session_duration_minutes)
-        if 'duration' in df.columns:
-            fig_duration = px.histogram(df, x="duration", title="Session Duration Distribution (minutes)")
-            st.plotly_chart(fig_duration)
-
-        # You can add charts for your other new metrics here
-        if 'signal_strength_dBm' in df.columns:
-            fig_signal = px.histogram(df, x="signal_strength_dBm", title="Signal Strength Distribution (dBm)")
-            st.plotly_chart(fig_signal)
-        if 'data_used_MB' in df.columns:
-            fig_data_used = px.histogram(df, x="data_used_MB", title="Data Used Distribution (MB)")
-            st.plotly_chart(fig_data_used)
-        if 'peak_usage_hour' in df.columns:
-            fig_peak_hour = px.histogram(df, x="peak_usage_hour", nbins=24, title="Peak Usage Hour Distribution")
-            st.plotly_chart(fig_peak_hour)
+        means = rollup.means(start, end)
+        if means:
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Avg. Session (min)", f"{means.get('duration', 0):.1f}")
+            col2.metric("Avg. Signal (dBm)", f"{means.get('signal_strength_dBm', 0):.1f}")
+            col3.metric("Avg. Data Used (MB)", f"{means.get('data_used_MB', 0):.1f}")
+
+        for fig in dashboard_figures(rollup, start, end):
+            st.plotly_chart(fig)
 
     else:
         st.warning("No data to display or file not found.")
@@ -0,0 +1,155 @@
+# --- load_test.py ---
+# Replays synthetic venue traffic at a fixed rate and measures how ingest and
+# dashboard reads hold up. The rate is either absolute (--rate rows/s) or a
+# multiple of the venue's current volume as measured from connection_logs.
+#
+#   python load_test.py --venue Restaurant --multiplier 100 --sink csv --seconds 60
+#   python load_test.py --rate 20000 --sink ingest --dsn sqlite:///loadtest.db
+#   python load_test.py --venue Hospital --rate 5000 --score   # + online anomaly scoring
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import data_generator
+import storage
+from data_loader import load_venue_frame
+
+
+def baseline_rate(business_type, data_dir=None):
+    """Sessions per second the venue sees today, from its logged time span."""
+    ts = load_venue_frame(business_type, columns=["timestamp"], data_dir=data_dir)["timestamp"].dropna()
+    span = (ts.max() - ts.min()).total_seconds() if len(ts) > 1 else 0
+    return len(ts) / span if span > 0 else 0.0
+
+
+def probe_dashboard(business_type, data_dir):
+    # What an Analytics page render costs: load plus the per-hour aggregation
+    started = time.perf_counter()
+    df = load_venue_frame(business_type, columns=["timestamp", "device_type"], data_dir=data_dir)
+    df["timestamp"].dt.hour.value_counts()
+    df["device_type"].value_counts()
+    return (time.perf_counter() - started) * 1000, len(df)
+
+
+def _percentiles(values):
+    if not values:
+        return {}
+    arr = np.asarray(values)
+    return {f"p{q}": float(np.percentile(arr, q)) for q in (50, 95, 99)} | {"max": float(arr.max())}
+
+
+def run(business_type, rate, seconds, sink, data_dir, dsn=None, tick=0.1, probe_every=1.0, seed=None,
+        score=False):
+    gen = data_generator.TrafficGenerator(business_type, seed=seed)
+    writer = None
+    if sink == "ingest":
+        from ingest import IngestWriter, create_pool
+
+        writer = IngestWriter(create_pool(dsn)).start()
+    scorer = None
+    if score:
+        from anomaly_service import AnomalyScorer
+        from ingest import create_pool
+
+        scorer = AnomalyScorer(create_pool(dsn) if dsn else None).start()
+        scorer.warm([business_type])
+
+    sent = 0
+    append_ms = []
+    probe_ms = []
+    lag_s = 0.0
+    started = time.monotonic()
+    next_probe = started + probe_every
+    while True:
+        now = time.monotonic()
+        elapsed = now - started
+        if elapsed >= seconds:
+            break
+        due = int(rate * elapsed) - sent
+        if due > 0:
+            batch = gen.batch(due)
+            batch["timestamp"] = pd.Timestamp.now().floor("s")
+            t0 = time.perf_counter()
+            if sink == "ingest":
+                writer.write_many(data_generator.sessions_to_events(batch))
+            else:
+                storage.append_frame(
+                    business_type, batch[data_generator.CONNECTION_LOG_COLUMNS],
+                    data_dir=data_dir, create=sink,
+                )
+            append_ms.append((time.perf_counter() - t0) * 1000)
+            # Emit time minus schedule for the batch's oldest row, which fell due at (sent + 1) / rate
+            lag_s = max(lag_s, time.monotonic() - (started + (sent + 1) / rate))
+            if scorer is not None:
+                scorer.submit_many(batch.to_dict("records"))
+            sent += due
+        if sink != "ingest" and now >= next_probe and sent:
+            probe_ms.append(probe_dashboard(business_type, data_dir)[0])
+            next_probe = now + probe_every
+        time.sleep(tick)
+
+    report = {
+        "venue": business_type,
+        "sink": sink,
+        "target_rows_per_sec": rate,
+        "seconds": seconds,
+        "rows_sent": sent,
+        "achieved_rows_per_sec": sent / seconds,
+        "max_schedule_lag_s": lag_s,
+        "append_ms": _percentiles(append_ms),
+        "dashboard_ms": _percentiles(probe_ms),
+    }
+    if writer is not None:
+        writer.flush()
+        report["ingest"] = writer.stats()
+        writer.close()
+    if scorer is not None:
+        scorer.flush()
+        report["anomaly"] = scorer.stats()
+        scorer.close()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay synthetic WiFi traffic and measure latency.")
+    parser.add_argument("--venue", default="Restaurant", choices=sorted(data_generator.VENUE_PROFILES))
+    rate = parser.add_mutually_exclusive_group()
+    rate.add_argument("--rate", type=float, help="Target sessions per second.")
+    rate.add_argument("--multiplier", type=float, default=10.0,
+                      help="Multiple of the venue's current volume in connection_logs (default 10).")
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--sink", choices=["csv", "parquet", "ingest"], default="csv")
+    parser.add_argument("--data-dir", default=None,
+                        help="Scratch log directory for csv/parquet sinks (default: a temp dir).")
+    parser.add_argument("--dsn", default=None, help="Database for the ingest sink (default WIFI_DB_DSN).")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--score", action="store_true",
+                        help="Also score every session with the online anomaly scorer (alerts go to --dsn if set).")
+    parser.add_argument("--out", default=None, help="Also write the JSON report to this file.")
+    args = parser.parse_args(argv)
+
+    rate_per_sec = args.rate
+    if rate_per_sec is None:
+        rate_per_sec = baseline_rate(args.venue) * args.multiplier
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="wifi-loadtest-")
+    os.makedirs(data_dir, exist_ok=True)
+
+    report = run(args.venue, rate_per_sec, args.seconds, args.sink, data_dir, dsn=args.dsn, seed=args.seed,
+                 score=args.score)
+    report["data_dir"] = data_dir
+    text = json.dumps(report, indent=2, default=str)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
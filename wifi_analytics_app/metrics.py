@@ -0,0 +1,316 @@
+# --- metrics.py ---
+# In-process metrics for the app's hot paths: how long each stage took
+# (data load, preprocessing, every ai_* view, chart building, DB writes) and
+# how many rows it handled. Timings go into histograms with fixed buckets,
+# for Prometheus, plus a ring buffer of recent samples for p50/p95/p99.
+# Recording one sample is a lock and a few array writes, so it is safe on
+# every request.
+#
+#   with track("load", venue=business_type) as t:
+#       df = ...
+#       t.rows = len(df)
+#
+#   @timed("ai_churn_prediction")      # rows = len() of the first DataFrame argument
+#   def ai_churn_prediction(df, ...): ...
+#
+# The admin "Performance" tab shows the numbers; set WIFI_METRICS_PORT to
+# also serve them as Prometheus text on http://<host>:<port>/metrics.
+#
+# Standard library only: the guest sign-in path records metrics too, and
+# must not pay for numpy/pandas imports.
+import bisect
+import functools
+import os
+import threading
+import time
+
+# Upper bounds in seconds; the last bucket (+Inf) is implicit
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+RECENT_SAMPLES = 1024  # per series, for the percentiles
+QUANTILES = (50, 95, 99)
+PREFIX = "wifi_"
+
+SUMMARY_FIELDS = ["calls", "errors", "total_s", "mean_ms", *(f"p{q}_ms" for q in QUANTILES), "max_ms",
+                  "rows", "rows_per_sec"]
+
+HELP = {
+    "stage_seconds": "Time spent in each instrumented stage.",
+    "stage_rows_total": "Rows handled by each instrumented stage.",
+    "stage_errors_total": "Calls of each instrumented stage that raised.",
+    "stage_seconds_recent": "Percentiles of each stage's time over its recent calls.",
+}
+
+
+class Histogram:
+    """Cumulative bucket counts plus the last ``samples`` observations."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS, samples=RECENT_SAMPLES):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._recent = [0.0] * samples
+        self._pos = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        self._recent[self._pos % len(self._recent)] = value
+        self._pos += 1
+
+    def recent(self):
+        return sorted(self._recent[:min(self._pos, len(self._recent))])
+
+
+def percentile(ordered, q):
+    """Linear-interpolated percentile (like numpy's default) of an already sorted list."""
+    if not ordered:
+        return 0.0
+    position = (len(ordered) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+class _Tracker:
+    # What ``track`` yields; set ``rows`` to count the rows the stage handled
+    __slots__ = ("rows",)
+
+    def __init__(self):
+        self.rows = None
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+class MetricsRegistry:
+    """Thread-safe histograms and counters keyed by (name, labels)."""
+
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def record(self, stage, seconds, rows=None, error=False, **labels):
+        """One finished call of ``stage``."""
+        self.observe("stage_seconds", seconds, stage=stage, **labels)
+        if rows is not None:
+            self.inc("stage_rows_total", rows, stage=stage, **labels)
+        if error:
+            self.inc("stage_errors_total", 1, stage=stage, **labels)
+
+    def track(self, stage, **labels):
+        return _Track(self, stage, labels)
+
+    def timed(self, stage=None, **labels):
+        """Decorator form of ``track``; rows are the length of the first DataFrame argument."""
+        def decorate(fn):
+            name = stage or fn.__name__
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                rows = next((len(a) for a in args if hasattr(a, "columns") and hasattr(a, "__len__")), None)
+                started = time.perf_counter()
+                error = True
+                try:
+                    result = fn(*args, **kwargs)
+                    error = False
+                    return result
+                finally:
+                    self.record(name, time.perf_counter() - started, rows, error, **labels)
+            return wrapper
+        return decorate
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self.started_at = time.time()
+
+    def summary(self):
+        """One dict per (stage, labels): calls, timings in ms, percentiles, rows and rows/s."""
+        with self._lock:
+            histograms = [(labels, h.count, h.sum, h.max, h.recent())
+                          for (name, labels), h in self._histograms.items() if name == "stage_seconds"]
+            counters = dict(self._counters)
+        rows = []
+        for labels, count, total, slowest, recent in histograms:
+            row = dict(labels)
+            processed = counters.get(("stage_rows_total", labels))
+            row.update({
+                "calls": count,
+                "errors": counters.get(("stage_errors_total", labels), 0),
+                "total_s": total,
+                "mean_ms": total / count * 1000 if count else 0.0,
+                **{f"p{q}_ms": percentile(recent, q) * 1000 for q in QUANTILES},
+                "max_ms": slowest * 1000,
+                "rows": processed,
+                "rows_per_sec": processed / total if processed and total > 0 else None,
+            })
+            rows.append(row)
+        return sorted(rows, key=lambda r: r["total_s"], reverse=True)
+
+    def prometheus_text(self):
+        """Everything in the Prometheus text exposition format."""
+        with self._lock:
+            histograms = [(name, labels, h.buckets, list(h.counts), h.count, h.sum, h.recent())
+                          for (name, labels), h in sorted(self._histograms.items())]
+            counters = sorted(self._counters.items())
+        lines = []
+        typed = set()
+
+        def header(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# HELP {PREFIX}{name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+        for name, labels, buckets, counts, count, total, recent in histograms:
+            header(name, "histogram")
+            cumulative = 0
+            for bound, n in zip([*buckets, "+Inf"], counts):
+                cumulative += n
+                lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels, le=bound)} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {count}")
+        for name, labels, _, _, _, _, recent in histograms:
+            if len(recent):
+                header(f"{name}_recent", "gauge")
+                for q in QUANTILES:
+                    lines.append(f"{PREFIX}{name}_recent{_format_labels(labels, quantile=q / 100)} "
+                                 f"{percentile(recent, q)}")
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{PREFIX}{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels, **extra):
+    pairs = list(labels) + [(k, str(v)) for k, v in extra.items()]
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class _Track:
+    def __init__(self, registry, stage, labels):
+        self.registry = registry
+        self.stage = stage
+        self.labels = labels
+        self.tracker = _Tracker()
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self.tracker
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.record(self.stage, time.perf_counter() - self.started, self.tracker.rows,
+                             exc_type is not None, **self.labels)
+        return False
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics():
+    return _registry
+
+
+def track(stage, **labels):
+    """``with track(stage, **labels) as t: ...`` on the process-wide registry."""
+    return _registry.track(stage, **labels)
+
+
+def timed(stage=None, **labels):
+    return _registry.timed(stage, **labels)
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def start_exporter(port=None):
+    """Serve /metrics on ``port`` (default WIFI_METRICS_PORT) from a daemon thread; once per process."""
+    global _exporter
+    port = port or int(os.environ.get("WIFI_METRICS_PORT", "0"))
+    if not port:
+        return None
+    with _exporter_lock:
+        if _exporter is None:
+            from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split("?")[0] != "/metrics":
+                        self.send_error(404)
+                        return
+                    body = _registry.prometheus_text().encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            _exporter = ThreadingHTTPServer(("", port), Handler)
+            threading.Thread(target=_exporter.serve_forever, name="metrics-exporter", daemon=True).start()
+        return _exporter
+
+
+def performance_dashboard():
+    import pandas as pd
+    import streamlit as st
+
+    from data_loader import get_cache
+
+    st.title("⏱️ Performance")
+    registry = get_metrics()
+    summary = registry.summary()
+    st.caption(f"Collected in this server process since {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(registry.started_at))}. "
+               f"Percentiles cover the last {RECENT_SAMPLES} calls of each stage.")
+    if not summary:
+        st.info("No timings recorded yet. Open the Analytics or AI Insights tab to collect some.")
+    else:
+        table = pd.DataFrame(summary)
+        labels = sorted(c for c in table.columns if c not in SUMMARY_FIELDS and c != "stage")
+        table = table[["stage", *labels, *SUMMARY_FIELDS]]
+        st.dataframe(table.round(2), hide_index=True)
+        by_stage = table.groupby("stage")[["p50_ms", "p95_ms", "p99_ms"]].max()
+        st.subheader("Latency by stage (ms, worst label)")
+        st.bar_chart(by_stage)
+
+    cache = get_cache().stats()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Data cache entries", cache["entries"])
+    col2.metric("Data cache (MB)", f"{cache['bytes'] / 2**20:.0f} / {cache['max_bytes'] / 2**20:.0f}")
+    lookups = cache["hits"] + cache["misses"]
+    col3.metric("Data cache hit rate", f"{cache['hits'] / lookups:.0%}" if lookups else "–")
+
+    text = registry.prometheus_text()
+    st.download_button("Download Prometheus metrics", text, file_name="wifi_metrics.prom", mime="text/plain")
+    with st.expander("Prometheus text"):
+        st.code(text, language="text")
+    if st.button("Reset metrics"):
+        registry.reset()
+        st.rerun()
@@ -0,0 +1,142 @@
+# --- model_registry.py ---
+# Cache of fitted models keyed by venue, data fingerprint, feature set and
+# hyperparameters. Hot models stay in an in-process LRU; every fit is also
+# persisted with joblib under models/ so other processes (portfolio workers,
+# restarted pods) reuse it. A model is refit only when its training data or
+# settings actually change.
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import joblib
+import pandas as pd
+
+MODEL_DIR = os.environ.get(
+    "WIFI_MODEL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+)
+MAX_IN_MEMORY = int(os.environ.get("WIFI_MODELS_IN_MEMORY", "32"))
+MAX_ON_DISK = int(os.environ.get("WIFI_MODELS_ON_DISK", "500"))
+
+
+def fingerprint(data):
+    """Content hash of a frame or series; the index only counts for time series."""
+    if isinstance(data, pd.Series) and isinstance(data.index, pd.DatetimeIndex):
+        data = data.reset_index()
+    hashed = pd.util.hash_pandas_object(data, index=False).to_numpy()
+    digest = hashlib.sha1(hashed.tobytes())
+    names = list(data.columns) if isinstance(data, pd.DataFrame) else [data.name]
+    digest.update(repr(names).encode())
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    def __init__(self, directory=MODEL_DIR, max_in_memory=MAX_IN_MEMORY, max_on_disk=MAX_ON_DISK):
+        self.directory = directory
+        self.max_in_memory = max_in_memory
+        self.max_on_disk = max_on_disk
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.fits = 0
+
+    @staticmethod
+    def make_key(kind, venue, data_fingerprint, features, params):
+        spec = {
+            "kind": kind,
+            "venue": venue,
+            "data": data_fingerprint,
+            "features": list(features),
+            "params": params,
+        }
+        return hashlib.sha1(json.dumps(spec, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _path(self, kind, key):
+        return os.path.join(self.directory, kind, f"{key}.joblib")
+
+    def get_or_fit(self, kind, venue, data, features, params, fit):
+        """Return the cached model for this exact input, calling ``fit()`` only on a miss.
+
+        ``data`` is the training frame/series, or an already computed
+        fingerprint string for data that is never fully in memory.
+        """
+        data_fp = data if isinstance(data, str) else fingerprint(data)
+        key = self.make_key(kind, venue, data_fp, features, params)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # One fit per key even when several sessions miss at the same time
+        with key_lock:
+            with self._lock:
+                if key in self._memory:
+                    self.hits += 1
+                    return self._memory[key]
+            path = self._path(kind, key)
+            model = None
+            if os.path.exists(path):
+                try:
+                    model = joblib.load(path)
+                    with self._lock:
+                        self.disk_hits += 1
+                except Exception:
+                    model = None  # truncated or from an incompatible library version
+            if model is None:
+                model = fit()
+                with self._lock:
+                    self.fits += 1
+                self._save(path, model)
+            self._remember(key, model)
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return model
+
+    def _remember(self, key, model):
+        with self._lock:
+            self._memory[key] = model
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_in_memory:
+                self._memory.popitem(last=False)
+
+    def _save(self, path, model):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            joblib.dump(model, tmp)
+            os.replace(tmp, path)
+        except Exception:
+            # The cache is an optimisation; an unwritable disk must not break the page
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        self._prune()
+
+    def _prune(self):
+        artifacts = []
+        for root, _, names in os.walk(self.directory):
+            artifacts.extend(os.path.join(root, n) for n in names if n.endswith(".joblib"))
+        if len(artifacts) <= self.max_on_disk:
+            return
+        artifacts.sort(key=lambda p: os.stat(p).st_mtime)
+        for path in artifacts[:len(artifacts) - self.max_on_disk]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {"in_memory": len(self._memory), "hits": self.hits,
+                    "disk_hits": self.disk_hits, "fits": self.fits}
+
+
+_registry = ModelRegistry()
+
+
+def get_registry():
+    return _registry
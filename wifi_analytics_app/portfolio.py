@@ -0,0 +1,135 @@
+# --- portfolio.py ---
+# Runs the ai_models pipeline for every venue in connection_logs/ in a
+# process pool, so a whole portfolio is analysed on all cores at once.
+# Each venue runs in its own worker: a failing step is recorded and the
+# remaining steps still run, a crashing venue only loses its own result.
+# Venues at or above STREAMING_MIN_ROWS take the same path as the single-venue
+# page: clustering streams the files, the other models get a uniform sample,
+# so no worker holds a whole large venue in memory.
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from data_loader import list_venues
+
+MAX_WORKERS = int(os.environ.get("WIFI_PORTFOLIO_WORKERS", "0")) or None
+
+
+def run_venue_pipeline(business_type, n_clusters=3):
+    """Full AI pipeline for one venue, returning metrics, per-step timings and errors.
+
+    Counts measured on a sample (anomalies, the 7-day forecast) are scaled up
+    to the venue's size; ``metrics["sampled_rows"]`` says how many rows were used.
+    """
+    import ai_models
+    import pandas as pd
+
+    result = {"venue": business_type, "metrics": {}, "timings": {}, "errors": {}, "summary": None}
+    state = {}
+
+    def step(name, fn):
+        started = time.perf_counter()
+        try:
+            fn()
+        except Exception as e:
+            result["errors"][name] = f"{type(e).__name__}: {e}"
+        finally:
+            result["timings"][name] = time.perf_counter() - started
+
+    def load():
+        state["df"], total = ai_models.load_model_frame(business_type)
+        state["scale"] = total / max(len(state["df"]), 1)
+        result["metrics"]["sessions"] = total
+        if len(state["df"]) < total:
+            result["metrics"]["sampled_rows"] = len(state["df"])
+
+    def segmentation():
+        if len(state["df"]) < result["metrics"]["sessions"]:
+            df = state["df"]
+            features = [f for f in ai_models.CLUSTERING_FEATURES
+                        if f in df.columns and pd.api.types.is_numeric_dtype(df[f])]
+            if len(features) < 2:
+                raise ValueError("Insufficient data/features for clustering.")
+            model = ai_models.streaming_segmentation(business_type, features, n_clusters)
+            result["metrics"]["clusters"] = len(model.profiles)
+            return
+        segmented = ai_models.segment_customers(state["df"], n_clusters, venue=business_type)
+        if segmented is None:
+            raise ValueError("Insufficient data/features for clustering.")
+        state["df"] = segmented[0]
+        result["metrics"]["clusters"] = int(segmented[0]["Cluster"].nunique())
+
+    def anomalies():
+        found = ai_models.detect_anomalies(state["df"], venue=business_type)
+        result["metrics"]["anomalies"] = round(len(found) * state["scale"])
+        result["metrics"]["anomaly_rate_pct"] = 100 * len(found) / max(len(state["df"]), 1)
+
+    def churn():
+        result["metrics"]["churn_risk_pct"] = 100 * float(ai_models.churn_risk(state["df"], business_type)["churn_risk"].mean())
+
+    def forecast():
+        ts = ai_models.daily_connections(state["df"])
+        if len(ts) <= 7:
+            raise ValueError("Not enough data for reliable time series forecasting.")
+        forecast = ai_models.forecast_daily_connections(ts, venue=business_type)
+        result["metrics"]["forecast_next_7d"] = float(forecast.sum()) * state["scale"]
+
+    def summary():
+        df = state["df"]
+        result["metrics"]["avg_duration_min"] = float(df["duration"].mean())
+        result["metrics"]["peak_hour"] = int(df["hour_of_day"].mode()[0])
+        result["metrics"]["returning_pct"] = 100 * float(df["frequent_visitor"].mean())
+        result["summary"] = ai_models.nlg_summary_text(df, business_type, result["metrics"]["sessions"])
+
+    step("load", load)
+    if "df" in state:
+        for name, fn in [("segmentation", segmentation), ("anomalies", anomalies), ("churn", churn),
+                         ("forecast", forecast), ("summary", summary)]:
+            step(name, fn)
+    return result
+
+
+def _failed(venue, error):
+    return {"venue": venue, "metrics": {}, "timings": {}, "summary": None, "errors": {"worker": error}}
+
+
+def _run_pool(venues, n_clusters, workers, on_result, results):
+    # spawn, not fork: the Streamlit server is multi-threaded
+    context = multiprocessing.get_context("spawn")
+    broken = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = {pool.submit(run_venue_pipeline, venue, n_clusters): venue for venue in venues}
+        for future in as_completed(futures):
+            venue = futures[future]
+            try:
+                results[venue] = future.result()
+            except BrokenProcessPool:
+                # One dying worker fails every pending future; retried below
+                broken.append(venue)
+                continue
+            except Exception as e:
+                results[venue] = _failed(venue, f"{type(e).__name__}: {e}")
+            if on_result is not None:
+                on_result(results[venue])
+    return broken
+
+
+def run_portfolio(venues=None, n_clusters=3, max_workers=MAX_WORKERS, on_result=None):
+    """Run every venue in parallel; results come back in ``venues`` order.
+
+    ``on_result`` is called in the parent as each venue finishes (for progress).
+    If a worker process dies, the venues caught in the broken pool are re-run
+    one per pool, so only the venue that actually crashes is reported failed.
+    """
+    venues = list(venues) if venues is not None else list_venues()
+    results = {}
+    workers = min(max_workers or os.cpu_count() or 1, max(len(venues), 1))
+    broken = _run_pool(venues, n_clusters, workers, on_result, results)
+    for venue in broken:
+        if _run_pool([venue], n_clusters, 1, on_result, results):
+            results[venue] = _failed(venue, "BrokenProcessPool: worker process died")
+            if on_result is not None:
+                on_result(results[venue])
+    return [results[venue] for venue in venues]
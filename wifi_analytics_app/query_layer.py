@@ -0,0 +1,261 @@
+# --- query_layer.py ---
+# Dashboard reads straight from the wifi_logs table (schema.sql). Filtering,
+# time bucketing and aggregation run in the database, so a chart fetches a
+# few hundred aggregate rows rather than every session. Venue and time range
+# are always bound as parameters, never formatted into the SQL, and the
+# (location, timestamp) index serves those filters.
+#
+#   layer = get_query_layer()                 # WIFI_DB_DSN
+#   layer.sessions_over_time("Restaurant", start, end, granularity="day")
+#
+# Connections come from the same pools as ingest.py: Postgres in production,
+# or a "sqlite:///path.db" / "duckdb:///path.duckdb" file for local runs.
+# Row-level scans (iter_sessions) use a server-side cursor on Postgres, so
+# only one chunk of rows is held in memory at a time.
+import os
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+from data_loader import venue_slug
+from ingest import DEFAULT_DSN, create_pool
+from metrics import track
+
+GRANULARITIES = ("hour", "day", "month")
+DWELL_BIN_MINUTES = 15
+SCAN_CHUNK_ROWS = 50_000
+
+# wifi_logs column -> connection_logs column, so loaded rows fit the AI pipeline
+SESSION_COLUMNS = {
+    "timestamp": "timestamp",
+    "device_id": "device_id",
+    "device_type": "device_type",
+    "location": "business_type",
+    "dwell_time": "session_duration_minutes",
+    "returning": "returning",
+}
+
+# SQLite has no date_trunc/EXTRACT; it keeps timestamps as ISO text
+_SQLITE_BUCKETS = {
+    "hour": "strftime('%Y-%m-%d %H:00:00', \"timestamp\")",
+    "day": "date(\"timestamp\")",
+    "month": "strftime('%Y-%m-01', \"timestamp\")",
+}
+
+
+def db_configured():
+    """True when WIFI_DB_DSN points the app at a database."""
+    return bool(os.environ.get("WIFI_DB_DSN"))
+
+
+def _param(value):
+    # pandas Timestamps and dates -> datetime, which every driver binds
+    if value is None:
+        return None
+    return pd.Timestamp(value).to_pydatetime()
+
+
+class QueryLayer:
+    """Parameterised, aggregated reads of wifi_logs over a connection pool."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.dialect = pool.dialect
+
+    # -- SQL building ---------------------------------------------------
+
+    @property
+    def _placeholder(self):
+        return "%s" if self.dialect == "postgres" else "?"
+
+    def _bucket(self, granularity):
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}, not {granularity!r}")
+        if self.dialect == "sqlite":
+            return _SQLITE_BUCKETS[granularity]
+        return f"date_trunc('{granularity}', \"timestamp\")"
+
+    def _hour_of_day(self):
+        if self.dialect == "sqlite":
+            return "CAST(strftime('%H', \"timestamp\") AS INTEGER)"
+        return "CAST(EXTRACT(HOUR FROM \"timestamp\") AS INTEGER)"
+
+    def _where(self, location=None, start=None, end=None):
+        """WHERE clause and parameters; ``start`` is inclusive and ``end`` exclusive."""
+        clauses, params = [], []
+        for sql, value in [("location = {}", location), ("\"timestamp\" >= {}", _param(start)),
+                           ("\"timestamp\" < {}", _param(end))]:
+            if value is not None:
+                clauses.append(sql.format(self._placeholder))
+                params.append(value.isoformat(" ") if self.dialect == "sqlite" and isinstance(value, datetime)
+                              else value)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    # -- execution ------------------------------------------------------
+
+    def _query(self, name, sql, params=()):
+        """Rows and column names of one query, on a pooled connection."""
+        with track("db_query", query=name) as t:
+            conn = self.pool.getconn()
+            broken = True
+            try:
+                cur = conn.cursor()
+                try:
+                    cur.execute(sql, list(params))
+                    rows = cur.fetchall()
+                    columns = [d[0] for d in cur.description]
+                finally:
+                    cur.close()
+                self._end_read(conn)
+                broken = False
+            finally:
+                self.pool.putconn(conn, close=broken and self.dialect == "postgres")
+            t.rows = len(rows)
+        return rows, columns
+
+    def _end_read(self, conn):
+        # psycopg2 opens a transaction for every statement; don't leave it idle
+        if self.dialect == "postgres":
+            conn.rollback()
+
+    def _frame(self, name, sql, params=()):
+        rows, columns = self._query(name, sql, params)
+        return pd.DataFrame.from_records(rows, columns=columns)
+
+    # -- aggregates -----------------------------------------------------
+
+    def locations(self):
+        rows, _ = self._query("locations", "SELECT DISTINCT location FROM wifi_logs "
+                                           "WHERE location IS NOT NULL ORDER BY location")
+        return [r[0] for r in rows]
+
+    def time_bounds(self, location=None):
+        """(first, last) session timestamps, or (None, None) without sessions."""
+        where, params = self._where(location)
+        rows, _ = self._query("time_bounds", f"SELECT MIN(\"timestamp\"), MAX(\"timestamp\") FROM wifi_logs{where}",
+                              params)
+        first, last = rows[0]
+        if first is None:
+            return None, None
+        return pd.Timestamp(first), pd.Timestamp(last)
+
+    def summary(self, location=None, start=None, end=None):
+        """Sessions, unique devices, average dwell and returning share in the range."""
+        where, params = self._where(location, start, end)
+        rows, columns = self._query("summary", (
+            "SELECT COUNT(*) AS sessions, COUNT(DISTINCT device_id) AS devices, "
+            "AVG(dwell_time) AS avg_dwell_minutes, "
+            "AVG(CASE WHEN \"returning\" THEN 1.0 ELSE 0.0 END) AS returning_share "
+            f"FROM wifi_logs{where}"), params)
+        return dict(zip(columns, rows[0]))
+
+    def sessions_over_time(self, location=None, start=None, end=None, granularity="day"):
+        """Sessions and unique devices per hour/day/month bucket (only buckets with sessions)."""
+        bucket = self._bucket(granularity)
+        where, params = self._where(location, start, end)
+        df = self._frame(f"sessions_by_{granularity}", (
+            f"SELECT {bucket} AS bucket, COUNT(*) AS sessions, COUNT(DISTINCT device_id) AS devices "
+            f"FROM wifi_logs{where} GROUP BY 1 ORDER BY 1"), params)
+        df["bucket"] = pd.to_datetime(df["bucket"])
+        return df.set_index("bucket")
+
+    def sessions_by_hour_of_day(self, location=None, start=None, end=None):
+        """Sessions per hour of day 0-23, like rollups' sessions_by_hour_of_day."""
+        where, params = self._where(location, start, end)
+        df = self._frame("sessions_by_hour_of_day", (
+            f"SELECT {self._hour_of_day()} AS hour, COUNT(*) AS sessions "
+            f"FROM wifi_logs{where} GROUP BY 1"), params)
+        return df.set_index("hour")["sessions"].reindex(range(24), fill_value=0).rename_axis("hour")
+
+    def device_counts(self, location=None, start=None, end=None):
+        """Sessions per device type, largest first."""
+        where, params = self._where(location, start, end)
+        df = self._frame("device_counts", (
+            "SELECT COALESCE(device_type, 'Unknown') AS device_type, COUNT(*) AS sessions "
+            f"FROM wifi_logs{where} GROUP BY 1 ORDER BY 2 DESC"), params)
+        return df.set_index("device_type")["sessions"]
+
+    def dwell_histogram(self, location=None, start=None, end=None, bin_minutes=DWELL_BIN_MINUTES):
+        """Sessions per dwell-time bin, as bin_start/bin_end/count rows (the rollup histogram shape)."""
+        where, params = self._where(location, start, end)
+        # psycopg2 reads a bare % as a placeholder
+        modulo = "%%" if self.dialect == "postgres" else "%"
+        where = f"{where} AND dwell_time IS NOT NULL" if where else " WHERE dwell_time IS NOT NULL"
+        df = self._frame("dwell_histogram", (
+            f"SELECT dwell_time - dwell_time {modulo} {self._placeholder} AS bin_start, COUNT(*) AS count "
+            f"FROM wifi_logs{where} GROUP BY 1 ORDER BY 1"), [int(bin_minutes), *params])
+        df["bin_end"] = df["bin_start"] + int(bin_minutes)
+        return df[["bin_start", "bin_end", "count"]]
+
+    def recent_alerts(self, venue=None, limit=200):
+        """Newest anomaly_alerts rows; ``venue`` matches locations by slug ("business_cafe" = "Business Cafe")."""
+        where, params = "", []
+        if venue is not None:
+            where = f" WHERE LOWER(REPLACE(location, ' ', '_')) = {self._placeholder}"
+            params.append(venue_slug(venue))
+        df = self._frame("recent_alerts", f"SELECT * FROM anomaly_alerts{where} ORDER BY detected_at DESC "
+                                          f"LIMIT {int(limit)}", params)
+        return df.drop(columns=["id"], errors="ignore")
+
+    # -- row scans ------------------------------------------------------
+
+    def iter_sessions(self, location=None, start=None, end=None, columns=tuple(SESSION_COLUMNS),
+                      chunk_rows=SCAN_CHUNK_ROWS):
+        """Yield the matching wifi_logs rows as DataFrames of up to ``chunk_rows`` rows, oldest first.
+
+        On Postgres the rows stream through a named (server-side) cursor, so
+        a scan of any size holds one chunk at a time. The pooled connection
+        is held until the generator is exhausted or closed.
+        """
+        where, params = self._where(location, start, end)
+        select = ", ".join(f'"{c}"' for c in columns)
+        sql = f"SELECT {select} FROM wifi_logs{where} ORDER BY \"timestamp\""
+        with track("db_scan", location=location) as t:
+            t.rows = 0
+            conn = self.pool.getconn()
+            broken = True
+            try:
+                if self.dialect == "postgres":
+                    cur = conn.cursor(name="wifi_logs_scan")
+                    cur.itersize = chunk_rows
+                else:
+                    cur = conn.cursor()
+                try:
+                    cur.execute(sql, params)
+                    while True:
+                        rows = cur.fetchmany(chunk_rows)
+                        if not rows:
+                            break
+                        t.rows += len(rows)
+                        yield pd.DataFrame.from_records(rows, columns=list(columns))
+                finally:
+                    cur.close()
+                self._end_read(conn)
+                broken = False
+            finally:
+                self.pool.putconn(conn, close=broken and self.dialect == "postgres")
+
+    def load_sessions(self, location=None, start=None, end=None, chunk_rows=SCAN_CHUNK_ROWS):
+        """Matching sessions in the connection_logs schema (dwell_time -> session_duration_minutes, ...)."""
+        chunks = list(self.iter_sessions(location, start, end, chunk_rows=chunk_rows))
+        df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=list(SESSION_COLUMNS))
+        df = df.rename(columns=SESSION_COLUMNS)
+        df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
+        df["session_duration_minutes"] = pd.to_numeric(df["session_duration_minutes"], errors="coerce")
+        df["returning"] = df["returning"].fillna(False).astype(bool)
+        return df
+
+
+_layers = {}
+_layers_lock = threading.Lock()
+
+
+def get_query_layer(dsn=None):
+    """Process-wide query layer (and its pool) per DSN, default WIFI_DB_DSN."""
+    dsn = dsn or DEFAULT_DSN
+    with _layers_lock:
+        layer = _layers.get(dsn)
+        if layer is None:
+            layer = _layers[dsn] = QueryLayer(create_pool(dsn))
+        return layer
@@ -0,0 +1,315 @@
+# --- rollups.py ---
+# Incrementally maintained per-venue, per-hour aggregates for the Analytics
+# dashboard. For every clock hour we keep session counts by device type,
+# fixed-bin histograms of duration, signal, data used and peak usage hour,
+# and running sums for the means. Charts are drawn from these small tables
+# instead of the raw log rows.
+#
+# A refresh only reads what was appended since the last one: the CSV from
+# the last processed byte offset, or parquet part files not yet seen for
+# parquet-only venues, plus each splash sign-in segment from its own offset.
+# State is pickled to connection_logs/rollups/ so a restart does not rebuild
+# from scratch.
+import hashlib
+import io
+import os
+import pickle
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_loader import (
+    DATA_DIR,
+    SIGNIN_PRIVATE_COLUMNS,
+    read_venue_csv,
+    session_segment_paths,
+    venue_csv_path,
+    venue_slug,
+)
+
+# Fixed bin edges per metric; values outside the range land in the edge bins
+HISTOGRAM_BINS = {
+    "duration": np.arange(0, 125, 5),
+    "signal_strength_dBm": np.arange(-100, -18, 2),
+    "data_used_MB": np.arange(0, 1025, 25),
+    "peak_usage_hour": np.arange(0, 25, 1),
+}
+
+SUM_COLUMNS = {"duration": "duration_sum", "signal_strength_dBm": "signal_sum", "data_used_MB": "data_sum"}
+
+TAIL_BLOCK_BYTES = 64 * 1024 * 1024
+PREFIX_BYTES = 4096
+ROLLUP_VERSION = 2
+
+
+def rollup_dir(data_dir=None):
+    return os.path.join(data_dir or DATA_DIR, "rollups")
+
+
+def _add(a, b):
+    if a is None:
+        return b
+    if b is None or b.empty:
+        return a
+    return a.add(b, fill_value=0)
+
+
+def _between(frame, start, end):
+    if frame is None:
+        return None
+    mask = np.ones(len(frame), dtype=bool)
+    if start is not None:
+        mask &= frame.index >= pd.Timestamp(start)
+    if end is not None:
+        mask &= frame.index < pd.Timestamp(end)
+    return frame[mask]
+
+
+class IncrementalVenueState:
+    """Watermark over a venue's log; ``refresh`` feeds only the new rows to ``add_rows``.
+
+    Subclasses hold the aggregates: ``clear`` drops them, ``add_rows`` folds
+    in a frame of raw log rows and counts them in ``self.rows``.
+    """
+
+    def __init__(self, business_type, data_dir=None):
+        self.business_type = business_type
+        self.data_dir = data_dir
+        self.reset()
+
+    def reset(self):
+        self.rows = 0
+        self.offset = None  # CSV byte offset already aggregated
+        self.prefix_hash = None  # hash of the first bytes read, detects in-place rewrites
+        self.header = None
+        self.files = frozenset()  # parquet parts already aggregated
+        self.segments = {}  # sign-in segment path -> (byte offset aggregated, header)
+        self.clear()
+
+    def clear(self):
+        raise NotImplementedError
+
+    def add_rows(self, df):
+        raise NotImplementedError
+
+    def refresh(self):
+        """Aggregate whatever was appended to the venue since the last refresh.
+
+        Returns the number of new rows folded in.
+        """
+        import storage
+
+        csv_path = venue_csv_path(self.business_type, self.data_dir)
+        venue_dir = storage.venue_parquet_dir(self.business_type, self.data_dir)
+        segments = session_segment_paths(self.business_type, self.data_dir)
+        if os.path.exists(csv_path):
+            added = self._refresh_csv(csv_path)
+        elif storage.parquet_available() and os.path.isdir(venue_dir):
+            added = self._refresh_parquet(venue_dir)
+        elif segments:
+            added = 0
+        else:
+            raise FileNotFoundError(csv_path)
+        return added + self._refresh_segments(segments)
+
+    def _prefix_hash(self, f, length):
+        f.seek(0)
+        return hashlib.sha1(f.read(length)).hexdigest()
+
+    def _refresh_csv(self, path):
+        before = self.rows
+        with open(path, "rb") as f:
+            size = f.seek(0, os.SEEK_END)
+            if self.offset is not None and (
+                size < self.offset
+                or self._prefix_hash(f, min(self.offset, PREFIX_BYTES)) != self.prefix_hash
+            ):
+                self.reset()  # rewritten, not appended to
+            if self.offset is None:
+                f.seek(0)
+                header_line = f.readline()
+                self.header = header_line.decode("utf-8").strip().split(",")
+                self.offset = len(header_line)
+            self.offset = self._read_tail(f, self.offset, self.header)
+            self.prefix_hash = self._prefix_hash(f, min(self.offset, PREFIX_BYTES))
+        return self.rows - before
+
+    def _read_tail(self, f, offset, header, usecols=None):
+        # Fold in the complete lines after ``offset``; returns the new offset
+        f.seek(offset)
+        while True:
+            block = f.read(TAIL_BLOCK_BYTES)
+            cut = block.rfind(b"\n")
+            if cut == -1:
+                return offset  # nothing new, or a line still being written
+            self.add_rows(read_venue_csv(io.BytesIO(block[:cut + 1]), header=None, names=header, usecols=usecols))
+            offset += cut + 1
+            f.seek(offset)
+
+    def _refresh_segments(self, paths):
+        # Sign-in segments are append-only and never rewritten (a rotation starts a new file)
+        before = self.rows
+        for path in paths:
+            with open(path, "rb") as f:
+                offset, header = self.segments.get(path, (None, None))
+                if offset is None:
+                    header_line = f.readline()
+                    if not header_line.endswith(b"\n"):
+                        continue
+                    header = header_line.decode("utf-8").strip().split(",")
+                    offset = len(header_line)
+                usecols = [name for name in header if name not in SIGNIN_PRIVATE_COLUMNS]
+                self.segments[path] = (self._read_tail(f, offset, header, usecols), header)
+        return self.rows - before
+
+    def _refresh_parquet(self, venue_dir):
+        import pyarrow.parquet as pq
+
+        current = set()
+        for root, _, names in os.walk(venue_dir):
+            current.update(os.path.join(root, n) for n in names if n.endswith(".parquet"))
+        if not self.files <= current:
+            self.reset()  # re-converted; start over
+        before = self.rows
+        for path in sorted(current - self.files):
+            self.add_rows(pq.read_table(path).to_pandas())
+        self.files = frozenset(current)
+        return self.rows - before
+
+
+class VenueRollup(IncrementalVenueState):
+    """Hourly aggregates for one venue plus the watermark of what was read."""
+
+    def __init__(self, business_type, data_dir=None):
+        self.version = ROLLUP_VERSION
+        super().__init__(business_type, data_dir)
+
+    def clear(self):
+        self.hourly = None  # index hour -> sessions + metric sums
+        self.devices = None  # index hour -> one column per device type
+        self.histograms = {}  # metric -> index hour, columns = bin index
+
+    # -- updating -------------------------------------------------------
+
+    def add_rows(self, df):
+        """Fold a frame of raw log rows into the aggregates."""
+        if df.empty:
+            return
+        if "duration" not in df.columns and "session_duration_minutes" in df.columns:
+            df = df.rename(columns={"session_duration_minutes": "duration"})
+        df = df[df["timestamp"].notna()]
+        hour = df["timestamp"].dt.floor("h").rename("hour")
+
+        sums = {"sessions": hour.groupby(hour).size()}
+        for col, name in SUM_COLUMNS.items():
+            if col in df.columns:
+                values = df[col].astype("float64")
+                sums[name] = values.groupby(hour).sum()
+                # Sign-ins carry no metrics yet, so means are over the rows that have them
+                sums[f"{col}_count"] = values.notna().groupby(hour).sum()
+        self.hourly = _add(self.hourly, pd.DataFrame(sums).fillna(0))
+
+        if "device_type" in df.columns:
+            devices = df.groupby([hour, df["device_type"].astype(str)]).size().unstack(fill_value=0)
+            self.devices = _add(self.devices, devices)
+
+        for metric, edges in HISTOGRAM_BINS.items():
+            if metric not in df.columns:
+                continue
+            values = df[metric].to_numpy(dtype="float64", na_value=np.nan)
+            bins = np.clip(np.searchsorted(edges, values, side="right") - 1, 0, len(edges) - 2)
+            valid = ~np.isnan(values)
+            counts = pd.DataFrame({"hour": hour.to_numpy()[valid], "bin": bins[valid]})
+            counts = counts.groupby(["hour", "bin"]).size().unstack(fill_value=0)
+            self.histograms[metric] = _add(self.histograms.get(metric), counts)
+        self.rows += len(df)
+
+    # -- reading --------------------------------------------------------
+
+    def days(self):
+        if self.hourly is None or self.hourly.empty:
+            return []
+        return sorted(set(self.hourly.index.date))
+
+    def total_sessions(self, start=None, end=None):
+        hourly = _between(self.hourly, start, end)
+        return int(hourly["sessions"].sum()) if hourly is not None else 0
+
+    def means(self, start=None, end=None):
+        hourly = _between(self.hourly, start, end)
+        if hourly is None or hourly["sessions"].sum() == 0:
+            return {}
+        means = {}
+        for metric, name in SUM_COLUMNS.items():
+            count = hourly[f"{metric}_count"].sum() if f"{metric}_count" in hourly.columns else 0
+            if name in hourly.columns and count:
+                means[metric] = hourly[name].sum() / count
+        return means
+
+    def sessions_by_hour_of_day(self, start=None, end=None):
+        hourly = _between(self.hourly, start, end)
+        if hourly is None:
+            return pd.Series(0, index=pd.RangeIndex(24, name="hour"), name="sessions")
+        counts = hourly["sessions"].groupby(hourly.index.hour).sum()
+        return counts.reindex(range(24), fill_value=0).rename_axis("hour").astype("int64")
+
+    def device_counts(self, start=None, end=None):
+        devices = _between(self.devices, start, end)
+        if devices is None:
+            return pd.Series(dtype="int64", name="sessions")
+        return devices.sum().astype("int64").rename_axis("device_type").rename("sessions")
+
+    def histogram(self, metric, start=None, end=None):
+        """Bin table for a metric: bin_start, bin_end and count per fixed bin."""
+        edges = HISTOGRAM_BINS[metric]
+        frame = _between(self.histograms.get(metric), start, end)
+        counts = np.zeros(len(edges) - 1, dtype="int64")
+        if frame is not None and not frame.empty:
+            summed = frame.sum()
+            counts[summed.index.to_numpy(dtype="int64")] = summed.to_numpy(dtype="int64")
+        return pd.DataFrame({"bin_start": edges[:-1], "bin_end": edges[1:], "count": counts})
+
+
+_rollups = {}
+_locks = {}
+_registry_lock = threading.Lock()
+
+
+def _state_path(business_type, data_dir):
+    return os.path.join(rollup_dir(data_dir), f"{venue_slug(business_type)}.pkl")
+
+
+def _load_state(business_type, data_dir):
+    try:
+        with open(_state_path(business_type, data_dir), "rb") as f:
+            rollup = pickle.load(f)
+        if getattr(rollup, "version", None) == ROLLUP_VERSION:
+            rollup.data_dir = data_dir
+            return rollup
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        pass
+    return VenueRollup(business_type, data_dir)
+
+
+def _save_state(rollup):
+    path = _state_path(rollup.business_type, rollup.data_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "wb") as f:
+        pickle.dump(rollup, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def get_rollup(business_type, data_dir=None):
+    """Up-to-date rollup for a venue, shared across sessions in this process."""
+    key = (data_dir, venue_slug(business_type))
+    with _registry_lock:
+        lock = _locks.setdefault(key, threading.Lock())
+    with lock:
+        rollup = _rollups.get(key)
+        if rollup is None:
+            rollup = _rollups[key] = _load_state(business_type, data_dir)
+        if rollup.refresh():
+            _save_state(rollup)
+        return rollup
@@ -0,0 +1,498 @@
+# --- rule_engine.py ---
+# Automation rules from the Automation tab, and the engine that fires them.
+# Rules are stored as JSON (automation_rules.json) and compiled into an
+# index keyed by (trigger, venue). Session events from the splash page are
+# queued to an asyncio loop on a background thread. Each matching action is
+# dispatched as its own task: a per-channel token bucket limits the rate, a
+# semaphore bounds concurrency, and failures are retried with backoff. Blocking
+# sends (requests, smtplib) run in a thread pool. "After X Minutes" rules sit in
+# a hashed timer wheel until they are due; a disconnect cancels them.
+#
+# Senders read their endpoints from the environment (WIFI_SMTP_HOST/PORT,
+# WIFI_SMS_GATEWAY_URL, WIFI_WEBHOOK_URL), so a local stub HTTP or SMTP
+# server can stand in for the real ones.
+import asyncio
+import atexit
+import json
+import logging
+import math
+import os
+import smtplib
+import string
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from email.message import EmailMessage
+
+logger = logging.getLogger(__name__)
+
+TRIGGERS = ["On Connect", "After X Minutes", "On Disconnect"]
+ACTIONS = ["Send SMS", "Send Email", "Webhook Call"]
+ALL_VENUES = "*"
+
+RULES_PATH = os.environ.get(
+    "WIFI_RULES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "automation_rules.json")
+)
+
+ACTION_CONFIG = {
+    "smtp_host": os.environ.get("WIFI_SMTP_HOST", "localhost"),
+    "smtp_port": int(os.environ.get("WIFI_SMTP_PORT", "25")),
+    "smtp_from": os.environ.get("WIFI_SMTP_FROM", "wifi@localhost"),
+    "smtp_user": os.environ.get("WIFI_SMTP_USER"),
+    "smtp_password": os.environ.get("WIFI_SMTP_PASSWORD"),
+    "smtp_starttls": os.environ.get("WIFI_SMTP_STARTTLS", "0") == "1",
+    "sms_gateway_url": os.environ.get("WIFI_SMS_GATEWAY_URL"),
+    "webhook_url": os.environ.get("WIFI_WEBHOOK_URL"),
+    "timeout": 10.0,
+}
+
+# Sends per second per action channel (token bucket rate; burst is 2x)
+RATE_LIMITS = {"Send SMS": 5.0, "Send Email": 10.0, "Webhook Call": 50.0}
+
+
+class PermanentActionError(Exception):
+    """An action that cannot succeed on retry (e.g. the guest left no email)."""
+
+
+# --- Rule storage -----------------------------------------------------------
+
+class RuleStore:
+    """Rules persisted as a JSON list; every change rewrites the file atomically."""
+
+    def __init__(self, path=RULES_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f).get("rules", [])
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError):
+            logger.exception("Could not read automation rules from %s", self.path)
+            return []
+
+    def _write(self, rules):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp-{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"rules": rules}, f, indent=2)
+        os.replace(tmp, self.path)
+
+    def add(self, trigger, action, content, venue=ALL_VENUES, minutes=None, target=None):
+        if trigger not in TRIGGERS or action not in ACTIONS:
+            raise ValueError(f"Unknown trigger/action: {trigger} / {action}")
+        if trigger == "After X Minutes" and not minutes:
+            raise ValueError("'After X Minutes' rules need a number of minutes.")
+        check_template(content)
+        rule = {
+            "id": uuid.uuid4().hex[:12],
+            "trigger": trigger,
+            "minutes": int(minutes) if trigger == "After X Minutes" else None,
+            "venue": venue or ALL_VENUES,
+            "action": action,
+            "content": content,
+            "target": target or None,
+            "enabled": True,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        with self._lock:
+            rules = self.load()
+            rules.append(rule)
+            self._write(rules)
+        return rule
+
+    def delete(self, rule_id):
+        with self._lock:
+            rules = self.load()
+            kept = [r for r in rules if r["id"] != rule_id]
+            self._write(kept)
+        return len(kept) != len(rules)
+
+
+def compile_index(rules):
+    """{(trigger, venue): [rules]} for enabled rules; venue "*" matches every venue."""
+    index = {}
+    for rule in rules:
+        if rule.get("enabled", True):
+            index.setdefault((rule["trigger"], rule.get("venue") or ALL_VENUES), []).append(rule)
+    return index
+
+
+# --- Actions ----------------------------------------------------------------
+
+class _SafeFormat(dict):
+    def __missing__(self, key):
+        return "{" + key + "}"
+
+
+def check_template(content):
+    """Raise ValueError unless ``content`` only uses named {placeholders} with balanced braces."""
+    try:
+        fields = [name for _, name, _, _ in string.Formatter().parse(str(content or "")) if name is not None]
+    except ValueError as e:
+        raise ValueError(f"Invalid message template ({e}); write a literal brace as {{{{ or }}}}.") from None
+    for name in fields:
+        if not name or name[0].isdigit():
+            raise ValueError(f"Message placeholders need a name, like {{device_id}}, not {{{name}}}.")
+
+
+def render_message(rule, event):
+    content = str(rule.get("content") or "")
+    try:
+        return content.format_map(_SafeFormat(event))
+    except (ValueError, IndexError, KeyError, AttributeError):
+        # A bad template (saved before check_template, or edited by hand) still sends, unformatted
+        logger.warning("Rule %s has an invalid message template; sending it as written", rule.get("id"))
+        return content
+
+
+def _post(url, payload, config):
+    import requests  # only once an action actually fires; keeps the sign-in page light
+
+    response = requests.post(url, json=payload, timeout=config["timeout"])
+    # A client error won't change on retry; 429 (rate limited) and 5xx will
+    if 400 <= response.status_code < 500 and response.status_code != 429:
+        raise PermanentActionError(f"HTTP {response.status_code} from {url}: {response.text[:200]}")
+    response.raise_for_status()
+
+
+def send_webhook(rule, event, message, config=ACTION_CONFIG):
+    url = rule.get("target") or config["webhook_url"]
+    if not url:
+        raise PermanentActionError("No webhook URL configured.")
+    payload = {"rule_id": rule["id"], "trigger": rule["trigger"], "message": message,
+               "event": {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in event.items()}}
+    _post(url, payload, config)
+
+
+def send_email(rule, event, message, config=ACTION_CONFIG):
+    to = rule.get("target") or event.get("email")
+    if not to:
+        raise PermanentActionError("Guest left no email address.")
+    msg = EmailMessage()
+    msg["From"] = config["smtp_from"]
+    msg["To"] = to
+    msg["Subject"] = "Free WiFi"
+    msg.set_content(message)
+    with smtplib.SMTP(config["smtp_host"], config["smtp_port"], timeout=config["timeout"]) as smtp:
+        if config["smtp_starttls"]:
+            smtp.starttls()
+        if config["smtp_user"]:
+            smtp.login(config["smtp_user"], config["smtp_password"])
+        smtp.send_message(msg)
+
+
+def send_sms(rule, event, message, config=ACTION_CONFIG):
+    to = rule.get("target") or event.get("phone")
+    if not to:
+        raise PermanentActionError("Guest left no phone number.")
+    if not config["sms_gateway_url"]:
+        raise PermanentActionError("No SMS gateway configured (WIFI_SMS_GATEWAY_URL).")
+    _post(config["sms_gateway_url"], {"to": to, "message": message}, config)
+
+
+SENDERS = {"Send SMS": send_sms, "Send Email": send_email, "Webhook Call": send_webhook}
+
+
+# --- Scheduling primitives --------------------------------------------------
+
+class TimerWheel:
+    """Hashed timing wheel: O(1) schedule and cancel, one slot visited per tick."""
+
+    def __init__(self, tick=1.0, slots=512):
+        self.tick = tick
+        self._slots = [{} for _ in range(slots)]
+        self._where = {}  # key -> slot index
+        self._cursor = 0
+        self._last = time.monotonic()
+
+    def __len__(self):
+        return len(self._where)
+
+    def schedule(self, key, delay, item):
+        self.cancel(key)
+        ticks = max(1, math.ceil(delay / self.tick))
+        slot = (self._cursor + ticks) % len(self._slots)
+        # Full turns of the wheel to skip before the entry is due
+        self._slots[slot][key] = [(ticks - 1) // len(self._slots), item]
+        self._where[key] = slot
+
+    def cancel(self, key):
+        slot = self._where.pop(key, None)
+        if slot is not None:
+            del self._slots[slot][key]
+
+    def advance(self, now=None):
+        """Move the cursor up to ``now`` and return the items that came due."""
+        now = time.monotonic() if now is None else now
+        steps = int((now - self._last) / self.tick)
+        self._last += steps * self.tick
+        due = []
+        for _ in range(steps):
+            self._cursor = (self._cursor + 1) % len(self._slots)
+            slot = self._slots[self._cursor]
+            for key, entry in list(slot.items()):
+                if entry[0] == 0:
+                    del slot[key]
+                    del self._where[key]
+                    due.append(entry[1])
+                else:
+                    entry[0] -= 1
+        return due
+
+
+class _TokenBucket:
+    # Only touched from the event loop thread, so no lock
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1.0, 2 * rate)
+        self.tokens = self.burst
+        self.last = time.monotonic()
+
+    async def acquire(self):
+        waited = False
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return waited
+            waited = True
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# --- Engine -----------------------------------------------------------------
+
+class RuleEngine:
+    """Consumes session events and fires matching rules asynchronously.
+
+    ``submit`` is thread-safe and never blocks; events beyond ``max_pending``
+    are dropped and counted. A rule fires at most once per device within
+    ``dedupe_window`` seconds. Pending "After X Minutes" timers live in memory
+    only and are lost on restart.
+    """
+
+    def __init__(self, store=None, senders=None, config=ACTION_CONFIG, rate_limits=RATE_LIMITS,
+                 max_concurrency=32, max_retries=3, retry_backoff=1.0, dedupe_window=3600.0,
+                 max_pending=10_000, tick=1.0):
+        self.store = store or RuleStore()
+        self.senders = dict(senders or SENDERS)
+        self.config = config
+        self.rate_limits = rate_limits
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.dedupe_window = dedupe_window
+        self.max_pending = max_pending
+        self.tick = tick
+        self.index = compile_index(self.store.load())
+        self.recent = deque(maxlen=200)  # last deliveries, for the Automation tab
+        self._lock = threading.Lock()
+        self._counters = {"events": 0, "dropped": 0, "matched": 0, "sent": 0, "failed": 0,
+                          "retries": 0, "deduped": 0, "rate_limited": 0, "timers_fired": 0}
+        self._loop = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    # -- public, any thread ----------------------------------------------
+
+    def start(self):
+        if self._thread is None:
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._run_loop, name="rule-engine", daemon=True)
+            self._thread.start()
+            self._ready.wait()
+        return self
+
+    def reload(self):
+        """Recompile the index after rules were added or deleted."""
+        self.index = compile_index(self.store.load())
+
+    def submit(self, event):
+        """Queue a session event: {"type": "connect"|"disconnect", "device_id", "venue", ...}."""
+        event = dict(event)
+        event.setdefault("timestamp", datetime.now())
+        self._loop.call_soon_threadsafe(self._enqueue, event)
+        return True
+
+    def flush(self, timeout=None):
+        """Wait until queued events and their dispatches (not future timers) are done."""
+        future = asyncio.run_coroutine_threadsafe(self._drain(), self._loop)
+        try:
+            future.result(timeout)
+            return True
+        except TimeoutError:
+            return False
+
+    def close(self, timeout=None):
+        if self._thread is not None:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        counters["rules"] = sum(len(rules) for rules in self.index.values())
+        counters["pending"] = self._queue.qsize() if self._loop is not None and self._ready.is_set() else 0
+        counters["timers"] = len(self._wheel) if self._ready.is_set() else 0
+        return counters
+
+    # -- event loop thread -------------------------------------------------
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._main())
+        finally:
+            self._executor.shutdown(wait=False)
+            self._loop.close()
+
+    async def _main(self):
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._buckets = {action: _TokenBucket(rate) for action, rate in self.rate_limits.items()}
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="rule-action")
+        self._wheel = TimerWheel(self.tick)
+        self._device_timers = {}  # device_id -> timer keys, for cancel on disconnect
+        self._seen = {}  # dedupe key -> expiry (monotonic)
+        self._tasks = set()
+        self._stopping = asyncio.Event()
+        self._ready.set()
+        ticker = asyncio.create_task(self._tick())
+        while True:
+            event = await self._queue.get()
+            try:
+                if event is None:
+                    break
+                self._handle(event)
+            except Exception:
+                logger.exception("Failed to handle session event %r", event)
+            finally:
+                self._queue.task_done()
+        ticker.cancel()
+        await self._drain()
+
+    def _enqueue(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self._count("dropped")
+
+    def _rules_for(self, trigger, venue):
+        return self.index.get((trigger, venue), []) + self.index.get((trigger, ALL_VENUES), [])
+
+    def _handle(self, event):
+        self._count("events")
+        venue = event.get("venue") or event.get("business_type") or event.get("location")
+        device = event.get("device_id")
+        if event.get("type") == "disconnect":
+            for key in self._device_timers.pop(device, ()):
+                self._wheel.cancel(key)
+            self._fire_all(self._rules_for("On Disconnect", venue), event)
+            return
+        self._fire_all(self._rules_for("On Connect", venue), event)
+        for rule in self._rules_for("After X Minutes", venue):
+            key = (rule["id"], device)
+            self._wheel.schedule(key, rule["minutes"] * 60, (rule, event))
+            self._device_timers.setdefault(device, set()).add(key)
+
+    def _fire_all(self, rules, event):
+        for rule in rules:
+            task = asyncio.create_task(self._dispatch(rule, event))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _tick(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            for rule, event in self._wheel.advance():
+                timers = self._device_timers.get(event.get("device_id"))
+                if timers is not None:
+                    timers.discard((rule["id"], event.get("device_id")))
+                    if not timers:
+                        del self._device_timers[event.get("device_id")]
+                self._count("timers_fired")
+                self._fire_all([rule], event)
+            now = time.monotonic()
+            if len(self._seen) > 10_000:
+                self._seen = {k: v for k, v in self._seen.items() if v > now}
+
+    async def _dispatch(self, rule, event):
+        self._count("matched")
+        key = (rule["id"], rule["trigger"], event.get("device_id"))
+        now = time.monotonic()
+        if event.get("device_id") is not None and self._seen.get(key, 0) > now:
+            self._count("deduped")
+            return
+        self._seen[key] = now + self.dedupe_window
+        message = render_message(rule, event)
+        sender = self.senders[rule["action"]]
+        bucket = self._buckets.get(rule["action"])
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if bucket is not None and await bucket.acquire():
+                self._count("rate_limited")
+            try:
+                async with self._semaphore:
+                    await self._loop.run_in_executor(self._executor, sender, rule, event, message, self.config)
+                error = None
+                break
+            except PermanentActionError as e:
+                error = str(e)
+                break
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                if attempt < self.max_retries:
+                    self._count("retries")
+                    await asyncio.sleep(self.retry_backoff * (2 ** attempt))
+        self._count("failed" if error else "sent")
+        if error:
+            logger.warning("Rule %s (%s) failed for %s: %s", rule["id"], rule["action"], event.get("device_id"), error)
+        self.recent.append({
+            "at": datetime.now().isoformat(timespec="seconds"), "rule": rule["id"], "trigger": rule["trigger"],
+            "action": rule["action"], "device_id": event.get("device_id"), "status": "failed" if error else "sent",
+            "error": error,
+        })
+
+    async def _drain(self):
+        await self._queue.join()
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def _shutdown(self):
+        await self._queue.put(None)
+
+
+_engine = None
+_store = None
+_engine_lock = threading.Lock()
+
+
+def get_rule_store():
+    global _store
+    with _engine_lock:
+        if _store is None:
+            _store = RuleStore()
+        return _store
+
+
+def get_rule_engine():
+    """Process-wide engine shared by every Streamlit session, drained at exit."""
+    global _engine
+    store = get_rule_store()
+    with _engine_lock:
+        if _engine is None:
+            _engine = RuleEngine(store).start()
+            atexit.register(_engine.close, 10)
+        return _engine
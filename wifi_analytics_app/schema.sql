@@ -5,8 +5,27 @@ CREATE TABLE wifi_logs (
   device_type VARCHAR,
   location VARCHAR,
   first_visit TIMESTAMP,
-  returning BOOLEAN,
+  "returning" BOOLEAN,
   dwell_time INT,
   email VARCHAR,
   phone VARCHAR
 );
+
+CREATE TABLE anomaly_alerts (
+  id SERIAL PRIMARY KEY,
+  detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  session_timestamp TIMESTAMP,
+  device_id VARCHAR,
+  location VARCHAR,
+  duration_minutes REAL,
+  data_used_mb REAL,
+  signal_dbm REAL,
+  hour_of_day INT,
+  score REAL,
+  model_trained_at TIMESTAMP
+);
+
+-- Dashboard queries filter by venue and time range (query_layer.py) and
+-- visitor lookups go by device
+CREATE INDEX wifi_logs_location_timestamp ON wifi_logs (location, "timestamp");
+CREATE INDEX wifi_logs_device_id ON wifi_logs (device_id);
@@ -0,0 +1,107 @@
+# --- segmentation.py ---
+# Out-of-core customer segmentation for venues too large to cluster in memory.
+# The venue is streamed from storage in chunks, three times:
+#   1. running StandardScaler statistics (partial_fit),
+#   2. MiniBatchKMeans updates on the scaled chunks (partial_fit),
+#   3. cluster profiles as streaming sums/counts plus a per-cluster sample
+#      for plotting.
+# Cluster labels for individual sessions are only computed on demand.
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_loader import iter_venue_frames
+from model_registry import get_registry
+
+# Venues with at least this many sessions are segmented out of core
+STREAMING_MIN_ROWS = int(os.environ.get("WIFI_STREAMING_SEGMENTATION_ROWS", "500000"))
+CHUNK_ROWS = 250_000
+SAMPLE_PER_CLUSTER = 1000
+
+
+class StreamingSegmentation:
+    """Fitted scaler + MiniBatchKMeans, with streamed profiles and a stratified sample."""
+
+    def __init__(self, features, n_clusters, random_state=42):
+        from sklearn.cluster import MiniBatchKMeans
+        from sklearn.preprocessing import StandardScaler
+
+        self.features = list(features)
+        self.n_clusters = n_clusters
+        self.scaler = StandardScaler()
+        self.kmeans = MiniBatchKMeans(
+            n_clusters=n_clusters, random_state=random_state, batch_size=4096, n_init=3
+        )
+        self.rng = np.random.default_rng(random_state)
+        self.profiles = None
+        self.sample = None
+
+    def _matrix(self, chunk):
+        return chunk[self.features].dropna().to_numpy(dtype="float64")
+
+    def fit(self, chunks):
+        """``chunks`` is a zero-argument callable returning a fresh chunk iterator."""
+        for chunk in chunks():
+            X = self._matrix(chunk)
+            if len(X):
+                self.scaler.partial_fit(X)
+        for chunk in chunks():
+            X = self._matrix(chunk)
+            # partial_fit needs at least n_clusters rows in its first batch
+            if len(X) >= self.n_clusters:
+                self.kmeans.partial_fit(self.scaler.transform(X))
+        return self
+
+    def assign(self, frame):
+        """Cluster labels for the rows of ``frame`` (NaN-feature rows dropped)."""
+        frame = frame.dropna(subset=self.features)
+        labels = self.kmeans.predict(self.scaler.transform(frame[self.features].to_numpy(dtype="float64")))
+        return frame.assign(Cluster=labels)
+
+    def summarize(self, chunks, sample_per_cluster=SAMPLE_PER_CLUSTER):
+        # Bottom-k by a random key per cluster == a uniform sample of each cluster
+        sums = np.zeros((self.n_clusters, len(self.features)))
+        counts = np.zeros(self.n_clusters, dtype="int64")
+        sample = None
+        for chunk in chunks():
+            labelled = self.assign(chunk[self.features])
+            if labelled.empty:
+                continue
+            labels = labelled["Cluster"].to_numpy()
+            counts += np.bincount(labels, minlength=self.n_clusters)
+            for i, feature in enumerate(self.features):
+                sums[:, i] += np.bincount(labels, weights=labelled[feature].to_numpy(dtype="float64"),
+                                          minlength=self.n_clusters)
+            labelled = labelled.assign(_key=self.rng.random(len(labelled)))
+            sample = labelled if sample is None else pd.concat([sample, labelled], ignore_index=True)
+            sample = sample.sort_values("_key").groupby("Cluster", sort=False).head(sample_per_cluster)
+        means = sums / np.maximum(counts, 1)[:, None]
+        self.profiles = pd.DataFrame(means, columns=self.features).rename_axis("Cluster")
+        self.profiles["sessions"] = counts
+        self.sample = (sample.drop(columns="_key").sort_values("Cluster", ignore_index=True)
+                       if sample is not None else pd.DataFrame(columns=self.features + ["Cluster"]))
+        return self
+
+
+def segment_venue(business_type, features, n_clusters, prepare, columns=None,
+                  chunk_rows=CHUNK_ROWS, data_fingerprint=None):
+    """Fit (or reuse) a streaming segmentation for a venue.
+
+    ``prepare`` turns a raw log chunk into one with the ``features`` columns
+    (e.g. ai_models.preprocess_data). ``data_fingerprint`` identifies the
+    venue's current data for the model registry.
+    """
+    def chunks():
+        for chunk in iter_venue_frames(business_type, columns=columns, chunk_rows=chunk_rows):
+            yield prepare(chunk)
+
+    def fit():
+        return StreamingSegmentation(features, n_clusters).fit(chunks).summarize(chunks)
+
+    if data_fingerprint is None:
+        return fit()
+    return get_registry().get_or_fit(
+        "minibatch_kmeans", business_type, data_fingerprint, features,
+        {"n_clusters": n_clusters, "batch_size": 4096, "chunk_rows": chunk_rows}, fit,
+    )
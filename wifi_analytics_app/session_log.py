@@ -0,0 +1,273 @@
+# --- session_log.py ---
+# Append-only writer for captive-portal sign-ins.
+# Streamlit runs every browser session as a thread in one process, so all
+# sign-ins go through a single background thread fed by a queue. It writes
+# rows in batches with one fsync per batch (group commit) into segment files
+#   connection_logs/sessions/<venue>/<YYYY-MM-DD>-<pid>-<seq>.csv
+# that rotate daily or at max_segment_bytes. Each segment carries the same
+# header as connection_logs/<venue>.csv, plus the guest's email and phone,
+# and data_loader and the rollups read the segments together with the
+# venue's own log (without email and phone).
+import atexit
+import csv
+import datetime
+import io
+import logging
+import os
+import queue
+import threading
+import time
+
+from metrics import track
+
+try:
+    import fcntl
+except ImportError:  # Windows: segment names are already per-process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Same column order as the files in connection_logs/
+SESSION_LOG_COLUMNS = [
+    "device_id", "timestamp", "duration_minutes", "business_type", "zone", "device_type",
+    "signal_strength_dBm", "data_used_MB", "session_duration_minutes", "peak_usage_hour",
+    "email", "phone",
+]
+
+SESSION_LOG_DIR = os.path.join(
+    os.environ.get("WIFI_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "connection_logs")),
+    "sessions",
+)
+
+
+def _slug(name):
+    return str(name).strip().lower().replace(" ", "_") or "unknown"
+
+
+class _Segment:
+    def __init__(self, path, day):
+        self.path = path
+        self.day = day
+        is_new = not os.path.exists(path)
+        self.file = open(path, "ab")
+        if fcntl is not None:
+            # Another process reusing our pid after a crash must not interleave
+            try:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self.file.close()
+                if is_new:
+                    os.remove(path)
+                raise
+        if is_new:
+            self.file.write(_csv_line(SESSION_LOG_COLUMNS))
+        self.size = self.file.tell()
+        self.rows = 0
+
+    def write(self, data, rows):
+        self.file.write(data)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.size = self.file.tell()
+        self.rows += rows
+
+    def close(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+    def abandon(self):
+        # After a failed write: drop the file without trusting it to sync
+        try:
+            self.file.close()
+        except OSError:
+            pass
+
+
+def _csv_line(values):
+    buf = io.StringIO()
+    csv.writer(buf).writerow(values)
+    return buf.getvalue().encode("utf-8")
+
+
+class _Control:
+    __slots__ = ("stop", "done")
+
+    def __init__(self, stop=False):
+        self.stop = stop
+        self.done = threading.Event()
+
+
+class SessionLogWriter:
+    """Queue-fed, single-threaded, group-committing session log writer.
+
+    ``log`` never touches the disk; it returns False only if ``max_pending``
+    rows are already waiting and ``timeout`` expires. A batch that fails to
+    write (e.g. a segment lock or a full disk) is retried with exponential
+    backoff on a fresh segment; after ``max_retries`` the rest is dropped
+    and counted in ``rows_failed``.
+    """
+
+    def __init__(self, directory=SESSION_LOG_DIR, max_segment_bytes=64 * 1024 * 1024,
+                 commit_interval=0.2, batch_max=1000, max_pending=50_000, max_retries=5, retry_backoff=0.2):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.commit_interval = commit_interval
+        self.batch_max = batch_max
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._segments = {}  # (location slug, day) -> open _Segment
+        self._seq = 0
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.retries = 0
+        self.commits = 0
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="session-log", daemon=True)
+                self._thread.start()
+        return self
+
+    def log(self, row, timeout=0.5):
+        row = dict(row)
+        row.setdefault("timestamp", datetime.datetime.now())
+        try:
+            self._queue.put(row, timeout=timeout)
+            return True
+        except queue.Full:
+            logger.warning("Session log queue full; dropping sign-in for %s", row.get("device_id"))
+            return False
+
+    def flush(self, timeout=None):
+        control = _Control()
+        self._queue.put(control)
+        return control.done.wait(timeout)
+
+    def close(self, timeout=None):
+        if self._thread is not None:
+            self._queue.put(_Control(stop=True))
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.commit_interval
+            # Group commit: gather whatever else arrives within commit_interval
+            while len(batch) < self.batch_max and not isinstance(batch[-1], _Control):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            control = batch.pop() if isinstance(batch[-1], _Control) else None
+            try:
+                with track("session_log_write") as t:
+                    t.rows = len(batch)
+                    self._commit_with_retry(batch)
+            except Exception:
+                logger.exception("Failed to write %d session log rows", len(batch))
+            if control is not None:
+                if control.stop:
+                    for segment in self._segments.values():
+                        segment.close()
+                    self._segments.clear()
+                    control.done.set()
+                    return
+                control.done.set()
+
+    def _segment_for(self, location, day):
+        segment = self._segments.get((location, day))
+        if segment is None:
+            # A new day retires yesterday's segment for this location
+            for key in [k for k in self._segments if k[0] == location and k[1] < day]:
+                self._segments.pop(key).close()
+            folder = os.path.join(self.directory, location)
+            os.makedirs(folder, exist_ok=True)
+            self._seq += 1
+            path = os.path.join(folder, f"{day}-{os.getpid()}-{self._seq:04d}.csv")
+            segment = self._segments[(location, day)] = _Segment(path, day)
+        return segment
+
+    def _group(self, rows):
+        # (location slug, day) -> encoded CSV lines, in arrival order
+        grouped = {}
+        for row in rows:
+            ts = row["timestamp"]
+            if isinstance(ts, datetime.datetime):
+                ts = ts.strftime("%Y-%m-%d %H:%M:%S")
+            key = (_slug(row.get("business_type")), str(ts)[:10])
+            grouped.setdefault(key, []).append(_csv_line(
+                ["" if row.get(col) is None else (ts if col == "timestamp" else row.get(col))
+                 for col in SESSION_LOG_COLUMNS]
+            ))
+        return grouped
+
+    def _commit_with_retry(self, rows):
+        if not rows:
+            return
+        pending = self._group(rows)
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._commit(pending)
+                break
+            except Exception as e:
+                left = sum(len(lines) for lines in pending.values())
+                if attempt == self.max_retries:
+                    self.rows_failed += left
+                    raise RuntimeError(f"dropped {left} rows after {attempt} retries") from e
+                self.retries += 1
+                logger.warning("Session log write failed (attempt %d), retrying %d rows: %s", attempt + 1, left, e)
+                time.sleep(self.retry_backoff * (2 ** attempt))
+        self.commits += 1
+
+    def _commit(self, pending):
+        """Write ``pending`` lines, removing each run of lines once it is synced to disk.
+
+        Lines are split across segments so none grows past max_segment_bytes
+        (a single line larger than that still gets a segment of its own).
+        """
+        for key in list(pending):
+            location, day = key
+            lines = pending[key]
+            while lines:
+                segment = self._segment_for(location, day)
+                room = self.max_segment_bytes - segment.size
+                take = size = 0
+                while take < len(lines) and (size + len(lines[take]) <= room or (take == 0 and segment.rows == 0)):
+                    size += len(lines[take])
+                    take += 1
+                if take == 0:
+                    # Full: rotate and carry on in a new segment
+                    self._segments.pop(key).close()
+                    continue
+                try:
+                    segment.write(b"".join(lines[:take]), take)
+                except Exception:
+                    # Possibly half-written; readers stop at its last complete line
+                    self._segments.pop(key).abandon()
+                    raise
+                del lines[:take]
+                self.rows_written += take
+            del pending[key]
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_session_log():
+    """Process-wide writer shared by every Streamlit session, drained at exit."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = SessionLogWriter().start()
+            atexit.register(_writer.close)
+        return _writer
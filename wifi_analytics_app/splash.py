@@ -1,6 +1,43 @@
 # --- splash.py ---
 import streamlit as st
 import datetime
+import threading
+import uuid
+
+from metrics import track
+from rule_engine import get_rule_engine
+from session_log import get_session_log
+
+# Venue dataset each store's sign-ins are logged under (and shown with on the dashboards)
+STORE_VENUES = {"Store 1": "Restaurant", "Store 2": "Business Cafe", "Store 3": "Boutique"}
+LOCATIONS = list(STORE_VENUES)
+
+_scoring_started = threading.Event()
+
+def start_live_scoring():
+    # Fit each store venue's anomaly model once per process, off the request thread,
+    # so the first disconnect doesn't wait on a bootstrap from the venue logs. Started
+    # on the first Connect or AI Insights view, not on every page load: it loads sklearn
+    if _scoring_started.is_set():
+        return
+    _scoring_started.set()
+
+    def warm():
+        from anomaly_service import get_anomaly_scorer
+
+        scorer = get_anomaly_scorer()
+        if scorer is not None:
+            scorer.warm(sorted(set(STORE_VENUES.values())))
+    threading.Thread(target=warm, name="anomaly-warm", daemon=True).start()
+
+def guess_device_type(user_agent):
+    # Same categories as the venue logs; watches rarely reach a captive portal
+    ua = (user_agent or "").lower()
+    if "ipad" in ua or "tablet" in ua or ("android" in ua and "mobile" not in ua):
+        return "Tablet"
+    if "mobi" in ua or "iphone" in ua:
+        return "Phone"
+    return "Laptop" if ua else "Unknown"
 
 def splash_page():
     st.title("📶 Welcome to Free WiFi")
@@ -8,11 +45,43 @@ def splash_page():
 
     email = st.text_input("Email")
     phone = st.text_input("Phone Number")
-    location = st.selectbox("Location", ["Store 1", "Store 2", "Store 3"])
+    location = st.selectbox("Location", LOCATIONS)
 
     if st.button("Connect"):
         st.success("You're now connected! Enjoy browsing.")
         st.session_state["connected"] = True
-        # Simulate data entry (in production: save to DB)
-        with open("connection_logs.csv", "a") as f:
-            f.write(f"{email},{phone},{location},{datetime.datetime.now()}\n")
+        # One id per browser session so repeat clicks count as the same device
+        device_id = st.session_state.setdefault("device_id", f"G{uuid.uuid4().hex[:10]}")
+        st.session_state["connected_at"] = datetime.datetime.now()
+        start_live_scoring()
+        with track("splash_connect", venue=location):
+            # Queued for the background session log writer (no file I/O on the click)
+            now = datetime.datetime.now()
+            get_session_log().log({
+                "device_id": device_id,
+                "timestamp": now,
+                "business_type": STORE_VENUES[location],
+                "device_type": guess_device_type(st.context.headers.get("User-Agent")),
+                "email": email,
+                "phone": phone,
+            })
+            # Automation rules fire on the rule engine's own thread
+            get_rule_engine().submit({"type": "connect", "device_id": device_id, "venue": location,
+                                      "email": email, "phone": phone})
+
+    if st.session_state.get("connected") and st.button("Disconnect"):
+        st.session_state["connected"] = False
+        st.info("You've been disconnected. See you next time!")
+        get_rule_engine().submit({"type": "disconnect", "device_id": st.session_state.get("device_id"),
+                                  "venue": location, "email": email, "phone": phone})
+        connected_at = st.session_state.pop("connected_at", None)
+        if connected_at is not None:
+            from anomaly_service import score_live_session
+
+            # The finished session goes to the live anomaly scorer (queued, scored on its thread)
+            score_live_session({
+                "device_id": st.session_state.get("device_id"),
+                "timestamp": connected_at,
+                "business_type": STORE_VENUES[location],
+                "session_duration_minutes": (datetime.datetime.now() - connected_at).total_seconds() / 60,
+            })
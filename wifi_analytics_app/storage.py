@@ -0,0 +1,307 @@
+# --- storage.py ---
+# Parquet storage for connection_logs/.
+# Every venue CSV is converted into a hive-partitioned dataset
+#   connection_logs/parquet/venue=<slug>/date=<YYYY-MM-DD>/part-*.parquet
+# so readers only touch the columns and days they ask for.
+#
+# Conversion happens on first access (and again whenever the CSV changes), or
+# up front with:  python storage.py convert [venue ...] [--force]
+import argparse
+import datetime
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+import uuid
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+except ImportError:  # pyarrow is optional, data_loader falls back to CSV
+    pa = None
+    ds = None
+
+from data_loader import (
+    CSV_DTYPES,
+    DATA_DIR,
+    file_signature,
+    iter_venue_csv,
+    list_venues,
+    venue_csv_path,
+    venue_slug,
+)
+
+CONVERT_CHUNK_ROWS = 1_000_000
+SOURCE_MARKER = "_source.json"
+
+_convert_lock = threading.Lock()
+
+
+def parquet_available():
+    return pa is not None
+
+
+def parquet_root(data_dir=None):
+    return os.path.join(data_dir or DATA_DIR, "parquet")
+
+
+def venue_parquet_dir(business_type, data_dir=None):
+    return os.path.join(parquet_root(data_dir), f"venue={venue_slug(business_type)}")
+
+
+def _partitioning():
+    return ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+
+
+def _read_marker(venue_dir):
+    try:
+        with open(os.path.join(venue_dir, SOURCE_MARKER)) as f:
+            return tuple(json.load(f)["signature"])
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _write_marker(venue_dir, signature):
+    with open(os.path.join(venue_dir, SOURCE_MARKER), "w") as f:
+        json.dump({"signature": list(signature), "converted_at": datetime.datetime.now().isoformat()}, f)
+
+
+def _to_arrow(chunk):
+    # Categories are written as plain strings (parquet dictionary-encodes them
+    # anyway) so chunks with different category sets share one schema.
+    chunk = chunk.copy()
+    for col, dtype in CSV_DTYPES.items():
+        if dtype == "category" and col in chunk.columns:
+            chunk[col] = chunk[col].astype("object")
+    if "timestamp" in chunk.columns:
+        chunk["date"] = chunk["timestamp"].dt.strftime("%Y-%m-%d").fillna("unknown")
+    else:
+        chunk["date"] = "unknown"
+    return pa.Table.from_pandas(chunk, preserve_index=False)
+
+
+def needs_conversion(business_type, data_dir=None):
+    csv_path = venue_csv_path(business_type, data_dir)
+    if not os.path.exists(csv_path):
+        return False
+    return _read_marker(venue_parquet_dir(business_type, data_dir)) != file_signature(csv_path)
+
+
+def convert_venue(business_type, data_dir=None, force=False):
+    """Convert a venue CSV to its partitioned parquet dataset.
+
+    The dataset is built in a scratch directory and swapped in at the end, so
+    readers never see a half-written venue. Returns True if a conversion ran.
+    """
+    if not parquet_available():
+        raise RuntimeError("pyarrow is not installed; run `pip install pyarrow` to enable parquet storage.")
+    csv_path = venue_csv_path(business_type, data_dir)
+    venue_dir = venue_parquet_dir(business_type, data_dir)
+    with _convert_lock:
+        if not force and not needs_conversion(business_type, data_dir):
+            return False
+        signature = file_signature(csv_path)
+        scratch_dir = f"{venue_dir}.tmp-{os.getpid()}"
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+        os.makedirs(scratch_dir)
+        for i, chunk in enumerate(iter_venue_csv(csv_path, CONVERT_CHUNK_ROWS)):
+            ds.write_dataset(
+                _to_arrow(chunk),
+                scratch_dir,
+                format="parquet",
+                partitioning=_partitioning(),
+                basename_template=f"part-{i}-{{i}}.parquet",
+                existing_data_behavior="overwrite_or_ignore",
+            )
+        _write_marker(scratch_dir, signature)
+        shutil.rmtree(venue_dir, ignore_errors=True)
+        os.replace(scratch_dir, venue_dir)
+        return True
+
+
+def venue_exists(business_type, data_dir=None):
+    return os.path.exists(venue_csv_path(business_type, data_dir)) or os.path.isdir(
+        venue_parquet_dir(business_type, data_dir)
+    )
+
+
+def venue_signature(business_type, data_dir=None):
+    """Cache signature for a venue: the CSV's if present, else the dataset marker."""
+    csv_path = venue_csv_path(business_type, data_dir)
+    if os.path.exists(csv_path):
+        return file_signature(csv_path)
+    marker = _read_marker(venue_parquet_dir(business_type, data_dir))
+    if marker is None:
+        raise FileNotFoundError(csv_path)
+    return marker
+
+
+def venue_dates(business_type, data_dir=None):
+    """Days present in the venue dataset, from partition names only (no file reads)."""
+    if needs_conversion(business_type, data_dir):
+        convert_venue(business_type, data_dir)
+    venue_dir = venue_parquet_dir(business_type, data_dir)
+    if not os.path.isdir(venue_dir):
+        return []
+    days = []
+    for name in os.listdir(venue_dir):
+        if name.startswith("date=") and name != "date=unknown":
+            try:
+                days.append(datetime.date.fromisoformat(name[5:]))
+            except ValueError:
+                continue
+    return sorted(days)
+
+
+def _time_filter(start, end):
+    # Partition pruning on the date directories, then an exact timestamp filter
+    expr = None
+    if start is not None:
+        start = pd.Timestamp(start)
+        expr = (ds.field("date") >= start.strftime("%Y-%m-%d")) & (
+            ds.field("timestamp") >= pa.scalar(start.value, type=pa.timestamp("ns"))
+        )
+    if end is not None:
+        end = pd.Timestamp(end)
+        cond = (ds.field("date") <= end.strftime("%Y-%m-%d")) & (
+            ds.field("timestamp") < pa.scalar(end.value, type=pa.timestamp("ns"))
+        )
+        expr = cond if expr is None else expr & cond
+    return expr
+
+
+def _open_dataset(business_type, columns, data_dir):
+    if needs_conversion(business_type, data_dir):
+        convert_venue(business_type, data_dir)
+    venue_dir = venue_parquet_dir(business_type, data_dir)
+    if not os.path.isdir(venue_dir):
+        raise FileNotFoundError(venue_csv_path(business_type, data_dir))
+    dataset = ds.dataset(venue_dir, format="parquet", partitioning=_partitioning())
+    available = [name for name in dataset.schema.names if name != "date"]
+    if columns is not None:
+        wanted = set(columns)
+        available = [name for name in available if name in wanted]
+    return dataset, available
+
+
+def _restore_dtypes(df):
+    for col, dtype in CSV_DTYPES.items():
+        if col in df.columns and dtype == "category":
+            df[col] = df[col].astype("category")
+    return df
+
+
+def read_venue(business_type, columns=None, start=None, end=None, data_dir=None):
+    """Read a venue from parquet, converting the CSV first if it is newer.
+
+    ``columns`` is the set of columns the caller would like; ones the dataset
+    does not have are skipped. ``start``/``end`` bound ``timestamp`` (end is
+    exclusive) and prune whole day partitions before any file is opened.
+    """
+    dataset, available = _open_dataset(business_type, columns, data_dir)
+    table = dataset.to_table(columns=available, filter=_time_filter(start, end))
+    return _restore_dtypes(table.to_pandas())
+
+
+def count_rows(business_type, data_dir=None):
+    """Rows in a venue dataset, from the parquet footers (no column data is read)."""
+    dataset, _ = _open_dataset(business_type, [], data_dir)
+    return dataset.count_rows()
+
+
+def head_venue(business_type, n=5, data_dir=None):
+    """First ``n`` rows of a venue dataset, reading only the fragments needed for them."""
+    dataset, available = _open_dataset(business_type, None, data_dir)
+    return _restore_dtypes(dataset.head(n, columns=available).to_pandas())
+
+
+def iter_venue(business_type, columns=None, batch_rows=500_000, data_dir=None):
+    """Stream a venue as frames of at most ``batch_rows`` rows, never holding it all."""
+    dataset, available = _open_dataset(business_type, columns, data_dir)
+    for batch in dataset.to_batches(columns=available, batch_size=batch_rows):
+        if batch.num_rows:
+            yield _restore_dtypes(batch.to_pandas())
+
+
+def _append_csv(csv_path, df):
+    if os.path.exists(csv_path):
+        with open(csv_path, newline="") as f:
+            header = f.readline().strip().split(",")
+        df = df.reindex(columns=header)
+    df.to_csv(csv_path, mode="a", header=not os.path.exists(csv_path), index=False,
+              date_format="%Y-%m-%d %H:%M:%S")
+
+
+def _append_parts(venue_dir, df):
+    table = _to_arrow(df)
+    if os.path.isdir(venue_dir):
+        # Match the existing fragments so the dataset keeps a single schema
+        existing = ds.dataset(venue_dir, format="parquet", partitioning=_partitioning()).schema
+        table = table.select([name for name in table.schema.names if name in existing.names])
+        table = table.cast(pa.schema([existing.field(name) for name in table.schema.names]))
+    ds.write_dataset(
+        table,
+        venue_dir,
+        format="parquet",
+        partitioning=_partitioning(),
+        basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+
+def append_frame(business_type, df, data_dir=None, create="csv"):
+    """Append rows to a venue without a full re-conversion.
+
+    A CSV-backed venue gets the rows appended to its CSV and, if its parquet
+    copy was current, the same rows as new part files with the marker moved
+    to the new CSV signature. A parquet-only venue just gets new part files.
+    ``create`` picks the backing store for a venue that does not exist yet.
+    """
+    if df.empty:
+        return 0
+    csv_path = venue_csv_path(business_type, data_dir)
+    venue_dir = venue_parquet_dir(business_type, data_dir)
+    with _convert_lock:
+        parquet_only = not os.path.exists(csv_path) and (os.path.isdir(venue_dir) or create == "parquet")
+        if parquet_only:
+            if not parquet_available():
+                raise RuntimeError("pyarrow is not installed; run `pip install pyarrow` to enable parquet storage.")
+            _append_parts(venue_dir, df)
+            _write_marker(venue_dir, (time.time_ns(), 0))
+            return len(df)
+        in_sync = (
+            parquet_available()
+            and os.path.exists(csv_path)
+            and _read_marker(venue_dir) == file_signature(csv_path)
+        )
+        _append_csv(csv_path, df)
+        if in_sync:
+            _append_parts(venue_dir, df)
+            _write_marker(venue_dir, file_signature(csv_path))
+    return len(df)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the parquet copy of connection_logs.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    convert = sub.add_parser("convert", help="Convert venue CSVs to partitioned parquet.")
+    convert.add_argument("venues", nargs="*", help="Venue names (default: every CSV in connection_logs)")
+    convert.add_argument("--force", action="store_true", help="Rebuild even if the CSV is unchanged.")
+    convert.add_argument("--data-dir", default=None)
+    args = parser.parse_args(argv)
+
+    if not parquet_available():
+        print("pyarrow is not installed; run `pip install pyarrow` first.", file=sys.stderr)
+        return 1
+    for venue in args.venues or list_venues(args.data_dir):
+        converted = convert_venue(venue, args.data_dir, force=args.force)
+        print(f"{venue}: {'converted' if converted else 'up to date'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,6 @@
+# The app is a flat directory of modules run from wifi_analytics_app/; make
+# them importable however pytest is invoked.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,91 @@
+import logging
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import anomaly_service
+from anomaly_service import AnomalyScorer, fit_venue_model
+from model_registry import ModelRegistry
+
+
+@pytest.fixture
+def no_logs(monkeypatch, tmp_path):
+    # No bundled history for any venue, and fits cached under tmp_path
+    registry = ModelRegistry(directory=str(tmp_path / "models"))
+    monkeypatch.setattr(anomaly_service, "get_registry", lambda: registry)
+
+    def missing(venue, columns=None):
+        raise FileNotFoundError(venue)
+
+    monkeypatch.setattr(anomaly_service, "load_venue_frame", missing)
+
+
+def _live_sessions(n, venue="Store 1", seed=0):
+    # What the splash page and the ingest writer send: no data used, no signal
+    rng = np.random.default_rng(seed)
+    start = datetime(2025, 6, 17, 8)
+    return [{"device_id": f"G{i}", "business_type": venue, "timestamp": start + timedelta(minutes=int(i)),
+             "session_duration_minutes": float(rng.gamma(4, 10))} for i in range(n)]
+
+
+def _wait_for(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def test_fit_uses_the_features_live_sessions_carry():
+    X = anomaly_service.session_features(_live_sessions(300))
+    model = fit_venue_model(X)
+    assert list(model.columns) == [0, 3]  # duration, hour of day
+    assert model.score(X).shape == (300,)
+    assert fit_venue_model(X[:50]) is None
+
+
+def test_duration_only_venue_gets_a_model_and_retrains(no_logs, caplog):
+    scorer = AnomalyScorer(history_rows=1000, retrain_interval=0, max_wait=0.01).start()
+    try:
+        with caplog.at_level(logging.ERROR, logger="anomaly_service"):
+            scorer.submit_many(_live_sessions(500))
+            assert scorer.flush(30)
+            _wait_for(lambda: "Store 1" in scorer.stats()["models"])
+            # Parked sessions are scored with the next batch; retrain_interval=0 refits on every batch
+            for seed in range(1, 4):
+                scorer.submit_many(_live_sessions(400, seed=seed))
+                assert scorer.flush(30)
+            _wait_for(lambda: scorer.stats()["fits"] >= 2)
+        stats = scorer.stats()
+        assert stats["waiting_for_model"] == 0
+        assert stats["scored"] == 500 + 3 * 400
+        assert not [r for r in caplog.records if r.levelno >= logging.ERROR]
+    finally:
+        scorer.close(10)
+
+
+def test_live_sessions_keep_full_model_retrainable(no_logs, monkeypatch):
+    # Bundled logs give every feature; once the window is all live sessions the refit still works
+    rng = np.random.default_rng(1)
+    logs = pd.DataFrame({
+        "timestamp": pd.date_range("2025-06-01", periods=300, freq="h"),
+        "session_duration_minutes": rng.gamma(4, 10, 300),
+        "data_used_MB": rng.gamma(2, 100, 300),
+        "signal_strength_dBm": rng.normal(-60, 8, 300),
+    })
+    monkeypatch.setattr(anomaly_service, "load_venue_frame", lambda venue, columns=None: logs)
+    scorer = AnomalyScorer(history_rows=1000, retrain_interval=3600, max_wait=0.01)
+    scorer.warm(["Restaurant"])
+    assert scorer._models["Restaurant"].columns is None
+    scorer.start()
+    try:
+        scorer.submit_many(_live_sessions(1000, venue="Restaurant"))
+        assert scorer.flush(30)
+        history = scorer._history("Restaurant").data()
+        assert not np.isnan(history).any()  # imputed with the model's medians
+        model = scorer._fit("Restaurant")
+        assert model is not None and model.columns is None and model.rows == 1000
+    finally:
+        scorer.close(10)
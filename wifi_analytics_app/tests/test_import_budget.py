@@ -0,0 +1,8 @@
+import import_budget
+
+
+def test_entry_paths_stay_within_their_import_budgets():
+    results = import_budget.check()
+    assert [r["path"] for r in results] == list(import_budget.BUDGETS)
+    failed = [r for r in results if not r["ok"]]
+    assert not failed, failed
@@ -0,0 +1,149 @@
+import sqlite3
+import threading
+from datetime import datetime
+
+import pytest
+
+import ingest
+from ingest import WIFI_LOG_COLUMNS, IngestWriter, create_pool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = create_pool(f"sqlite:///{tmp_path / 'wifi.db'}")
+    yield pool
+    pool.closeall()
+
+
+def _event(i):
+    return {"timestamp": datetime(2025, 6, 17, 12, 0, i % 60), "device_id": f"D{i}", "device_type": "Mobile",
+            "location": "Restaurant", "dwell_time": i}
+
+
+def _count(pool, table="wifi_logs"):
+    conn = pool.getconn()
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        pool.putconn(conn)
+
+
+def test_local_schemas_follow_schema_sql(pool):
+    conn = pool.getconn()
+    try:
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(wifi_logs)")]
+    finally:
+        pool.putconn(conn)
+    assert columns == ["id", *WIFI_LOG_COLUMNS]
+    assert "SERIAL" not in ingest.local_schema("sqlite")
+    assert "CREATE INDEX" not in ingest.local_schema("duckdb")
+
+
+def test_rows_are_committed_in_batches(pool):
+    writer = IngestWriter(pool, batch_size=100, flush_interval=60).start()
+    assert writer.write_many(_event(i) for i in range(250)) == 250
+    assert writer.flush(timeout=10)
+    stats = writer.stats()
+    writer.close()
+    assert _count(pool) == 250
+    # Two full batches, then the remainder on flush: one commit each
+    assert stats["flushes"] == 3
+    assert stats["rows_written"] == 250
+
+
+def test_full_queue_rejects_writes(pool):
+    writer = IngestWriter(pool, max_pending=5)  # not started, so nothing drains the queue
+    assert all(writer.write(_event(i), timeout=0) for i in range(5))
+    assert writer.write(_event(5), timeout=0) is False
+    assert writer.stats()["rows_rejected"] == 1
+    assert writer.stats()["pending"] == 5
+
+
+def test_failed_batch_is_retried(pool):
+    writer = IngestWriter(pool, batch_size=10, flush_interval=60, retry_backoff=0)
+    insert = writer._insert
+    calls = []
+
+    def flaky(conn, rows, table, columns):
+        calls.append(len(rows))
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        insert(conn, rows, table, columns)
+
+    writer._insert = flaky
+    writer.start()
+    writer.write_many(_event(i) for i in range(10))
+    assert writer.flush(timeout=10)
+    writer.close()
+    assert calls == [10, 10]
+    assert writer.stats()["retries"] == 1
+    assert writer.stats()["rows_failed"] == 0
+    assert _count(pool) == 10
+
+
+def test_batch_is_dropped_after_max_retries(pool):
+    writer = IngestWriter(pool, flush_interval=60, max_retries=2, retry_backoff=0)
+
+    def broken(conn, rows, table, columns):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    writer._insert = broken
+    writer.start()
+    writer.write_many(_event(i) for i in range(7))
+    assert writer.flush(timeout=10)
+    writer.close()
+    stats = writer.stats()
+    assert (stats["retries"], stats["rows_failed"], stats["rows_written"]) == (2, 7, 0)
+
+
+def test_close_drains_the_queue(pool):
+    writer = IngestWriter(pool, batch_size=1000, flush_interval=60).start()
+    writer.write_many(_event(i) for i in range(123))
+    writer.close(timeout=10)
+    assert _count(pool) == 123
+    assert writer.stats()["pending"] == 0
+
+
+def test_flush_without_writer_thread_drains_inline(pool):
+    writer = IngestWriter(pool, batch_size=50)
+    writer.write_many(_event(i) for i in range(120))
+    assert writer.flush(timeout=0)
+    assert _count(pool) == 120
+    assert writer.stats()["flushes"] == 3
+
+
+def test_other_tables(pool):
+    columns = ("detected_at", "device_id", "location", "score")
+    writer = IngestWriter(pool, table="anomaly_alerts", columns=columns)
+    writer.write({"device_id": "D1", "location": "Restaurant", "score": -0.2})
+    writer.flush()
+    conn = pool.getconn()
+    try:
+        row = conn.execute("SELECT detected_at, device_id, score FROM anomaly_alerts").fetchone()
+    finally:
+        pool.putconn(conn)
+    assert row[0] is not None and row[1:] == ("D1", -0.2)
+
+
+def test_enrich_runs_on_the_writer_thread(pool):
+    threads = []
+
+    def enrich(event):
+        threads.append(threading.current_thread().name)
+        if event["device_id"] == "D3":
+            raise RuntimeError("lookup failed")
+        return {**event, "returning": True}
+
+    writer = IngestWriter(pool, flush_interval=60, enrich=enrich).start()
+    writer.write_many(_event(i) for i in range(5))
+    assert threads == []  # write() only queued the events
+    assert writer.flush(timeout=10)
+    writer.close()
+    assert set(threads) == {"ingest-wifi_logs"}
+    assert writer.stats()["enrich_failed"] == 1
+    conn = pool.getconn()
+    try:
+        flags = [row[0] for row in conn.execute('SELECT "returning" FROM wifi_logs ORDER BY device_id')]
+    finally:
+        pool.putconn(conn)
+    assert flags == [1, 1, 1, None, 1]  # the failed event is still written, unflagged
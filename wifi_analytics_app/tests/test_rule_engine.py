@@ -0,0 +1,185 @@
+import json
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from rule_engine import ACTION_CONFIG, RuleEngine, RuleStore
+
+
+class _Hook(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append(body)
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        self.send_response(status)
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def webhook():
+    """Local HTTP endpoint; queue status codes in ``server.statuses`` (200 once they run out)."""
+    server = HTTPServer(("127.0.0.1", 0), _Hook)
+    server.requests, server.statuses = [], []
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/hook"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class _Smtp(socketserver.StreamRequestHandler):
+    # Just enough SMTP for smtplib.send_message
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.reply("220 localhost fake")
+        message = {"to": [], "data": []}
+        while True:
+            line = self.rfile.readline().decode().rstrip("\r\n")
+            verb = line[:4].upper()
+            if not line or verb == "QUIT":
+                self.reply("221 bye")
+                return
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 localhost")
+            elif verb == "RCPT":
+                message["to"].append(line.split(":", 1)[1].strip(" <>"))
+                self.reply("250 ok")
+            elif verb == "DATA":
+                self.reply("354 go ahead")
+                for data in iter(self.rfile.readline, b".\r\n"):
+                    message["data"].append(data.decode())
+                self.server.messages.append({"to": message["to"], "data": "".join(message["data"])})
+                message = {"to": [], "data": []}
+                self.reply("250 queued")
+            else:
+                self.reply("250 ok")
+
+
+@pytest.fixture
+def smtp_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _Smtp)
+    server.daemon_threads = True
+    server.messages = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return RuleStore(str(tmp_path / "rules.json"))
+
+
+def _engine(store, webhook=None, smtp=None, **kwargs):
+    config = dict(ACTION_CONFIG, webhook_url=webhook.url if webhook else None, timeout=5.0)
+    if smtp is not None:
+        config.update(smtp_host="127.0.0.1", smtp_port=smtp.server_address[1], smtp_starttls=False,
+                      smtp_user=None)
+    kwargs.setdefault("retry_backoff", 0.01)
+    return RuleEngine(store, config=config, tick=0.05, **kwargs).start()
+
+
+def _connect(engine, device, **extra):
+    engine.submit({"type": "connect", "device_id": device, "venue": "Restaurant", **extra})
+
+
+def test_rule_fires_once_per_device_within_the_dedupe_window(store, webhook):
+    store.add("On Connect", "Webhook Call", "Welcome {device_id} to {venue}")
+    engine = _engine(store, webhook)
+    try:
+        for device in ["G1", "G1", "G2", "G1"]:
+            _connect(engine, device)
+        assert engine.flush(10)
+        stats = engine.stats()
+    finally:
+        engine.close(5)
+    assert sorted(r["message"] for r in webhook.requests) == ["Welcome G1 to Restaurant",
+                                                               "Welcome G2 to Restaurant"]
+    assert (stats["sent"], stats["deduped"]) == (2, 2)
+
+
+def test_token_bucket_throttles_a_burst(store, webhook):
+    store.add("On Connect", "Webhook Call", "hi")
+    engine = _engine(store, webhook, rate_limits={"Webhook Call": 10.0})  # burst of 20
+    try:
+        started = time.monotonic()
+        for i in range(30):
+            _connect(engine, f"G{i}")
+        assert engine.flush(20)
+        elapsed = time.monotonic() - started
+        stats = engine.stats()
+    finally:
+        engine.close(5)
+    assert len(webhook.requests) == 30
+    # The 10 sends past the burst wait for tokens at 10/s
+    assert elapsed >= 0.8
+    assert stats["rate_limited"] >= 1
+
+
+def test_invalid_template_is_rejected_on_save_and_sent_raw(store, webhook):
+    with pytest.raises(ValueError):
+        store.add("On Connect", "Webhook Call", "Hi {0}")
+    store.add("On Connect", "Webhook Call", "Hi {device_id}")
+    rules = store.load()
+    rules[0]["content"] = "Hi {device_id"  # saved before validation, or edited by hand
+    store._write(rules)
+    engine = _engine(store, webhook)
+    try:
+        _connect(engine, "G1")
+        assert engine.flush(10)
+        stats = engine.stats()
+    finally:
+        engine.close(5)
+    assert [r["message"] for r in webhook.requests] == ["Hi {device_id"]
+    assert stats["sent"] == 1
+
+
+@pytest.mark.parametrize("statuses, requests, sent, retries", [
+    ([500, 503], 3, 1, 2),        # transient errors, then success
+    ([503] * 4, 4, 0, 3),         # gives up after max_retries
+    ([429], 2, 1, 1),             # rate limited: retried
+    ([404], 1, 0, 0),             # client error: not retried
+])
+def test_retries_and_gives_up(store, webhook, statuses, requests, sent, retries):
+    store.add("On Connect", "Webhook Call", "hi")
+    webhook.statuses.extend(statuses)
+    engine = _engine(store, webhook, max_retries=3)
+    try:
+        _connect(engine, "G1")
+        assert engine.flush(10)
+        stats = engine.stats()
+        recent = list(engine.recent)
+    finally:
+        engine.close(5)
+    assert len(webhook.requests) == requests
+    assert (stats["sent"], stats["failed"], stats["retries"]) == (sent, 1 - sent, retries)
+    assert recent[-1]["status"] == ("sent" if sent else "failed")
+
+
+def test_email_goes_to_the_guest(store, smtp_server):
+    store.add("On Disconnect", "Send Email", "Thanks for visiting {venue}")
+    store.add("On Disconnect", "Send Email", "Goodbye")  # second rule: no address, fails permanently
+    engine = _engine(store, smtp=smtp_server)
+    try:
+        engine.submit({"type": "disconnect", "device_id": "G1", "venue": "Restaurant",
+                       "email": "guest@example.com"})
+        engine.submit({"type": "disconnect", "device_id": "G2", "venue": "Restaurant"})
+        assert engine.flush(10)
+        stats = engine.stats()
+    finally:
+        engine.close(5)
+    assert sorted(m["to"][0] for m in smtp_server.messages) == ["guest@example.com"] * 2
+    assert any("Thanks for visiting Restaurant" in m["data"] for m in smtp_server.messages)
+    assert (stats["sent"], stats["failed"], stats["retries"]) == (2, 2, 0)
@@ -0,0 +1,40 @@
+import pandas as pd
+
+from data_loader import CONNECTION_LOG_COLUMNS
+from upload_pipeline import validate_chunk
+
+NOW = pd.Timestamp("2026-01-02 00:00:00")
+
+
+def _row(**overrides):
+    row = {
+        "device_id": "D1", "timestamp": "2026-01-01 10:00:00", "duration_minutes": "30",
+        "business_type": "Restaurant", "zone": "Main", "device_type": "Mobile",
+        "signal_strength_dBm": "-60", "data_used_MB": "12.5", "session_duration_minutes": "30",
+        "peak_usage_hour": "10",
+    }
+    row.update(overrides)
+    return row
+
+
+def test_rows_for_another_venue_are_rejected():
+    chunk = pd.DataFrame([
+        _row(device_id="D1"),
+        _row(device_id="D2", business_type=" restaurant "),
+        _row(device_id="D3", business_type=""),
+        _row(device_id="D4", business_type="Business Cafe"),
+    ])
+    frame, invalid, problems = validate_chunk(chunk, "Restaurant", now=NOW)
+    assert list(frame.columns) == CONNECTION_LOG_COLUMNS
+    assert list(frame["device_id"]) == ["D1", "D2", "D3"]
+    assert list(frame["business_type"]) == ["Restaurant", "restaurant", "Restaurant"]
+    assert invalid.tolist() == [False, False, False, True]
+    flagged = [(column, message) for mask, column, message in problems if mask.any()]
+    assert flagged == [("business_type", "not a Restaurant row")]
+
+
+def test_business_type_column_is_optional():
+    chunk = pd.DataFrame([_row()]).drop(columns="business_type")
+    frame, invalid, _ = validate_chunk(chunk, "Business Cafe", now=NOW)
+    assert not invalid.any()
+    assert list(frame["business_type"]) == ["Business Cafe"]
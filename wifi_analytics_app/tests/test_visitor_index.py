@@ -0,0 +1,32 @@
+import pandas as pd
+
+from visitor_index import VisitorIndex
+
+
+def _index(tmp_path):
+    index = VisitorIndex("Restaurant", data_dir=str(tmp_path))
+    index.add_rows(pd.DataFrame({
+        "device_id": [101, 101, 202],
+        "timestamp": pd.to_datetime(["2026-01-01 10:00", "2026-01-03 10:00", "2026-01-02 12:00"]),
+        "session_duration_minutes": [30.0, 45.0, 20.0],
+    }))
+    return index
+
+
+def test_ids_match_whatever_their_type_after_a_reload(tmp_path):
+    path = str(tmp_path / "visitors" / "restaurant.npz")
+    _index(tmp_path).save(path)
+    index = VisitorIndex.load(path, "Restaurant", data_dir=str(tmp_path))
+
+    for device in (101, "101"):
+        stats = index.lookup(device)
+        assert (stats["visits"], stats["sessions"], stats["dwell_total"]) == (2, 2, 75.0)
+    returning, frequent = index.session_flags([101, "202", 303], pd.to_datetime(["2026-01-04"] * 3))
+    assert returning.tolist() == [1, 1, 0]
+    assert frequent.tolist() == [1, 0, 0]
+
+    # A live session for an int id joins the stored device instead of adding a new one
+    _, was_returning = index.observe(202, "2026-01-05 09:00")
+    assert was_returning
+    assert len(index) == 2
+    assert index.lookup("202")["visits"] == 2
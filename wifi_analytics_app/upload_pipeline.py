@@ -0,0 +1,341 @@
+# --- upload_pipeline.py ---
+# Streaming validation and import of partner exports into a venue.
+# The file is read in chunks of raw strings, so memory stays bounded by the
+# chunk size however large the upload is. Every chunk is type- and
+# range-checked, and bad rows are reported with their line number in the
+# file. Rows already stored for the venue (same device_id + timestamp),
+# or repeated earlier in the file, are skipped; the stored keys are read one
+# day at a time, only for the days the file covers. The remaining rows are
+# appended through storage.append_frame; the rollups pick them up on their
+# next refresh.
+#
+#   python upload_pipeline.py Hospital partner_export.csv [--validate-only] [--errors errors.csv]
+import argparse
+import io
+import os
+import re
+import sys
+import time
+import warnings
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import storage
+from data_loader import CONNECTION_LOG_COLUMNS, session_segment_paths, venue_slug, venue_source
+
+CHUNK_ROWS = 100_000
+MAX_REPORTED_ERRORS = 1000
+MAX_DEDUPE_KEYS = 20_000_000  # 160 MB of uint64 keys
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+REQUIRED_COLUMNS = [
+    "device_id", "timestamp", "device_type", "signal_strength_dBm", "data_used_MB",
+    "session_duration_minutes", "peak_usage_hour",
+]
+
+# Inclusive bounds; optional columns are only checked when a value is given
+VALUE_RANGES = {
+    "session_duration_minutes": (0, 24 * 60),
+    "duration_minutes": (0, 24 * 60),
+    "signal_strength_dBm": (-120, 0),
+    "data_used_MB": (0, 100_000),
+    "peak_usage_hour": (0, 23),
+}
+OPTIONAL_COLUMNS = {"duration_minutes", "business_type", "zone"}
+INTEGER_COLUMNS = {"peak_usage_hour"}
+
+_BAD_LINE = re.compile(r"Skipping line (\d+): (.*)")
+
+
+def row_keys(device_id, timestamp):
+    """64-bit hashes of (device_id, timestamp to the second), for dedupe."""
+    frame = pd.DataFrame({
+        "device_id": device_id.astype(str).to_numpy(dtype=object),
+        "timestamp": timestamp.astype("datetime64[s]").astype("int64").to_numpy(),
+    })
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy()
+
+
+def row_days(timestamp):
+    """Day number (since the epoch) of each timestamp, to group keys by day."""
+    return timestamp.to_numpy(dtype="datetime64[ns]").astype("datetime64[D]").astype("int64")
+
+
+def _contains(sorted_keys, keys):
+    if not len(sorted_keys):
+        return np.zeros(len(keys), dtype=bool)
+    idx = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+    return sorted_keys[idx] == keys
+
+
+def _by_day(days):
+    # (day, positions) for each distinct day, in one sort
+    order = np.argsort(days, kind="stable")
+    bounds = np.flatnonzero(np.diff(days[order])) + 1
+    return [(int(days[group[0]]), group) for group in np.split(order, bounds) if len(group)]
+
+
+class KnownKeys:
+    """Dedupe keys of a venue's stored rows plus the rows accepted so far, by day.
+
+    A day's stored keys are read the first time the upload reaches that day
+    (parquet prunes to its partition), so memory follows the days the file
+    covers, not the venue's whole history. Past ``max_keys`` the least
+    recently used days are dropped and read again if the file comes back to
+    them; by then the store holds the rows imported from that day. A
+    validate-only run appends nothing, so its in-file duplicates can be
+    undercounted once the budget is exceeded.
+    """
+
+    def __init__(self, business_type, data_dir=None, max_keys=MAX_DEDUPE_KEYS):
+        self.business_type = business_type
+        self.data_dir = data_dir
+        self.max_keys = max_keys
+        self.stored = storage.venue_exists(business_type, data_dir) or bool(
+            session_segment_paths(business_type, data_dir))
+        self._days = OrderedDict()  # day -> sorted unique keys
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _load(self, days):
+        loaded = {day: np.empty(0, dtype="uint64") for day in days}
+        if self.stored:
+            start = pd.Timestamp(min(days), unit="D")
+            end = pd.Timestamp(max(days) + 1, unit="D")
+            _, _, loader = venue_source(self.business_type, ["device_id", "timestamp"], start, end, self.data_dir)
+            frame = loader()
+            if len(frame):
+                frame = frame[frame["timestamp"].notna()]
+                keys = row_keys(frame["device_id"], frame["timestamp"])
+                for day, group in _by_day(row_days(frame["timestamp"])):
+                    if day in loaded:
+                        loaded[day] = np.unique(keys[group])
+        for day, keys in loaded.items():
+            self._days[day] = keys
+            self._size += len(keys)
+
+    def contains(self, keys, days):
+        """Mask of ``keys`` already stored or accepted earlier in the upload."""
+        groups = _by_day(days)
+        missing = [day for day, _ in groups if day not in self._days]
+        if missing:
+            self._load(missing)
+        found = np.zeros(len(keys), dtype=bool)
+        for day, group in groups:
+            self._days.move_to_end(day)
+            found[group] = _contains(self._days[day], keys[group])
+        return found
+
+    def add(self, keys, days):
+        for day, group in _by_day(days):
+            before = self._days.get(day, np.empty(0, dtype="uint64"))
+            self._days[day] = np.union1d(before, keys[group])
+            self._size += len(self._days[day]) - len(before)
+        while self._size > self.max_keys and len(self._days) > 1:
+            _, dropped = self._days.popitem(last=False)
+            self._size -= len(dropped)
+
+
+def validate_chunk(chunk, business_type, now=None):
+    """Check a chunk of raw string rows.
+
+    Returns the typed valid rows (in connection_logs column order), the
+    invalid-row mask and a list of (mask, column, message) problems.
+    """
+    now = now or pd.Timestamp.now()
+    problems = []
+    device_id = chunk["device_id"].str.strip()
+    problems.append((device_id == "", "device_id", "missing device_id"))
+    device_type = chunk["device_type"].str.strip()
+    problems.append((device_type == "", "device_type", "missing device_type"))
+
+    raw_ts = chunk["timestamp"].str.strip()
+    # One explicit format: no per-chunk guessing, so 01/02 can't flip between chunks
+    timestamp = pd.to_datetime(raw_ts, format=TIMESTAMP_FORMAT, errors="coerce")
+    problems.append((timestamp.isna(), "timestamp", "not a valid timestamp (YYYY-MM-DD HH:MM:SS)"))
+    problems.append((timestamp > now + pd.Timedelta(days=1), "timestamp", "timestamp is in the future"))
+
+    numbers = {}
+    for column, (low, high) in VALUE_RANGES.items():
+        if column not in chunk.columns:
+            continue
+        raw = chunk[column].str.strip()
+        values = pd.to_numeric(raw, errors="coerce")
+        missing = raw == ""
+        if column in OPTIONAL_COLUMNS:
+            problems.append((values.isna() & ~missing, column, "not a number"))
+        else:
+            problems.append((values.isna(), column, "missing or not a number"))
+        problems.append(((values < low) | (values > high), column, f"outside [{low}, {high}]"))
+        if column in INTEGER_COLUMNS:
+            problems.append((values.notna() & (values % 1 != 0), column, "not a whole number"))
+        numbers[column] = values
+
+    venue_name = chunk["business_type"].str.strip() if "business_type" in chunk.columns else None
+    if venue_name is not None:
+        # Rows for another venue would otherwise be appended to this one
+        names = pd.Series(venue_name.unique())
+        other = set(names[(names != "") & (names.map(venue_slug) != venue_slug(business_type))])
+        problems.append((venue_name.isin(other), "business_type", f"not a {business_type} row"))
+
+    # A blank line is one error, not one per column
+    blank = (chunk == "").all(axis=1)
+    problems = [(mask & ~blank, column, message) for mask, column, message in problems]
+    problems.insert(0, (blank, None, "empty line"))
+    invalid = np.zeros(len(chunk), dtype=bool)
+    for mask, _, _ in problems:
+        invalid |= mask.to_numpy(dtype=bool, na_value=False)
+
+    valid = ~invalid
+    frame = pd.DataFrame({
+        "device_id": device_id[valid],
+        "timestamp": timestamp[valid],
+        "duration_minutes": numbers.get("duration_minutes", pd.Series(np.nan, index=chunk.index))[valid],
+        "business_type": (venue_name[valid].replace("", business_type) if venue_name is not None
+                          else business_type),
+        "zone": chunk["zone"].str.strip()[valid] if "zone" in chunk.columns else "",
+        "device_type": device_type[valid],
+        "signal_strength_dBm": numbers["signal_strength_dBm"][valid],
+        "data_used_MB": numbers["data_used_MB"][valid],
+        "session_duration_minutes": numbers["session_duration_minutes"][valid],
+        "peak_usage_hour": numbers["peak_usage_hour"][valid].astype("int64"),
+    }, columns=CONNECTION_LOG_COLUMNS)
+    return frame, invalid, problems
+
+
+def _new_report(business_type):
+    return {
+        "venue": business_type, "rows_read": 0, "rows_valid": 0, "rows_invalid": 0,
+        "malformed_lines": 0, "duplicates_existing": 0, "duplicates_in_file": 0,
+        "rows_appended": 0, "missing_columns": [], "ignored_columns": [], "errors": [],
+        "duration_sum": 0.0, "data_sum": 0.0, "seconds": 0.0, "bytes_read": 0,
+    }
+
+
+def _note_error(report, line, column, value, message):
+    if len(report["errors"]) < MAX_REPORTED_ERRORS:
+        report["errors"].append({"line": int(line), "column": column, "value": value, "error": message})
+
+
+def import_upload(business_type, source, data_dir=None, validate_only=False,
+                  chunk_rows=CHUNK_ROWS, on_progress=None):
+    """Validate ``source`` (a path or binary file object) and append its new rows.
+
+    ``on_progress(fraction, report)`` is called after every chunk. Returns the
+    report dict; ``errors`` holds at most MAX_REPORTED_ERRORS row errors
+    sorted by line, with 1-based line numbers counting the header.
+    """
+    started = time.perf_counter()
+    report = _new_report(business_type)
+    handle = open(source, "rb") if isinstance(source, (str, os.PathLike)) else source
+    try:
+        total = getattr(source, "size", None) or handle.seek(0, io.SEEK_END)
+        handle.seek(0)
+        known = KnownKeys(business_type, data_dir)
+        reader = pd.read_csv(handle, dtype=str, chunksize=chunk_rows, keep_default_na=False,
+                             skip_blank_lines=False, on_bad_lines="warn")
+        with reader:
+            next_line = 2  # line 1 is the header
+            columns = None
+            while True:
+                with warnings.catch_warnings(record=True) as caught:
+                    warnings.simplefilter("always", pd.errors.ParserWarning)
+                    try:
+                        chunk = next(reader)
+                    except StopIteration:
+                        break
+                if columns is None:
+                    chunk = chunk.rename(columns=lambda c: c.strip())
+                    if "duration" in chunk.columns and "session_duration_minutes" not in chunk.columns:
+                        chunk = chunk.rename(columns={"duration": "session_duration_minutes"})
+                    report["missing_columns"] = [c for c in REQUIRED_COLUMNS if c not in chunk.columns]
+                    report["ignored_columns"] = [c for c in chunk.columns if c not in CONNECTION_LOG_COLUMNS]
+                    if report["missing_columns"]:
+                        break
+                    columns = chunk.columns
+                chunk.columns = columns
+
+                bad = []
+                for w in caught:
+                    for match in _BAD_LINE.finditer(str(w.message)):
+                        bad.append(int(match.group(1)))
+                        _note_error(report, match.group(1), None, None, match.group(2).strip())
+                report["malformed_lines"] += len(bad)
+                # Physical line of each parsed row: consecutive, minus the skipped ones
+                lines = np.arange(next_line, next_line + len(chunk) + len(bad))
+                lines = lines[~np.isin(lines, bad)][:len(chunk)]
+                next_line = max([next_line - 1, *bad, *lines[-1:]]) + 1
+
+                valid, invalid, problems = validate_chunk(chunk, business_type)
+                for mask, column, message in problems:
+                    for i in np.flatnonzero(mask.to_numpy(dtype=bool, na_value=False)):
+                        if len(report["errors"]) >= MAX_REPORTED_ERRORS:
+                            break
+                        _note_error(report, lines[i], column,
+                                    chunk[column].iloc[i] if column else None, message)
+                report["rows_read"] += len(chunk)
+                report["rows_invalid"] += int(invalid.sum())
+                report["rows_valid"] += len(valid)
+
+                keys = row_keys(valid["device_id"], valid["timestamp"])
+                days = row_days(valid["timestamp"])
+                in_store = known.contains(keys, days)
+                repeated = pd.Series(keys).duplicated().to_numpy() & ~in_store
+                report["duplicates_existing"] += int(in_store.sum())
+                report["duplicates_in_file"] += int(repeated.sum())
+                fresh = ~(in_store | repeated)
+                new_rows = valid[fresh]
+                known.add(keys[fresh], days[fresh])
+                report["duration_sum"] += float(new_rows["session_duration_minutes"].sum())
+                report["data_sum"] += float(new_rows["data_used_MB"].sum())
+                if not validate_only and len(new_rows):
+                    report["rows_appended"] += storage.append_frame(business_type, new_rows, data_dir=data_dir)
+
+                report["bytes_read"] = handle.tell()
+                report["seconds"] = time.perf_counter() - started
+                if on_progress is not None:
+                    on_progress(min(report["bytes_read"] / total, 1.0) if total else 1.0, report)
+    finally:
+        if handle is not source:
+            handle.close()
+    if report["rows_appended"]:
+        from rollups import get_rollup
+
+        get_rollup(business_type, data_dir)
+    report["errors"].sort(key=lambda e: e["line"])
+    report["seconds"] = time.perf_counter() - started
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate a partner export and append it to a venue.")
+    parser.add_argument("venue")
+    parser.add_argument("path")
+    parser.add_argument("--validate-only", action="store_true")
+    parser.add_argument("--errors", default=None, help="Write the row errors to this CSV.")
+    parser.add_argument("--data-dir", default=None)
+    args = parser.parse_args(argv)
+
+    def progress(fraction, report):
+        print(f"\r{fraction:6.1%}  {report['rows_read']:,} rows", end="", file=sys.stderr)
+
+    report = import_upload(args.venue, args.path, data_dir=args.data_dir,
+                           validate_only=args.validate_only, on_progress=progress)
+    print(file=sys.stderr)
+    if report["missing_columns"]:
+        print(f"Missing required columns: {', '.join(report['missing_columns'])}", file=sys.stderr)
+        return 1
+    for key in ["rows_read", "rows_valid", "rows_invalid", "malformed_lines", "duplicates_existing",
+                "duplicates_in_file", "rows_appended", "seconds"]:
+        print(f"{key:<20} {report[key]:,.2f}" if key == "seconds" else f"{key:<20} {report[key]:,}")
+    if args.errors and report["errors"]:
+        pd.DataFrame(report["errors"]).to_csv(args.errors, index=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,364 @@
+# --- visitor_index.py ---
+# Per-device visit history for a venue: first and last seen, visits,
+# sessions, total dwell and the gaps between visits. Devices map to rows of
+# flat numpy arrays through a dict, so a lookup is O(1). The index is kept
+# up to date incrementally from the venue's log through the same watermark
+# as the dashboard rollups, and saved as a compressed .npz under
+# connection_logs/visitors/.
+#
+# Sessions of one device less than VISIT_GAP apart (reconnects, roaming
+# between access points) count as one visit.
+import atexit
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_loader import DATA_DIR, venue_slug
+from rollups import IncrementalVenueState
+
+VISIT_GAP = 4 * 3600  # seconds
+FREQUENT_VISITS = 2  # visits before a device counts as a frequent visitor
+CHURN_MIN_DAYS = 7  # never flag a device seen within this many days
+CHURN_GAP_FACTOR = 2.0  # returning devices: at risk after 2x their usual gap
+ONE_TIME_CHURN_DAYS = 30
+SHORT_SESSION_MINUTES = 20
+INDEX_VERSION = 2
+
+_ARRAYS = {
+    "first_seen": "int64", "last_seen": "int64",  # epoch seconds
+    "visits": "int32", "sessions": "int32",
+    "dwell_total": "float64",  # minutes
+    "gap_sum": "float64", "gap_max": "float64",  # seconds between visits
+}
+
+
+def visitor_dir(data_dir=None):
+    return os.path.join(data_dir or DATA_DIR, "visitors")
+
+
+def _device_keys(device_ids):
+    # Ids are saved as strings, so key on str() everywhere: an int id from
+    # the DB must find the same device after a reload
+    device_ids = np.asarray(device_ids, dtype=object)
+    if pd.api.types.infer_dtype(device_ids, skipna=False) == "string":
+        return device_ids  # the usual case (CSV ids); skips a copy
+    return device_ids.astype(str).astype(object)
+
+
+def _epoch_seconds(timestamps):
+    # NaT becomes int64 min, so it never looks like a later visit
+    return pd.Series(timestamps).to_numpy(dtype="datetime64[s]").astype("int64")
+
+
+class VisitorIndex(IncrementalVenueState):
+    """Per-device visit statistics for one venue."""
+
+    def __init__(self, business_type, data_dir=None, capacity=1024):
+        self._capacity = capacity
+        self.lock = threading.RLock()
+        super().__init__(business_type, data_dir)
+
+    def clear(self):
+        self.device_ids = []
+        self.slots = {}  # device_id -> row in the arrays
+        self._lookup_index = None
+        for name, dtype in _ARRAYS.items():
+            setattr(self, name, np.zeros(self._capacity, dtype=dtype))
+
+    def __len__(self):
+        return len(self.device_ids)
+
+    # -- updating -------------------------------------------------------
+
+    def _grow(self, needed):
+        capacity = len(self.visits)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in _ARRAYS:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _slots_for(self, device_ids, create=False):
+        # Vectorised dict lookup; unknown devices get -1 or a new slot
+        device_ids = _device_keys(device_ids)
+        index = self._lookup()
+        slots = index.get_indexer(device_ids)
+        if create and (slots < 0).any():
+            missing = pd.unique(device_ids[slots < 0])
+            self._grow(len(self.device_ids) + len(missing))
+            for device in missing:
+                self.slots[device] = len(self.device_ids)
+                self.device_ids.append(device)
+            self._lookup_index = None
+            slots = self._lookup().get_indexer(device_ids)
+        return slots
+
+    def _lookup(self):
+        if self._lookup_index is None:
+            self._lookup_index = pd.Index(self.device_ids, dtype=object)
+        return self._lookup_index
+
+    def add_rows(self, df):
+        """Fold a frame of log rows (device_id, timestamp, session duration) into the index."""
+        if df.empty:
+            return
+        if "session_duration_minutes" in df.columns:
+            dwell = df["session_duration_minutes"].to_numpy(dtype="float64", na_value=0.0)
+        elif "duration" in df.columns:
+            dwell = df["duration"].to_numpy(dtype="float64", na_value=0.0)
+        else:
+            dwell = np.zeros(len(df))
+        keep = (df["timestamp"].notna() & df["device_id"].notna()).to_numpy()
+        self.update(df["device_id"].to_numpy(dtype=object)[keep], df["timestamp"][keep], dwell[keep])
+
+    def update(self, device_ids, timestamps, dwell):
+        with self.lock:
+            if not len(device_ids):
+                return
+            ts = _epoch_seconds(timestamps)
+            codes = self._slots_for(device_ids, create=True)
+            order = np.lexsort((ts, codes))
+            codes, ts, dwell = codes[order], ts[order], np.asarray(dwell, dtype="float64")[order]
+
+            same = codes[1:] == codes[:-1]
+            diffs = np.diff(ts)
+            starts = np.flatnonzero(np.r_[True, ~same])
+            devices = codes[starts]
+            new_visit = np.r_[True, ~same | (diffs > VISIT_GAP)]
+            batch_visits = np.add.reduceat(new_visit.astype("int32"), starts)
+
+            # Gaps between visits inside this batch
+            gap_rows = same & (diffs > VISIT_GAP)
+            np.add.at(self.gap_sum, codes[1:][gap_rows], diffs[gap_rows])
+            np.maximum.at(self.gap_max, codes[1:][gap_rows], diffs[gap_rows])
+
+            # Join each device's first new session to what was already known
+            first = ts[starts]
+            seen = self.sessions[devices] > 0
+            since_last = first - self.last_seen[devices]
+            continues = seen & (np.abs(since_last) <= VISIT_GAP)
+            gap = seen & (since_last > VISIT_GAP)  # older, out-of-order rows add no gap
+            self.gap_sum[devices[gap]] += since_last[gap]
+            self.gap_max[devices[gap]] = np.maximum(self.gap_max[devices[gap]], since_last[gap])
+
+            self.visits[devices] += batch_visits - continues
+            self.sessions[devices] += np.diff(np.r_[starts, len(codes)]).astype("int32")
+            self.dwell_total[devices] += np.add.reduceat(dwell, starts)
+            self.first_seen[devices] = np.where(seen, np.minimum(self.first_seen[devices], first), first)
+            last = ts[np.r_[starts[1:], len(codes)] - 1]
+            self.last_seen[devices] = np.where(seen, np.maximum(self.last_seen[devices], last), last)
+            self.rows += len(codes)
+
+    def observe(self, device_id, timestamp, dwell=0.0):
+        """Record one live session; returns (first_seen, returning) for it. O(1)."""
+        ts = int(pd.Timestamp(timestamp).timestamp())
+        device_id = str(device_id)
+        with self.lock:
+            slot = self.slots.get(device_id)
+            if slot is None:
+                self._grow(len(self.device_ids) + 1)
+                slot = self.slots[device_id] = len(self.device_ids)
+                self.device_ids.append(device_id)
+                self._lookup_index = None
+                self.first_seen[slot] = self.last_seen[slot] = ts
+                self.visits[slot] = 1
+            else:
+                since_last = ts - self.last_seen[slot]
+                if since_last > VISIT_GAP:
+                    self.visits[slot] += 1
+                    self.gap_sum[slot] += since_last
+                    self.gap_max[slot] = max(self.gap_max[slot], since_last)
+                self.first_seen[slot] = min(self.first_seen[slot], ts)
+                self.last_seen[slot] = max(self.last_seen[slot], ts)
+            self.sessions[slot] += 1
+            self.dwell_total[slot] += dwell or 0.0
+            self.rows += 1
+            first_seen = int(self.first_seen[slot])
+        return pd.Timestamp(first_seen, unit="s").to_pydatetime(), ts - first_seen > VISIT_GAP
+
+    # -- reading --------------------------------------------------------
+
+    def lookup(self, device_id):
+        """Visit statistics for one device, or None if it was never seen."""
+        slot = self.slots.get(str(device_id))
+        if slot is None:
+            return None
+        return {
+            "first_seen": pd.Timestamp(int(self.first_seen[slot]), unit="s"),
+            "last_seen": pd.Timestamp(int(self.last_seen[slot]), unit="s"),
+            "visits": int(self.visits[slot]),
+            "sessions": int(self.sessions[slot]),
+            "dwell_total": float(self.dwell_total[slot]),
+            "mean_gap_days": float(self.gap_sum[slot] / (self.visits[slot] - 1) / 86400)
+            if self.visits[slot] > 1 else None,
+        }
+
+    def session_flags(self, device_ids, timestamps):
+        """Per session: returning (the device had an earlier visit) and frequent_visitor."""
+        with self.lock:
+            slots = self._slots_for(device_ids)
+            known = slots >= 0
+            first = np.where(known, self.first_seen[slots], np.iinfo("int64").max)
+            visits = np.where(known, self.visits[slots], 0)
+        returning = (_epoch_seconds(timestamps) - first) > VISIT_GAP
+        return returning.astype("int64"), (visits >= FREQUENT_VISITS).astype("int64")
+
+    def churn_features(self, as_of=None):
+        """One row per device with recency/frequency features and a churn_risk flag."""
+        with self.lock:
+            n = len(self.device_ids)
+            frame = pd.DataFrame({name: getattr(self, name)[:n].copy() for name in _ARRAYS},
+                                 index=pd.Index(self.device_ids, name="device_id", dtype=object))
+        as_of = int(pd.Timestamp(as_of).timestamp()) if as_of is not None else int(frame["last_seen"].max() if n else 0)
+        days_since = (as_of - frame["last_seen"]) / 86400
+        mean_gap = (frame["gap_sum"] / (frame["visits"] - 1).where(frame["visits"] > 1)) / 86400
+        avg_dwell = frame["dwell_total"] / frame["sessions"].clip(lower=1)
+        # Returning devices are late against their own rhythm; one-time devices
+        # are at risk if they had a short first session or never came back
+        late = days_since > np.maximum(CHURN_GAP_FACTOR * mean_gap.fillna(0), CHURN_MIN_DAYS)
+        one_time_risk = (avg_dwell < SHORT_SESSION_MINUTES) | (days_since > ONE_TIME_CHURN_DAYS)
+        churn_risk = np.where(frame["visits"] > 1, late, one_time_risk)
+        return pd.DataFrame({
+            "first_seen": pd.to_datetime(frame["first_seen"], unit="s"),
+            "last_seen": pd.to_datetime(frame["last_seen"], unit="s"),
+            "visits": frame["visits"],
+            "sessions": frame["sessions"],
+            "days_since_last_visit": days_since,
+            "mean_gap_days": mean_gap,
+            "avg_dwell_minutes": avg_dwell,
+            "churn_risk": churn_risk.astype("int64"),
+        })
+
+    # -- persistence ----------------------------------------------------
+
+    def save(self, path):
+        with self.lock:
+            n = len(self.device_ids)
+            arrays = {name: getattr(self, name)[:n] for name in _ARRAYS}
+            arrays["device_ids"] = np.array(self.device_ids, dtype=str)
+            arrays["watermark"] = np.array([
+                INDEX_VERSION, self.rows, -1 if self.offset is None else self.offset,
+            ], dtype="int64")
+            arrays["prefix_hash"] = np.array(self.prefix_hash or "")
+            arrays["header"] = np.array(self.header or [], dtype=str)
+            arrays["files"] = np.array(sorted(self.files), dtype=str)
+            segments = sorted(self.segments.items())
+            arrays["segment_paths"] = np.array([path for path, _ in segments], dtype=str)
+            arrays["segment_offsets"] = np.array([offset for _, (offset, _) in segments], dtype="int64")
+            arrays["segment_headers"] = np.array([",".join(header) for _, (_, header) in segments], dtype=str)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp-{os.getpid()}"
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, business_type, data_dir=None):
+        index = cls(business_type, data_dir)
+        try:
+            with np.load(path) as saved:
+                version, rows, offset = saved["watermark"].tolist()
+                if version != INDEX_VERSION:
+                    return index
+                device_ids = saved["device_ids"].tolist()
+                index._grow(max(len(device_ids), 1))
+                for name in _ARRAYS:
+                    getattr(index, name)[:len(device_ids)] = saved[name]
+                index.device_ids = device_ids
+                index.slots = {device: i for i, device in enumerate(device_ids)}
+                index.rows = rows
+                index.offset = None if offset < 0 else offset
+                index.prefix_hash = str(saved["prefix_hash"]) or None
+                index.header = saved["header"].tolist() or None
+                index.files = frozenset(saved["files"].tolist())
+                index.segments = {
+                    path: (offset, header.split(","))
+                    for path, offset, header in zip(saved["segment_paths"].tolist(), saved["segment_offsets"].tolist(),
+                                                    saved["segment_headers"].tolist())
+                }
+        except (OSError, KeyError, ValueError):
+            return cls(business_type, data_dir)
+        return index
+
+
+def index_for_frame(df, business_type=None, data_dir=None):
+    """The venue's shared index when the venue has logs, else one built from ``df`` alone."""
+    if business_type is not None:
+        try:
+            return get_visitor_index(business_type, data_dir)
+        except FileNotFoundError:
+            pass
+    index = VisitorIndex(business_type or "adhoc")
+    index.add_rows(df)
+    return index
+
+
+_indexes = {}
+_locks = {}
+_registry_lock = threading.Lock()
+
+
+def _index_path(business_type, data_dir, live=False):
+    return os.path.join(visitor_dir(data_dir), f"{'live-' if live else ''}{venue_slug(business_type)}.npz")
+
+
+def get_visitor_index(business_type, data_dir=None):
+    """Up-to-date visitor index for a venue's logs, shared across sessions in this process."""
+    key = (data_dir, venue_slug(business_type))
+    with _registry_lock:
+        lock = _locks.setdefault(key, threading.Lock())
+    with lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = VisitorIndex.load(_index_path(business_type, data_dir), business_type, data_dir)
+        if index.refresh():
+            index.save(_index_path(business_type, data_dir))
+        return index
+
+
+# Sessions arriving through ingest (wifi_logs) are a separate stream from the
+# venue files, so they get their own "live" indexes, saved periodically on a
+# background thread (compressing a large index would stall the ingest writer).
+LIVE_SAVE_EVERY = 10_000
+_live = {}
+_live_lock = threading.Lock()
+_live_save_lock = threading.Lock()  # one save at a time; they share tmp file names
+_live_observed = 0
+
+
+def _save_live():
+    with _live_save_lock:
+        with _live_lock:
+            indexes = list(_live.items())
+        for location, index in indexes:
+            index.save(_index_path(location, None, live=True))
+
+
+def annotate_event(event):
+    """Fill wifi_logs ``first_visit`` and ``returning`` from the live visitor index."""
+    global _live_observed
+    location = event.get("location") or "unknown"
+    with _live_lock:
+        index = _live.get(location)
+        if index is None:
+            if not _live:
+                atexit.register(_save_live)
+            index = _live[location] = VisitorIndex.load(_index_path(location, None, live=True), location)
+        _live_observed += 1
+        save = _live_observed % LIVE_SAVE_EVERY == 0
+    if event.get("device_id") is not None:
+        first_visit, returning = index.observe(event["device_id"], event.get("timestamp") or pd.Timestamp.now(),
+                                               event.get("dwell_time") or 0.0)
+        if event.get("first_visit") is None:
+            event["first_visit"] = first_visit
+        if event.get("returning") is None:
+            event["returning"] = returning
+    if save and not _live_save_lock.locked():
+        threading.Thread(target=_save_live, name="visitor-live-save", daemon=True).start()
+    return event